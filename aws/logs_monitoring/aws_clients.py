@@ -0,0 +1,59 @@
+# Unless explicitly stated otherwise all files in this repository are licensed
+# under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2021 Datadog, Inc.
+
+import json
+import threading
+
+_lock = threading.Lock()
+# {(kind, service name, region name, config): client or resource}
+_clients = {}
+
+
+def get_client(service_name, region_name=None, **config):
+    """Returns the boto3 client of a service, created on first use
+
+    Clients are shared by the whole forwarder and kept across warm
+    invocations. config holds botocore Config options, e.g.
+    retries={"mode": "standard"}.
+    """
+    return _get("client", service_name, region_name, config)
+
+
+def get_resource(service_name, region_name=None, **config):
+    """Returns the boto3 resource of a service, created on first use"""
+    return _get("resource", service_name, region_name, config)
+
+
+def _get(kind, service_name, region_name, config):
+    key = (kind, service_name, region_name, json.dumps(config, sort_keys=True))
+    client = _clients.get(key)
+    if client is None:
+        # boto3 sessions are not thread safe, clients and resources are
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _create(
+                    kind, service_name, region_name, config
+                )
+    return client
+
+
+def _create(kind, service_name, region_name, config):
+    # Importing boto3 takes a large part of a cold start, it is only
+    # imported once a client is needed
+    import boto3
+    from botocore.config import Config
+
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    # The default session, so that all clients share one botocore session,
+    # its credentials and loaded service models
+    session = boto3.DEFAULT_SESSION
+    create = session.client if kind == "client" else session.resource
+    return create(
+        service_name,
+        region_name=region_name,
+        config=Config(**config) if config else None,
+    )
@@ -1,13 +1,19 @@
 import json
 import logging
 import os
+from functools import cached_property
 from random import randint
 from time import time
+from uuid import uuid4
 
-import boto3
 from botocore.exceptions import ClientError
 
-from caching.common import get_last_modified_time
+from aws_clients import get_client, get_resource
+from caching.common import (
+    deserialize_tags_cache,
+    get_last_modified_time,
+    serialize_tags_cache,
+)
 from settings import (
     DD_S3_BUCKET_NAME,
     DD_S3_CACHE_DIRNAME,
@@ -20,6 +26,9 @@ JITTER_MIN = 1
 JITTER_MAX = 100
 DD_TAGS_CACHE_TTL_SECONDS = DD_TAGS_CACHE_TTL_SECONDS + randint(JITTER_MIN, JITTER_MAX)
 
+# Error codes S3 returns when a conditional write loses against another writer
+S3_CONDITIONAL_WRITE_ERROR_CODES = ("PreconditionFailed", "ConditionalRequestConflict")
+
 
 class BaseTagsCache(object):
     def __init__(
@@ -40,8 +49,19 @@ class BaseTagsCache(object):
         self.logger.setLevel(
             logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper())
         )
-        self.resource_tagging_client = boto3.client("resourcegroupstaggingapi")
-        self.s3_client = boto3.resource("s3")
+        # Owner token and ETag of the cache rebuild lease held by this forwarder
+        self.cache_lock_owner = None
+        self.cache_lock_etag = None
+        self.cache_lock_renewed_at = 0
+
+    # The clients are created on first use, forwarders not fetching tags never need them
+    @cached_property
+    def resource_tagging_client(self):
+        return get_client("resourcegroupstaggingapi")
+
+    @cached_property
+    def s3_client(self):
+        return get_resource("s3")
 
     def get_resources_paginator(self):
         return self.resource_tagging_client.get_paginator("get_resources")
@@ -53,55 +73,165 @@ class BaseTagsCache(object):
         return f"{self.cache_dirname}/{self.cache_prefix}_{self.cache_lock_filename}"
 
     def write_cache_to_s3(self, data):
-        """Writes tags cache to s3"""
+        """Writes tags cache to s3
+
+        The rebuild lease is renewed first, as a fence: if it expired and was
+        taken over by another forwarder, that forwarder owns the rebuild and
+        this write is skipped.
+        """
+        if not self.renew_s3_cache_lock(force=True):
+            self.logger.debug("S3 cache lock lost, not writing the rebuilt cache")
+            return
+
         try:
             self.logger.debug("Trying to write data to s3: {}".format(data))
             s3_object = self.s3_client.Object(
                 DD_S3_BUCKET_NAME, self.get_cache_name_with_prefix()
             )
-            s3_object.put(Body=(bytes(json.dumps(data).encode("UTF-8"))))
+            s3_object.put(Body=serialize_tags_cache(data))
         except ClientError as e:
             send_forwarder_internal_metrics("s3_cache_write_failure")
             self.logger.debug(f"Unable to write new cache to S3: {e}", exc_info=True)
 
     def acquire_s3_cache_lock(self):
-        """Acquire cache lock"""
+        """Acquire the cache rebuild lease
+
+        The lease is created with a conditional write (If-None-Match), so only
+        one forwarder can create it. An expired lease is taken over with a
+        write conditioned on its ETag (If-Match), so only one forwarder can
+        take it over either.
+        """
         cache_lock_object = self.s3_client.Object(
             DD_S3_BUCKET_NAME, self.get_cache_lock_with_prefix()
         )
+        owner = uuid4().hex
         try:
-            file_content = cache_lock_object.get()
+            etag = self._put_s3_cache_lock(cache_lock_object, owner, IfNoneMatch="*")
+        except ClientError as e:
+            if not self._is_conditional_write_conflict(e):
+                self.logger.debug(
+                    f"Unable to write S3 cache lock file: {e}", exc_info=True
+                )
+                return False
 
             # check lock file expiration
-            last_modified_unix_time = get_last_modified_time(file_content)
-            if last_modified_unix_time + DD_S3_CACHE_LOCK_TTL_SECONDS >= time():
+            lease, lease_etag = self._get_s3_cache_lock(cache_lock_object)
+            if lease is None or lease["expires_at"] >= time():
                 return False
-        except Exception as e:
-            self.logger.debug(f"Unable to get cache lock file: {e}")
 
-        # lock file doesn't exist, create file to acquire lock
+            try:
+                etag = self._put_s3_cache_lock(
+                    cache_lock_object, owner, IfMatch=lease_etag
+                )
+            except ClientError as e:
+                self.logger.debug(f"Unable to take over S3 cache lock: {e}")
+                return False
+
+        self.cache_lock_owner = owner
+        self.cache_lock_etag = etag
+        self.cache_lock_renewed_at = time()
+        send_forwarder_internal_metrics("s3_cache_lock_acquired")
+        self.logger.debug("S3 cache lock acquired")
+        return True
+
+    def renew_s3_cache_lock(self, force=False):
+        """Extend the rebuild lease held by this forwarder
+
+        Unless forced, the lease is only rewritten once half of it has elapsed,
+        so this can be called for every page of a rebuild.
+
+        Returns False when this forwarder does not hold the lease anymore.
+        """
+        if self.cache_lock_owner is None or self.cache_lock_etag is None:
+            return False
+
+        if (
+            not force
+            and time() - self.cache_lock_renewed_at < DD_S3_CACHE_LOCK_TTL_SECONDS / 2
+        ):
+            return True
+
+        cache_lock_object = self.s3_client.Object(
+            DD_S3_BUCKET_NAME, self.get_cache_lock_with_prefix()
+        )
         try:
-            cache_lock_object.put(Body=(bytes("lock".encode("UTF-8"))))
-            send_forwarder_internal_metrics("s3_cache_lock_acquired")
-            self.logger.debug("S3 cache lock acquired")
+            self.cache_lock_etag = self._put_s3_cache_lock(
+                cache_lock_object, self.cache_lock_owner, IfMatch=self.cache_lock_etag
+            )
         except ClientError as e:
-            self.logger.debug(f"Unable to write S3 cache lock file: {e}", exc_info=True)
+            send_forwarder_internal_metrics("s3_cache_lock_lost")
+            self.logger.debug(f"Unable to renew S3 cache lock: {e}")
+            self.cache_lock_owner = None
+            self.cache_lock_etag = None
             return False
 
+        self.cache_lock_renewed_at = time()
         return True
 
     def release_s3_cache_lock(self):
-        """Release cache lock"""
+        """Release cache lock, unless it was taken over by another forwarder
+
+        The delete is conditioned on the ETag of the lease read (If-Match), so
+        a lease taken over after it was read is not deleted.
+        """
+        if self.cache_lock_owner is None:
+            return
+
         try:
             cache_lock_object = self.s3_client.Object(
                 DD_S3_BUCKET_NAME, self.get_cache_lock_with_prefix()
             )
-            cache_lock_object.delete()
-            send_forwarder_internal_metrics("s3_cache_lock_released")
-            self.logger.debug("S3 cache lock released")
+            lease, lease_etag = self._get_s3_cache_lock(cache_lock_object)
+            if lease is not None and lease.get("owner") == self.cache_lock_owner:
+                cache_lock_object.delete(IfMatch=lease_etag)
+                send_forwarder_internal_metrics("s3_cache_lock_released")
+                self.logger.debug("S3 cache lock released")
         except ClientError as e:
+            if self._is_conditional_write_conflict(e):
+                self.logger.debug("S3 cache lock taken over, not releasing it")
+                return
             send_forwarder_internal_metrics("s3_cache_lock_release_failure")
             self.logger.debug(f"Unable to release S3 cache lock: {e}", exc_info=True)
+        finally:
+            self.cache_lock_owner = None
+            self.cache_lock_etag = None
+
+    def _put_s3_cache_lock(self, cache_lock_object, owner, **conditions):
+        """Write the lease and return its ETag"""
+        lease = {
+            "owner": owner,
+            "expires_at": time() + DD_S3_CACHE_LOCK_TTL_SECONDS,
+        }
+        response = cache_lock_object.put(
+            Body=(bytes(json.dumps(lease).encode("UTF-8"))), **conditions
+        )
+        return response.get("ETag")
+
+    def _get_s3_cache_lock(self, cache_lock_object):
+        """Read the lease and its ETag, returns None when there is no lease"""
+        try:
+            file_content = cache_lock_object.get()
+        except Exception as e:
+            self.logger.debug(f"Unable to get cache lock file: {e}")
+            return None, None
+
+        try:
+            lease = json.loads(file_content["Body"].read().decode("utf-8"))
+        except ValueError:
+            # lock files written by older forwarders only contain "lock"
+            last_modified_unix_time = get_last_modified_time(file_content)
+            lease = {
+                "owner": None,
+                "expires_at": last_modified_unix_time + DD_S3_CACHE_LOCK_TTL_SECONDS,
+            }
+
+        return lease, file_content.get("ETag")
+
+    @staticmethod
+    def _is_conditional_write_conflict(e):
+        return e.response.get("Error", {}).get("Code") in (
+            S3_CONDITIONAL_WRITE_ERROR_CODES
+        )
 
     def get_cache_from_s3(self):
         """Retrieves tags cache from s3 and returns the body along with
@@ -111,7 +241,7 @@ class BaseTagsCache(object):
         )
         try:
             file_content = cache_object.get()
-            tags_cache = json.loads(file_content["Body"].read().decode("utf-8"))
+            tags_cache, _ = deserialize_tags_cache(file_content["Body"].read())
             last_modified_unix_time = get_last_modified_time(file_content)
         except Exception as e:
             send_forwarder_internal_metrics("s3_cache_fetch_failure")
@@ -1,6 +1,23 @@
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 from caching.cloudwatch_log_group_cache import CloudwatchLogGroupTagsCache
 from caching.s3_tags_cache import S3TagsCache
-from caching.lambda_cache import LambdaTagsCache
+from caching.lambda_cache import LambdaTagsBundle, LambdaTagsCache
+from instrumentation import stage_timings
+from settings import (
+    DD_TAGS_CACHE_PREFETCH_MAX_WORKERS,
+    get_fetch_lambda_tags,
+    get_fetch_log_group_tags,
+)
+
+logger = logging.getLogger()
+logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
+
+# Max number of Lambda tags bundles kept across warm invocations
+LAMBDA_TAGS_BUNDLES_MAX_SIZE = 1024
 
 
 class CacheLayer:
@@ -8,6 +25,10 @@ class CacheLayer:
         self._cloudwatch_log_group_cache = CloudwatchLogGroupTagsCache(prefix)
         self._s3_tags_cache = S3TagsCache(prefix)
         self._lambda_cache = LambdaTagsCache(prefix)
+        # Least recently used first
+        self._lambda_tags_bundles = OrderedDict()
+        # Fetch time of the Lambda tags the bundles were built from
+        self._lambda_tags_fetch_time = None
 
     def get_cloudwatch_log_group_tags_cache(self):
         return self._cloudwatch_log_group_cache
@@ -17,3 +38,68 @@ class CacheLayer:
 
     def get_lambda_tags_cache(self):
         return self._lambda_cache
+
+    def get_lambda_tags_bundle(self, lambda_arn):
+        """Get the tags of a Lambda function, built once per ARN and refresh of the tags
+
+        The bundles are dropped whenever the Lambda tags cache refreshes, so they
+        are never older than the tags they were built from.
+
+        Args:
+            lambda_arn (str): the lowercased Lambda ARN
+
+        Returns:
+            LambdaTagsBundle
+        """
+        bundles = self._lambda_tags_bundles
+        bundle = bundles.get(lambda_arn)
+        if bundle is not None and not self._lambda_cache.needs_refresh():
+            bundles.move_to_end(lambda_arn)
+            return bundle
+
+        with stage_timings.stage("tags_cache"):
+            tags = self._lambda_cache.get(lambda_arn)
+        stage_timings.count("tags_cache", events=1)
+        if self._lambda_cache.last_tags_fetch_time != self._lambda_tags_fetch_time:
+            bundles.clear()
+            self._lambda_tags_fetch_time = self._lambda_cache.last_tags_fetch_time
+
+        bundle = bundles[lambda_arn] = LambdaTagsBundle(lambda_arn, tags)
+        bundles.move_to_end(lambda_arn)
+        if len(bundles) > LAMBDA_TAGS_BUNDLES_MAX_SIZE:
+            bundles.popitem(last=False)
+        return bundle
+
+    def prefetch(self, log_group_arns=(), lambda_arns=()):
+        """Resolve the tags of the resources seen in an invocation concurrently
+
+        Log group tags are looked up one log group at a time, while the Lambda
+        cache holds the tags of the whole account, so a single lookup is enough
+        to load it. Lookups are best effort: a failure here is retried
+        when the event is handled.
+        """
+        lookups = []
+        if get_fetch_log_group_tags():
+            lookups += [
+                (self._cloudwatch_log_group_cache, arn) for arn in set(log_group_arns)
+            ]
+        if get_fetch_lambda_tags() and lambda_arns:
+            lookups.append((self._lambda_cache, next(iter(lambda_arns))))
+
+        # Nothing to overlap, let the handlers look the tags up
+        if len(lookups) < 2:
+            return
+
+        stage_timings.count("tags_cache", events=len(lookups))
+        with stage_timings.stage("tags_cache"), ThreadPoolExecutor(
+            max_workers=min(DD_TAGS_CACHE_PREFETCH_MAX_WORKERS, len(lookups))
+        ) as executor:
+            futures = [executor.submit(cache.get, arn) for cache, arn in lookups]
+
+        for future in futures:
+            if e := future.exception():
+                logger.debug(f"Failed to prefetch tags: {e}")
+
+    def flush(self):
+        """Persist the cache updates made during the invocation"""
+        self._cloudwatch_log_group_cache.flush()
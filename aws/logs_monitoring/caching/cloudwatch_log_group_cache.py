@@ -1,17 +1,24 @@
-import json
 import logging
 import os
+import threading
+from functools import cached_property
+from hashlib import sha1
 from random import randint
 from time import time
 
-import boto3
-from botocore.config import Config
+from botocore.exceptions import ClientError
 
-from caching.common import sanitize_aws_tag_string
+from aws_clients import get_client
+from caching.common import (
+    deserialize_tags_cache,
+    sanitize_aws_tag_string,
+    serialize_tags_cache,
+)
 from settings import (
     DD_S3_BUCKET_NAME,
     DD_S3_CACHE_DIRNAME,
     DD_S3_LOG_GROUP_CACHE_DIRNAME,
+    DD_S3_LOG_GROUP_CACHE_SHARD_COUNT,
     DD_TAGS_CACHE_TTL_SECONDS,
     get_fetch_log_group_tags,
 )
@@ -27,18 +34,31 @@ class CloudwatchLogGroupTagsCache:
         self.cache_ttl_seconds = DD_TAGS_CACHE_TTL_SECONDS
         self.bucket_name = DD_S3_BUCKET_NAME
         self.cache_prefix = prefix
+        self.shard_count = max(1, DD_S3_LOG_GROUP_CACHE_SHARD_COUNT)
         self.tags_by_log_group = {}
-        # We need to use the standard retry mode for the Cloudwatch Logs client that defaults to 3 retries
-        self.cloudwatch_logs_client = boto3.client(
-            "logs", config=Config(retries={"mode": "standard"})
-        )
-        self.s3_client = boto3.client("s3")
+        # Shards already read from S3 during the current invocation
+        self.loaded_shards = set()
+        # Tags fetched from the API during the current invocation, keyed by shard,
+        # waiting to be merged into the S3 shard files by flush()
+        self.pending_writes = {}
+        # Lookups may run concurrently when tags are prefetched
+        self._lock = threading.Lock()
+        self._shard_locks = {}
 
         self.logger = logging.getLogger()
         self.logger.setLevel(
             logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper())
         )
 
+    @cached_property
+    def cloudwatch_logs_client(self):
+        # We need to use the standard retry mode for the Cloudwatch Logs client that defaults to 3 retries
+        return get_client("logs", retries={"mode": "standard"})
+
+    @cached_property
+    def s3_client(self):
+        return get_client("s3")
+
     def get(self, log_group_arn):
         """Get the tags for the Cloudwatch Log Group from the cache
 
@@ -61,6 +81,31 @@ class CloudwatchLogGroupTagsCache:
 
         return self._fetch_log_group_tags(log_group_arn)
 
+    def flush(self):
+        """Write the tags fetched during this invocation back to their S3 shards
+
+        Each dirty shard is re-read right before being written so entries added
+        by concurrent forwarders in the meantime are merged instead of lost.
+        """
+        pending_writes, self.pending_writes = self.pending_writes, {}
+        self.loaded_shards = set()
+
+        for shard_id, entries in pending_writes.items():
+            shard, _ = self._get_shard_from_cache(shard_id)
+            if shard is None:
+                # The shard could not be read, rebuild it from what is known locally
+                shard = {
+                    log_group_arn: entry
+                    for log_group_arn, entry in self.tags_by_log_group.items()
+                    if self._get_shard_id(log_group_arn) == shard_id
+                }
+            for log_group_arn, entry in entries.items():
+                current = shard.get(log_group_arn)
+                if current and current.get("last_modified", 0) > entry["last_modified"]:
+                    continue
+                shard[log_group_arn] = entry
+            self._write_shard_to_cache(shard_id, shard)
+
     def _should_fetch_tags(self):
         return get_fetch_log_group_tags()
 
@@ -73,36 +118,76 @@ class CloudwatchLogGroupTagsCache:
             send_forwarder_internal_metrics("loggroup_local_cache_hit")
             return log_group_tags_struct.get("tags", [])
 
-        # then, check cache file, update and return
-        cache_file_name = self._get_cache_file_name(log_group_arn)
-        log_group_tags, last_modified = self._get_log_group_tags_from_cache(
-            cache_file_name
-        )
-        if log_group_tags and not self._is_expired(last_modified):
-            self.tags_by_log_group[log_group_arn] = {
-                "tags": log_group_tags,
-                "last_modified": time(),
-            }
+        # then, load the shard holding this log group, once per invocation
+        shard_id = self._get_shard_id(log_group_arn)
+        self._load_shard(shard_id)
+        log_group_tags_struct = self.tags_by_log_group.get(log_group_arn, None)
+        if log_group_tags_struct and not self._is_expired(
+            log_group_tags_struct.get("last_modified", None)
+        ):
             send_forwarder_internal_metrics("loggroup_s3_cache_hit")
-            return log_group_tags
+            return log_group_tags_struct.get("tags", [])
 
         # finally, make an api call, update and return
         log_group_tags = self._get_log_group_tags(log_group_arn) or []
-        self._update_log_group_tags_cache(log_group_arn, log_group_tags)
-        self.tags_by_log_group[log_group_arn] = {
-            "tags": log_group_tags,
-            "last_modified": time(),
-        }
+        entry = {"tags": log_group_tags, "last_modified": int(time())}
+        with self._lock:
+            self.tags_by_log_group[log_group_arn] = entry
+            self.pending_writes.setdefault(shard_id, {})[log_group_arn] = entry
 
         return log_group_tags
 
-    def _get_log_group_tags_from_cache(self, cache_file_name):
+    def _load_shard(self, shard_id):
+        """Read a shard from S3 into the in-memory cache
+
+        A shard is read at most once per invocation, so a log group missing
+        from its shard does not cause another read.
+        """
+        with self._lock:
+            shard_lock = self._shard_locks.setdefault(shard_id, threading.Lock())
+
+        # Concurrent lookups of the same shard wait for the first one to load it
+        with shard_lock:
+            if shard_id in self.loaded_shards:
+                return
+
+            shard, _ = self._get_shard_from_cache(shard_id)
+            with self._lock:
+                for log_group_arn, entry in (shard or {}).items():
+                    current = self.tags_by_log_group.get(log_group_arn)
+                    if current and current.get("last_modified", 0) >= entry.get(
+                        "last_modified", 0
+                    ):
+                        continue
+                    self.tags_by_log_group[log_group_arn] = entry
+                self.loaded_shards.add(shard_id)
+
+    def _get_shard_from_cache(self, shard_id):
+        cache_file_name = self._get_shard_file_name(shard_id)
         try:
             response = self.s3_client.get_object(
                 Bucket=self.bucket_name, Key=cache_file_name
             )
-            tags_cache = json.loads(response.get("Body").read().decode("utf-8"))
+            tags_by_arn, last_modified_by_arn = deserialize_tags_cache(
+                response.get("Body").read()
+            )
+            shard = {
+                log_group_arn: {
+                    "tags": tags,
+                    "last_modified": last_modified_by_arn.get(log_group_arn, 0),
+                }
+                for log_group_arn, tags in tags_by_arn.items()
+            }
             last_modified_unix_time = int(response.get("LastModified").timestamp())
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                # The shard has not been written yet
+                return {}, -1
+            send_forwarder_internal_metrics("loggroup_cache_fetch_failure")
+            self.logger.error(
+                f"Failed to get log group tags from cache: {e}", exc_info=True
+            )
+            return None, -1
         except Exception as e:
             send_forwarder_internal_metrics("loggroup_cache_fetch_failure")
             self.logger.error(
@@ -110,15 +195,18 @@ class CloudwatchLogGroupTagsCache:
             )
             return None, -1
 
-        return tags_cache, last_modified_unix_time
+        return shard, last_modified_unix_time
 
-    def _update_log_group_tags_cache(self, log_group, tags):
-        cache_file_name = self._get_cache_file_name(log_group)
+    def _write_shard_to_cache(self, shard_id, shard):
+        cache_file_name = self._get_shard_file_name(shard_id)
         try:
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
                 Key=cache_file_name,
-                Body=(bytes(json.dumps(tags).encode("UTF-8"))),
+                Body=serialize_tags_cache(
+                    {arn: entry["tags"] for arn, entry in shard.items()},
+                    {arn: entry["last_modified"] for arn, entry in shard.items()},
+                ),
             )
         except Exception as e:
             send_forwarder_internal_metrics("loggroup_cache_write_failure")
@@ -136,9 +224,12 @@ class CloudwatchLogGroupTagsCache:
         )
         return time() > earliest_time_to_refetch_tags
 
-    def _get_cache_file_name(self, log_group_arn):
-        log_group_name = log_group_arn.replace("/", "_").replace(":", "_")
-        return f"{self._get_cache_file_prefix()}/{log_group_name}.json"
+    def _get_shard_id(self, log_group_arn):
+        digest = sha1(log_group_arn.encode("UTF-8")).hexdigest()
+        return int(digest, 16) % self.shard_count
+
+    def _get_shard_file_name(self, shard_id):
+        return f"{self._get_cache_file_prefix()}/shards/{shard_id:04d}.json"
 
     def _get_cache_file_prefix(self):
         return f"{self.cache_dirname}/{self.cache_prefix}"
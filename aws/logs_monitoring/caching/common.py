@@ -1,5 +1,7 @@
 import os
 import datetime
+import gzip
+import json
 import logging
 import re
 from collections import defaultdict
@@ -13,6 +15,9 @@ Sanitize = re.compile(r"[^%s]" % _other_chars, re.UNICODE).sub
 Dedupe = re.compile(r"_+", re.UNICODE).sub
 FixInit = re.compile(r"^[_\d]*", re.UNICODE).sub
 
+GZIP_MAGIC_NUMBER = b"\x1f\x8b"
+TAGS_CACHE_FORMAT_VERSION = 2
+
 
 def get_last_modified_time(s3_file):
     last_modified_str = s3_file["ResponseMetadata"]["HTTPHeaders"]["last-modified"]
@@ -23,6 +28,73 @@ def get_last_modified_time(s3_file):
     return last_modified_unix_time
 
 
+def serialize_tags_cache(tags_by_arn, last_modified_by_arn=None):
+    """Serializes a tags cache to its compact S3 representation
+
+    Tags repeat a lot across resources, so each distinct tag is stored once
+    in a string table and every ARN only keeps the indexes of its tags. The
+    resulting JSON document is gzip-compressed.
+
+    Args:
+        tags_by_arn (dict<str, str[]>): tag lists keyed by ARN
+        last_modified_by_arn (dict<str, int>): optional fetch time of each ARN's tags
+
+    Returns:
+        bytes: the gzip-compressed document
+    """
+    tag_indexes = {}
+    indexes_by_arn = {}
+    for arn, tags in tags_by_arn.items():
+        indexes_by_arn[arn] = [
+            tag_indexes.setdefault(tag, len(tag_indexes)) for tag in tags
+        ]
+
+    document = {
+        "version": TAGS_CACHE_FORMAT_VERSION,
+        "tags": list(tag_indexes),
+        "arns": indexes_by_arn,
+    }
+    if last_modified_by_arn is not None:
+        document["last_modified"] = last_modified_by_arn
+
+    return gzip.compress(
+        json.dumps(document, separators=(",", ":")).encode("UTF-8"), compresslevel=6
+    )
+
+
+def deserialize_tags_cache(body):
+    """Deserializes a tags cache written by serialize_tags_cache, or the plain
+    JSON written by older versions of the forwarder
+
+    Args:
+        body (bytes): the S3 object body
+
+    Returns:
+        tags_by_arn (dict<str, str[]>): tag lists keyed by ARN
+        last_modified_by_arn (dict<str, int>): fetch time of each ARN's tags, when stored
+    """
+    if body[:2] != GZIP_MAGIC_NUMBER:
+        legacy_cache = json.loads(body.decode("utf-8"))
+        tags_by_arn = {}
+        last_modified_by_arn = {}
+        for arn, value in legacy_cache.items():
+            # Log group cache shards store the fetch time along the tags
+            if isinstance(value, dict):
+                tags_by_arn[arn] = value.get("tags", [])
+                last_modified_by_arn[arn] = value.get("last_modified", 0)
+            else:
+                tags_by_arn[arn] = value
+        return tags_by_arn, last_modified_by_arn
+
+    document = json.loads(gzip.decompress(body).decode("utf-8"))
+    tags = document["tags"]
+    tags_by_arn = {
+        arn: [tags[index] for index in indexes]
+        for arn, indexes in document["arns"].items()
+    }
+    return tags_by_arn, document.get("last_modified", {})
+
+
 def parse_get_resources_response_for_tags_by_arn(get_resources_page):
     """Parses a page of GetResources response for the mapping from ARN to tags
 
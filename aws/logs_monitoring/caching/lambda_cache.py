@@ -2,6 +2,7 @@ from botocore.exceptions import ClientError
 
 from caching.base_tags_cache import BaseTagsCache
 from caching.common import parse_get_resources_response_for_tags_by_arn
+from enhanced_lambda_metrics import parse_lambda_tags_from_arn
 from settings import (
     DD_S3_LAMBDA_CACHE_FILENAME,
     DD_S3_LAMBDA_CACHE_LOCK_FILENAME,
@@ -20,6 +21,10 @@ class LambdaTagsCache(BaseTagsCache):
     def should_fetch_tags(self):
         return get_fetch_lambda_tags()
 
+    def needs_refresh(self):
+        """Returns whether the next get refreshes the tags"""
+        return self.should_fetch_tags() and self._is_expired()
+
     def build_tags_cache(self):
         """Makes API calls to GetResources to get the live tags of the account's Lambda functions
 
@@ -37,6 +42,10 @@ class LambdaTagsCache(BaseTagsCache):
                 ResourceTypeFilters=[GET_RESOURCES_LAMBDA_FILTER], ResourcesPerPage=100
             ):
                 send_forwarder_internal_metrics("get_resources_api_calls")
+                if not self.renew_s3_cache_lock():
+                    # Another forwarder owns the rebuild now, and writes the cache
+                    self.logger.debug("S3 cache lock lost, stopping the tags fetch")
+                    return False, tags_by_arn_cache
                 page_tags_by_arn = parse_get_resources_response_for_tags_by_arn(page)
                 tags_by_arn_cache.update(page_tags_by_arn)
                 tags_fetch_success = True
@@ -87,3 +96,47 @@ class LambdaTagsCache(BaseTagsCache):
             self._refresh()
 
         return self.tags_by_id.get(key, [])
+
+
+class LambdaTagsBundle:
+    """The tags of a Lambda function, derived from its ARN and its custom tags
+
+    Everything a Lambda log needs is computed once per ARN, so enriching a log
+    is a lookup instead of parsing the ARN and merging tag lists again.
+
+    Properties:
+        enriched_tags (str[]): deduped tags from the ARN and the custom tags
+        service (str): the custom service tag value, or the function name
+        has_env_tag (bool): whether one of the custom tags is env
+        tags_with_service (str): sorted tags including the service tag, comma-joined
+        tags_without_service (str): sorted tags without any service tag, comma-joined
+    """
+
+    def __init__(self, arn, custom_lambda_tags):
+        # Function name is the seventh piece of the ARN
+        function_name = arn.split(":")[6]
+        function_name_tag = f"functionname:{function_name}"
+
+        # Combine and dedup tags, keeping the order of the custom tags
+        self.enriched_tags = list(
+            dict.fromkeys(parse_lambda_tags_from_arn(arn) + custom_lambda_tags)
+        )
+
+        service_tag = next(
+            (tag for tag in self.enriched_tags if tag.startswith("service:")),
+            f"service:{function_name}",
+        )
+        self.service = service_tag.split(":")[1]
+        self.has_env_tag = any(tag.startswith("env:") for tag in self.enriched_tags)
+
+        # Keep order deterministic
+        self.tags_with_service = ",".join(
+            sorted({function_name_tag, service_tag, *self.enriched_tags})
+        )
+        self.tags_without_service = ",".join(
+            sorted(
+                {function_name_tag}.union(
+                    tag for tag in self.enriched_tags if not tag.startswith("service:")
+                )
+            )
+        )
@@ -36,6 +36,10 @@ class S3TagsCache(BaseTagsCache):
                 ResourceTypeFilters=[GET_RESOURCES_S3_FILTER], ResourcesPerPage=100
             ):
                 send_forwarder_internal_metrics("get_s3_resources_api_calls")
+                if not self.renew_s3_cache_lock():
+                    # Another forwarder owns the rebuild now, and writes the cache
+                    self.logger.debug("S3 cache lock lost, stopping the tags fetch")
+                    return False, tags_by_arn_cache
                 page_tags_by_arn = parse_get_resources_response_for_tags_by_arn(page)
                 tags_by_arn_cache.update(page_tags_by_arn)
                 tags_fetch_success = True
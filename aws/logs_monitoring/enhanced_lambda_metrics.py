@@ -7,7 +7,9 @@ import json
 import logging
 import os
 import re
-from time import time
+from functools import lru_cache
+
+from telemetry import DD_SUBMIT_ENHANCED_METRICS, submit_distribution_point
 
 ENHANCED_METRICS_NAMESPACE_PREFIX = "aws.lambda.enhanced"
 
@@ -54,6 +56,9 @@ OUT_OF_MEMORY_ERROR_STRINGS = [
     "failed to allocate memory (NoMemoryError)",  # Ruby
 ]
 
+# Every out of memory error string contains one of these
+OUT_OF_MEMORY_MARKERS = ("memory", "Memory")
+
 METRICS_TO_PARSE_FROM_REPORT = [
     DURATION_METRIC_NAME,
     BILLED_DURATION_METRIC_NAME,
@@ -84,16 +89,11 @@ METRIC_ADJUSTMENT_FACTORS = {
 logger = logging.getLogger()
 logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
 
-try:
-    from datadog_lambda.metric import lambda_metric
-
-    DD_SUBMIT_ENHANCED_METRICS = True
-except ImportError:
+if not DD_SUBMIT_ENHANCED_METRICS:
     logger.debug(
         "Could not import from the Datadog Lambda layer so enhanced metrics won't be submitted. "
         "Add the Datadog Lambda layer to this function to submit enhanced metrics."
     )
-    DD_SUBMIT_ENHANCED_METRICS = False
 
 
 class DatadogMetricPoint(object):
@@ -127,17 +127,6 @@ class DatadogMetricPoint(object):
         """
         self.timestamp = timestamp
 
-    def submit_to_dd(self):
-        """Submit this metric to the Datadog API"""
-        timestamp = self.timestamp
-        if not timestamp:
-            timestamp = time()
-
-        logger.debug(
-            "Submitting metric {} {} {}".format(self.name, self.value, self.tags)
-        )
-        lambda_metric(self.name, self.value, timestamp=timestamp, tags=self.tags)
-
 
 def get_last_modified_time(s3_file):
     last_modified_str = s3_file["ResponseMetadata"]["HTTPHeaders"]["last-modified"]
@@ -148,35 +137,25 @@ def get_last_modified_time(s3_file):
     return last_modified_unix_time
 
 
-def parse_and_submit_enhanced_metrics(logs, cache_layer):
-    """Parses enhanced metrics from logs and submits them to DD with tags
+class EnhancedMetricsTap(object):
+    """Generates enhanced metrics from the logs while they are split from the other events
 
-    Args:
-        logs (dict<str, str | dict | int>[]): the logs parsed from the event in the split method
-            See docstring below for an example.
+    The metrics are derived from each log as it goes by, instead of in a
+    second pass over all the logs, with the tags the cache layer already
+    derived for its function during enrichment. The points are kept, and
+    submitted on flush.
     """
-    # If the Lambda layer is not present we can't submit enhanced metrics
-    if not DD_SUBMIT_ENHANCED_METRICS:
-        return
-
-    for log in logs:
-        try:
-            enhanced_metrics = generate_enhanced_lambda_metrics(
-                log, cache_layer.get_lambda_tags_cache()
-            )
-            for enhanced_metric in enhanced_metrics:
-                enhanced_metric.submit_to_dd()
-        except Exception as e:
-            logger.error(
-                f"Encountered an error while trying to parse and submit enhanced metrics for log {log}: {e}",
-            )
 
+    def __init__(self, cache_layer):
+        self._cache_layer = cache_layer
+        # [(name, value, timestamp, tags)]
+        self._points = []
 
-def generate_enhanced_lambda_metrics(log, tags_cache):
-    """Parses a Lambda log for enhanced Lambda metrics and tags
+    def __call__(self, log, json_message=None):
+        """Generate the enhanced metrics of a log
 
-    Args:
-        log (dict<str, str | dict | int>): a log parsed from the event in the split method
+        Args:
+            log (dict<str, str | dict | int>): a log parsed from the event in the split method
             Ex: {
                     "id": "34988208851106313984209006125707332605649155257376768001",
                     "timestamp": 1568925546641,
@@ -199,49 +178,89 @@ def generate_enhanced_lambda_metrics(log, tags_cache):
                     "service": "function_log_generator",
                     "host": "arn:aws:lambda:us-east-1:172597598159:function:function_log_generator"
                 }
-        tags_cache (LambdaTagsCache): used to apply the Lambda's custom tags to the metrics
-
-    Returns:
-        DatadogMetricPoint[], where each metric has all of its tags
-    """
-    # Note: this arn attribute is always lowercased when it's created
-    log_function_arn = log.get("lambda", {}).get("arn")
-    log_message = log.get("message")
-    timestamp = log.get("timestamp")
-
-    is_lambda_log = all((log_function_arn, log_message, timestamp))
-    if not is_lambda_log:
-        return []
-
-    # Check if its Lambda lifecycle log that is emitted if log format is set to JSON
-    parsed_metrics = parse_metrics_from_json_report_log(log_message)
-
-    # Check if this is a REPORT log
-    if not parsed_metrics:
-        parsed_metrics = parse_metrics_from_report_log(log_message)
+            json_message: the message of the log decoded from JSON, if it was
+        """
+        # If the Lambda layer is not present we can't submit enhanced metrics
+        if not DD_SUBMIT_ENHANCED_METRICS:
+            return
 
-    # Check if this is a timeout
-    if not parsed_metrics:
-        parsed_metrics = create_timeout_enhanced_metric(log_message)
+        log_function_arn = log.get("lambda", {}).get("arn")
+        log_message = log.get("message")
+        timestamp = log.get("timestamp")
+        if not all((log_function_arn, log_message, timestamp)):
+            return
 
-    # Check if this is an out of memory error
-    if not parsed_metrics:
-        parsed_metrics = create_out_of_memory_enhanced_metric(log_message)
+        try:
+            parsed_metrics = parse_enhanced_metrics(log_message, json_message)
+            if not parsed_metrics:
+                return
+
+            function_tags = self._cache_layer.get_lambda_tags_bundle(
+                log_function_arn
+            ).enriched_tags
+            for parsed_metric in parsed_metrics:
+                # Submit the metric with the timestamp of the log event, which
+                # is in milliseconds
+                self._points.append(
+                    (
+                        parsed_metric.name,
+                        float(parsed_metric.value),
+                        int(timestamp) // 1000,
+                        parsed_metric.tags + function_tags,
+                    )
+                )
+        except Exception as e:
+            logger.error(
+                f"Encountered an error while trying to parse enhanced metrics for log {log}: {e}",
+            )
 
-    # If none of the above, move on
-    if not parsed_metrics:
-        return []
+    def flush(self):
+        """Submit the enhanced metrics of the logs seen since the last flush"""
+        points, self._points = self._points, []
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Submitting {len(points)} enhanced metric points")
+        for name, value, timestamp, tags in points:
+            submit_distribution_point(name, value, timestamp, tags)
 
-    # Add the tags from ARN, custom tags cache, and env var
-    tags_from_arn = parse_lambda_tags_from_arn(log_function_arn)
-    lambda_custom_tags = tags_cache.get(log_function_arn)
 
-    for parsed_metric in parsed_metrics:
-        parsed_metric.add_tags(tags_from_arn + lambda_custom_tags)
-        # Submit the metric with the timestamp of the log event
-        parsed_metric.set_timestamp(int(timestamp))
+def parse_enhanced_metrics(log_message, json_message=None):
+    """Returns the metrics found in a log message, without the function tags
 
-    return parsed_metrics
+    Args:
+        log_message (str): the message of a Lambda log
+        json_message: the message already decoded from JSON, if it was
+    """
+    for parse_metrics in get_candidate_metric_parsers(log_message):
+        if (
+            parse_metrics is parse_metrics_from_json_report_log
+            and json_message is not None
+        ):
+            parsed_metrics = parse_metrics_from_json_report(json_message)
+        else:
+            parsed_metrics = parse_metrics(log_message)
+        if parsed_metrics:
+            return parsed_metrics
+    return []
+
+
+def get_candidate_metric_parsers(log_message):
+    """Returns the parsers which may find metrics in a log, in the order to try them
+
+    Almost no log is a REPORT, timeout or out of memory log. Each parser is
+    only a candidate when the log contains a marker its match requires, which
+    costs a few substring searches instead of a JSON parse and regex searches.
+    """
+    parsers = []
+    # Lambda lifecycle log that is emitted if log format is set to JSON
+    if "platform.report" in log_message:
+        parsers.append(parse_metrics_from_json_report_log)
+    if "REPORT" in log_message:
+        parsers.append(parse_metrics_from_report_log)
+    if "timed" in log_message:
+        parsers.append(create_timeout_enhanced_metric)
+    if any(marker in log_message for marker in OUT_OF_MEMORY_MARKERS):
+        parsers.append(create_out_of_memory_enhanced_metric)
+    return parsers
 
 
 def parse_lambda_tags_from_arn(arn):
@@ -251,6 +270,13 @@ def parse_lambda_tags_from_arn(arn):
         arn (str): Lambda ARN.
             ex: arn:aws:lambda:us-east-1:172597598159:function:my-lambda[:optional-version]
     """
+    return list(_parse_lambda_tags_from_arn(arn))
+
+
+# Logs and metrics of a batch mostly come from the same few functions,
+# so only parse each ARN once
+@lru_cache(maxsize=1024)
+def _parse_lambda_tags_from_arn(arn):
     # Cap the number of times to split
     split_arn = arn.split(":")
 
@@ -260,12 +286,12 @@ def parse_lambda_tags_from_arn(arn):
 
     _, _, _, region, account_id, _, function_name = split_arn
 
-    return [
+    return (
         "region:{}".format(region),
         # Include the aws_account tag to match the aws.lambda CloudWatch metrics
         "aws_account:{}".format(account_id),
         "functionname:{}".format(function_name),
-    ]
+    )
 
 
 def parse_metrics_from_json_report_log(log_message):
@@ -274,6 +300,11 @@ def parse_metrics_from_json_report_log(log_message):
     except json.JSONDecodeError:
         return []
 
+    return parse_metrics_from_json_report(body)
+
+
+def parse_metrics_from_json_report(body):
+    """Parses metrics from a Lambda lifecycle log already decoded from JSON"""
     if not isinstance(body, dict):
         return []
 
@@ -7,7 +7,11 @@
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, perf_counter
 
+from instrumentation import stage_timings
+from logs.circuit_breaker import CircuitBreaker
 from logs.datadog_batcher import DatadogBatcher
 from logs.datadog_client import DatadogClient
 from logs.datadog_http_client import DatadogHTTPClient
@@ -19,26 +23,36 @@ from retry.enums import RetryPrefix
 from settings import (
     DD_API_KEY,
     DD_FORWARD_LOG,
+    DD_INTAKE_CIRCUIT_BREAKER_COOLDOWN_SECONDS,
+    DD_INTAKE_CIRCUIT_BREAKER_THRESHOLD,
+    DD_INTAKE_MAX_SEND_ATTEMPTS,
     DD_NO_SSL,
     DD_PORT,
+    DD_RETRY_MAX_PAYLOADS_PER_INVOCATION,
     DD_SKIP_SSL_VALIDATION,
     DD_STORE_FAILED_EVENTS,
+    DD_TRACE_CHUNK_BYTES,
     DD_TRACE_INTAKE_URL,
+    DD_TRACE_MAX_WORKERS,
     DD_URL,
     EXCLUDE_AT_MATCH,
     INCLUDE_AT_MATCH,
     SCRUBBING_RULE_CONFIGS,
 )
-from telemetry import send_event_metric, send_log_metric
-from trace_forwarder.connection import TraceConnection
+from telemetry import send_event_metric, send_log_metrics
+from trace_forwarder import create_trace_connection
 
 logger = logging.getLogger()
 logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
 
+# Metrics come first as they are rejected once too old, logs are the bulk of
+# the backlog and come last
+RETRY_ORDER = (RetryPrefix.METRICS, RetryPrefix.TRACES, RetryPrefix.LOGS)
+
 
 class Forwarder:
     def __init__(self, function_prefix):
-        self.trace_connection = TraceConnection(
+        self.trace_connection = create_trace_connection(
             DD_TRACE_INTAKE_URL, DD_API_KEY, DD_SKIP_SSL_VALIDATION
         )
         self.storage = create_storage(function_prefix)
@@ -51,45 +65,98 @@ class Forwarder:
             max_batch_size_bytes=4 * 1000 * 1000,
             max_items_count=400,
         )
+        # Shared by all the batches, and by warm invocations
+        self._intake_breaker = CircuitBreaker(
+            DD_INTAKE_CIRCUIT_BREAKER_THRESHOLD,
+            DD_INTAKE_CIRCUIT_BREAKER_COOLDOWN_SECONDS,
+        )
 
     def forward(self, logs, metrics, traces):
         """
         Forward logs, metrics, and traces to Datadog in a background thread.
         """
-        if DD_FORWARD_LOG:
-            self._forward_logs(logs)
-        self._forward_metrics(metrics)
-        self._forward_traces(traces)
+        # The Go trace library releases the GIL, so traces are sent in the
+        # background while logs and metrics are forwarded
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            traces_forwarded = executor.submit(self._forward_traces, traces)
+            if DD_FORWARD_LOG:
+                self._forward_logs(logs)
+            self._forward_metrics(metrics)
+            traces_forwarded.result()
 
-    def retry(self):
+        # Failed data may still be uploading in the background, the upload
+        # must finish before the execution environment is frozen
+        self.storage.flush()
+
+    def retry(self, deadline=None):
         """
         Retry forwarding logs, metrics, and traces to Datadog.
-        """
-        for prefix in RetryPrefix:
-            self._retry_prefix(prefix)
 
-    def _retry_prefix(self, prefix):
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f"Retrying {prefix} data")
+        The stored data of all kinds is read in a single pass, in RETRY_ORDER.
+        Stored data left when the deadline (a time.monotonic() value) or
+        DD_RETRY_MAX_PAYLOADS_PER_INVOCATION is reached stays in storage for
+        a later invocation. Metrics and traces go through other intakes, so
+        only logs are left in storage while the logs intake circuit is open.
+        """
+        retry_order = RETRY_ORDER
+        if self._intake_breaker.is_open():
+            logger.info("Skipped retrying logs: logs intake circuit is open")
+            retry_order = tuple(
+                prefix for prefix in RETRY_ORDER if prefix != RetryPrefix.LOGS
+            )
 
-        key_data = self.storage.get_data(prefix)
+        # {prefix: [payloads, seconds spent forwarding them]}
+        retried = {prefix: [0, 0.0] for prefix in RETRY_ORDER}
+        try:
+            for count, (prefix, k, d) in enumerate(
+                self.storage.iter_all_data(retry_order, deadline=deadline)
+            ):
+                if _deadline_reached(deadline):
+                    logger.warning(f"Stopped retrying {prefix} data: deadline reached")
+                    break
+                if (
+                    DD_RETRY_MAX_PAYLOADS_PER_INVOCATION
+                    and count >= DD_RETRY_MAX_PAYLOADS_PER_INVOCATION
+                ):
+                    logger.info(
+                        f"Stopped retrying: {DD_RETRY_MAX_PAYLOADS_PER_INVOCATION} payloads retried"
+                    )
+                    break
+                if d is None:
+                    continue
+                started_at = perf_counter()
+                match prefix:
+                    case RetryPrefix.LOGS:
+                        self._forward_logs(d, key=k)
+                    case RetryPrefix.METRICS:
+                        self._forward_metrics(d, key=k)
+                    case RetryPrefix.TRACES:
+                        self._forward_traces(d, key=k)
+                retried[prefix][0] += 1
+                retried[prefix][1] += perf_counter() - started_at
+        finally:
+            self.storage.flush()
+            self._report_retry(retried)
 
-        for k, d in key_data.items():
-            if d is None:
+    def _report_retry(self, retried):
+        for prefix, (count, duration) in retried.items():
+            if not count:
                 continue
-            match prefix:
-                case RetryPrefix.LOGS:
-                    self._forward_logs(d, key=k)
-                case RetryPrefix.METRICS:
-                    self._forward_metrics(d, key=k)
-                case RetryPrefix.TRACES:
-                    self._forward_traces(d, key=k)
+            send_event_metric(f"{prefix}_retry_payloads", count)
+            logger.info(
+                f"Retried {count} {prefix} payloads in {duration:.1f}s "
+                f"({count / max(duration, 0.001):.1f}/s)"
+            )
 
     def _forward_logs(self, logs, key=None):
         """Forward logs to Datadog"""
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"Forwarding {len(logs)} logs")
 
+        # Timed per log when stage timings are enabled
+        serialize = stage_timings.wrap("serialization", dump_event)
+        match = stage_timings.wrap("matching", self._matcher.match)
+
         logs_to_forward = []
         for log in logs:
             if key:
@@ -102,12 +169,12 @@ class Forwarder:
                 if log.get("message"):
                     evaluated_log = log["message"]
                 else:
-                    to_forward = dump_event(log)
+                    to_forward = serialize(log)
                     evaluated_log = to_forward
 
-            if self._matcher.match(evaluated_log):
+            if match(evaluated_log):
                 if to_forward is None:
-                    logs_to_forward.append(dump_event(log))
+                    logs_to_forward.append(serialize(log))
                 else:
                     logs_to_forward.append(to_forward)
 
@@ -121,8 +188,12 @@ class Forwarder:
         )
 
         failed_logs = []
-        with DatadogClient(cli) as client:
-            for batch in self._batcher.batch(logs_to_forward):
+        with DatadogClient(
+            cli, self._intake_breaker, DD_INTAKE_MAX_SEND_ATTEMPTS
+        ) as client:
+            for batch in stage_timings.wrap_iter(
+                "batching", self._batcher.batch(logs_to_forward)
+            ):
                 try:
                     client.send(batch)
                 except Exception as e:
@@ -131,70 +202,119 @@ class Forwarder:
                 else:
                     if logger.isEnabledFor(logging.DEBUG):
                         logger.debug(f"Forwarded log batch: {batch}")
-                    if key:
-                        self.storage.delete_data(key)
 
-        if DD_STORE_FAILED_EVENTS and failed_logs and not key:
+        if key:
+            self._acknowledge_retry(RetryPrefix.LOGS, key, failed_logs)
+        elif DD_STORE_FAILED_EVENTS and failed_logs:
             self.storage.store_data(RetryPrefix.LOGS, failed_logs)
 
         if failed_logs:
-            send_event_metric("logs_failed", failed_logs)
+            send_event_metric("logs_failed", len(failed_logs))
 
         send_event_metric("logs_forwarded", len(logs_to_forward) - len(failed_logs))
 
     def _forward_metrics(self, metrics, key=None):
         """
-        Forward custom metrics submitted via logs to Datadog in a background thread
-        using `lambda_metric` that is provided by the Datadog Python Lambda Layer.
+        Forward custom metrics submitted via logs to Datadog, each with
+        `lambda_metric` of the Datadog Python Lambda Layer.
         """
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"Forwarding {len(metrics)} metrics")
 
-        failed_metrics = []
-        for metric in metrics:
-            try:
-                send_log_metric(metric)
-            except Exception as e:
-                logger.error(
-                    f"Exception while forwarding metric {json.dumps(metric)}: {e}"
-                )
-                failed_metrics.append(metric)
-            else:
-                if logger.isEnabledFor(logging.DEBUG):
-                    logger.debug(f"Forwarded metric: {json.dumps(metric)}")
-                if key:
-                    self.storage.delete_data(key)
-
-        if DD_STORE_FAILED_EVENTS and failed_metrics and not key:
+        failed_metrics = send_log_metrics(metrics) if metrics else []
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Forwarded {len(metrics) - len(failed_metrics)} metrics")
+
+        if key:
+            self._acknowledge_retry(RetryPrefix.METRICS, key, failed_metrics)
+        elif DD_STORE_FAILED_EVENTS and failed_metrics:
             self.storage.store_data(RetryPrefix.METRICS, failed_metrics)
 
         if failed_metrics:
-            send_event_metric("metrics_failed", failed_metrics)
+            send_event_metric("metrics_failed", len(failed_metrics))
 
         send_event_metric("metrics_forwarded", len(metrics) - len(failed_metrics))
 
+    def _acknowledge_retry(self, prefix, key, failed):
+        """Delete a retried payload once all of its data was forwarded.
+
+        Data that failed again is stored as a new payload first, so only that
+        part is retried later. If it can't be stored, the whole payload is kept.
+        """
+        if failed and not self.storage.store_data(prefix, failed):
+            logger.warning(f"Keeping retry data {key}: failed data could not be stored")
+            return
+        self.storage.delete_data(key)
+
     def _forward_traces(self, traces, key=None):
+        """
+        Forward trace payloads in chunks of at most DD_TRACE_CHUNK_BYTES, sent
+        concurrently. Only the payloads of failed chunks are stored for retry.
+        """
         if not traces:
             return
 
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"Forwarding {len(traces)} traces")
 
+        failed_traces = []
+        with ThreadPoolExecutor(max_workers=DD_TRACE_MAX_WORKERS) as executor:
+            # Chunks are submitted as soon as they are serialized
+            sent_chunks = [
+                (chunk, executor.submit(self._send_trace_chunk, serialized_chunk))
+                for chunk, serialized_chunk in _chunk_trace_payloads(traces)
+            ]
+            for chunk, future in sent_chunks:
+                if not future.result():
+                    failed_traces.extend(chunk)
+
+        if key:
+            self._acknowledge_retry(RetryPrefix.TRACES, key, failed_traces)
+        elif DD_STORE_FAILED_EVENTS and failed_traces:
+            self.storage.store_data(RetryPrefix.TRACES, failed_traces)
+
+        if len(failed_traces) < len(traces):
+            send_event_metric("traces_forwarded", len(traces) - len(failed_traces))
+
+    def _send_trace_chunk(self, serialized_chunk):
         try:
-            serialized_trace_paylods = json.dumps(traces)
-            self.trace_connection.send_traces(serialized_trace_paylods)
+            self.trace_connection.send_traces(serialized_chunk)
         except Exception as e:
             logger.error(
-                f"Exception while forwarding traces {serialized_trace_paylods}: {e}"
+                f"Exception while forwarding traces {serialized_chunk.decode()}: {e}"
             )
-            if DD_STORE_FAILED_EVENTS and not key:
-                self.storage.store_data(RetryPrefix.TRACES, traces)
-        else:
-            if logger.isEnabledFor(logging.DEBUG):
-                logger.debug(f"Forwarded traces: {serialized_trace_paylods}")
-            if key:
-                self.storage.delete_data(key)
-            send_event_metric("traces_forwarded", len(traces))
+            return False
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Forwarded traces: {serialized_chunk.decode()}")
+        return True
+
+
+def _chunk_trace_payloads(traces):
+    """Yield (payloads, serialized payloads) chunks of at most DD_TRACE_CHUNK_BYTES.
+
+    Chunks are built as bytes, which are handed to the Go library without
+    being copied again. A payload larger than the limit is sent in a chunk
+    of its own.
+    """
+    chunk, serialized_payloads, chunk_size = [], [], 2
+    for trace in traces:
+        serialized = json.dumps(trace).encode("UTF-8")
+        # +1 for the comma separator between payloads
+        if chunk and chunk_size + len(serialized) + 1 > DD_TRACE_CHUNK_BYTES:
+            yield chunk, b"[" + b",".join(serialized_payloads) + b"]"
+            chunk, serialized_payloads, chunk_size = [], [], 2
+        chunk.append(trace)
+        serialized_payloads.append(serialized)
+        chunk_size += len(serialized) + 1
+
+    if chunk:
+        yield chunk, b"[" + b",".join(serialized_payloads) + b"]"
+
+
+def _deadline_reached(deadline):
+    return deadline is not None and monotonic() >= deadline
 
 
 def dump_event(event):
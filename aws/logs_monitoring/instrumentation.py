@@ -0,0 +1,128 @@
+# Unless explicitly stated otherwise all files in this repository are licensed
+# under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2021 Datadog, Inc.
+
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+from settings import DD_STAGE_TIMINGS
+from telemetry import send_event_metric
+
+logger = logging.getLogger()
+logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
+
+_DISABLED_STAGE = nullcontext()
+
+
+class StageTimings(object):
+    """
+    Records the time spent, and the events and bytes handled, by each stage
+    of the forwarder pipeline during an invocation.
+
+    Stages nest: parse includes decompression, forward includes the stages
+    of the logs it sends. When disabled, stage() returns a shared no-op
+    context manager and wrap() the function itself, so instrumented code
+    runs as it would without instrumentation.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # {stage: [seconds, events, size in bytes]}
+        self._stages = {}
+
+    def stage(self, name):
+        """Context manager timing a block as part of a stage"""
+        if not self.enabled:
+            return _DISABLED_STAGE
+        return self._time(name)
+
+    def count(self, name, events=0, size=0):
+        """Count events and bytes handled by a stage"""
+        if self.enabled:
+            self._record(name, 0, events, size)
+
+    def wrap(self, name, function):
+        """Returns function timed as part of a stage, for functions called per event"""
+        if not self.enabled:
+            return function
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._record(name, perf_counter() - start, 1, 0)
+
+        return timed
+
+    def wrap_iter(self, name, iterable):
+        """Returns the items of iterable, the time spent producing them being part of a stage"""
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(name, iterable)
+
+    def collect(self):
+        """Returns the stages recorded so far, {stage: (seconds, events, bytes)}, and reset them"""
+        with self._lock:
+            stages, self._stages = self._stages, {}
+        return {name: tuple(stage) for name, stage in stages.items()}
+
+    def report(self):
+        """Log a one-line summary of the stages, submit them as telemetry and reset them"""
+        if not self.enabled:
+            return
+
+        stages = self.collect()
+        if not stages:
+            return
+
+        summary = {}
+        for name, (seconds, events, size) in stages.items():
+            summary[name] = {"ms": round(seconds * 1000, 3), "events": events}
+            if size:
+                summary[name]["bytes"] = size
+            tags = [f"stage:{name}"]
+            send_event_metric("stage_duration_ms", seconds * 1000, tags)
+            send_event_metric("stage_events", events, tags)
+            if size:
+                send_event_metric("stage_bytes", size, tags)
+
+        logger.info(f"Forwarder stages: {json.dumps(summary, separators=(',', ':'))}")
+
+    @contextmanager
+    def _time(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, perf_counter() - start, 0, 0)
+
+    def _timed_iter(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._record(name, perf_counter() - start, 0, 0)
+                return
+            self._record(name, perf_counter() - start, 1, 0)
+            yield item
+
+    def _record(self, name, seconds, events, size):
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = [0, 0, 0]
+            stage[0] += seconds
+            stage[1] += events
+            stage[2] += size
+
+
+stage_timings = StageTimings(DD_STAGE_TIMINGS)
@@ -7,20 +7,23 @@ import json
 import logging
 import os
 from hashlib import sha1
+from time import monotonic
 
-import boto3
 from datadog import api
 from datadog_lambda.wrapper import datadog_lambda_wrapper
 
+from aws_clients import get_client
 from caching.cache_layer import CacheLayer
-from enhanced_lambda_metrics import parse_and_submit_enhanced_metrics
+from enhanced_lambda_metrics import EnhancedMetricsTap
 from forwarder import Forwarder
+from instrumentation import stage_timings
 from settings import (
     DD_ADDITIONAL_TARGET_LAMBDAS,
     DD_API_KEY,
     DD_API_URL,
     DD_FORWARDER_VERSION,
     DD_RETRY_KEYWORD,
+    DD_RETRY_TIMEOUT_MARGIN_SECONDS,
     DD_SKIP_SSL_VALIDATION,
     DD_STORE_FAILED_EVENTS,
     is_api_key_valid,
@@ -29,6 +32,7 @@ from steps.enrichment import enrich
 from steps.parsing import parse
 from steps.splitting import split
 from steps.transformation import transform
+from telemetry import flush_forwarder_telemetry
 
 logger = logging.getLogger()
 logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
@@ -66,28 +70,52 @@ def datadog_forwarder(event, context):
         logger.info("Retry-only invocation")
 
         try:
-            forwarder.retry()
+            with stage_timings.stage("retry"):
+                forwarder.retry(get_retry_deadline(context))
         except Exception as e:
             if logger.isEnabledFor(logging.DEBUG):
                 logger.debug(f"Failed to retry forwarding {e}")
 
+        report_invocation_telemetry()
         return
 
-    parsed = parse(event, context, cache_layer)
-    enriched = enrich(parsed, cache_layer)
-    transformed = transform(enriched)
-    metrics, logs, trace_payloads = split(transformed)
-
-    forwarder.forward(logs, metrics, trace_payloads)
-    parse_and_submit_enhanced_metrics(logs, cache_layer)
+    with stage_timings.stage("parse"):
+        parsed = parse(event, context, cache_layer)
+    stage_timings.count("parse", events=len(parsed))
+    with stage_timings.stage("enrich"):
+        enriched = enrich(parsed, cache_layer)
+    stage_timings.count("enrich", events=len(enriched))
+    with stage_timings.stage("transform"):
+        transformed = transform(enriched)
+    stage_timings.count("transform", events=len(transformed))
+    enhanced_metrics = EnhancedMetricsTap(cache_layer)
+    with stage_timings.stage("split"):
+        metrics, logs, trace_payloads = split(transformed, log_tap=enhanced_metrics)
+    stage_timings.count("split", events=len(transformed))
+
+    with stage_timings.stage("forward"):
+        forwarder.forward(logs, metrics, trace_payloads)
+    stage_timings.count(
+        "forward", events=len(logs) + len(metrics) + len(trace_payloads)
+    )
+    enhanced_metrics.flush()
+    cache_layer.flush()
 
     try:
         if str(event.get(DD_RETRY_KEYWORD, "false")).lower() == "true":
-            forwarder.retry()
+            with stage_timings.stage("retry"):
+                forwarder.retry(get_retry_deadline(context))
     except Exception as e:
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"Failed to retry forwarding {e}")
 
+    report_invocation_telemetry()
+
+
+def report_invocation_telemetry():
+    stage_timings.report()
+    flush_forwarder_telemetry()
+
 
 def init_cache_layer(function_prefix):
     global cache_layer
@@ -107,6 +135,15 @@ def init_forwarder(function_prefix):
         forwarder = Forwarder(function_prefix)
 
 
+def get_retry_deadline(context):
+    """Monotonic time at which retrying must stop to finish before the timeout"""
+    try:
+        remaining_ms = context.get_remaining_time_in_millis()
+    except Exception:
+        return None
+    return monotonic() + remaining_ms / 1000 - DD_RETRY_TIMEOUT_MARGIN_SECONDS
+
+
 def get_function_arn_digest(context):
     function_arn = context.invoked_function_arn.lower()
     prefix = sha1(function_arn.encode("UTF-8")).hexdigest()
@@ -114,7 +151,7 @@ def get_function_arn_digest(context):
 
 
 def invoke_additional_target_lambdas(event):
-    lambda_client = boto3.client("lambda")
+    lambda_client = get_client("lambda")
     lambda_arns = DD_ADDITIONAL_TARGET_LAMBDAS.split(",")
     lambda_payload = json.dumps(event)
 
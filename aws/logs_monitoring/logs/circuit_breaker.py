@@ -0,0 +1,88 @@
+# Unless explicitly stated otherwise all files in this repository are licensed
+# under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2021 Datadog, Inc.
+
+
+import logging
+import os
+import threading
+import time
+
+from telemetry import send_forwarder_internal_metrics
+
+logger = logging.getLogger()
+logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
+
+
+class CircuitBreaker(object):
+    """
+    Stops sending to an intake after consecutive failures.
+
+    Once failure_threshold sends failed in a row, the circuit opens: requests
+    are refused for cooldown_seconds, or until the Retry-After the intake
+    asked for. Then a single probe request is let through (half-open), which
+    closes the circuit when it succeeds and opens it again when it fails.
+    The forwarder is reused by warm invocations, so is the breaker state.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, cooldown_seconds):
+        self._failure_threshold = failure_threshold
+        self._cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._open_until = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def is_open(self):
+        """Whether requests would be refused, without taking the half-open probe"""
+        with self._lock:
+            if self._state == self.OPEN:
+                return time.monotonic() < self._open_until
+            return self._state == self.HALF_OPEN
+
+    def allow_request(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() >= self._open_until:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Logs intake is reachable again, closing circuit")
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self, retry_after=None):
+        """Count a failed send, retry_after being the delay the intake asked for"""
+        with self._lock:
+            self._failures += 1
+            threshold_reached = (
+                self._state != self.CLOSED or self._failures >= self._failure_threshold
+            )
+            if not threshold_reached and retry_after is None:
+                return
+
+            open_seconds = max(
+                self._cooldown_seconds if threshold_reached else 0, retry_after or 0
+            )
+            was_open = self._state == self.OPEN
+            self._state = self.OPEN
+            self._open_until = max(self._open_until, time.monotonic() + open_seconds)
+
+        if not was_open:
+            logger.warning(f"Logs intake failing, circuit open for {open_seconds}s")
+            send_forwarder_internal_metrics("intake_circuit_open")
@@ -5,29 +5,50 @@
 
 
 import time
-from logs.exceptions import RetriableException
+from logs.exceptions import CircuitOpenException, RetriableException
 
 
 class DatadogClient(object):
     """
     Client that implements a exponential retrying logic to send a batch of logs.
+
+    Sending is attempted at most max_attempts times, and fails fast when the
+    circuit breaker shared by the batches is open or when the intake asks to
+    wait longer than max_backoff.
     """
 
-    def __init__(self, client, max_backoff=30):
+    def __init__(self, client, breaker=None, max_attempts=3, max_backoff=30):
         self._client = client
+        self._breaker = breaker
+        self._max_attempts = max_attempts
         self._max_backoff = max_backoff
 
     def send(self, logs):
         backoff = 1
-        while True:
+        for attempt in range(1, self._max_attempts + 1):
+            if self._breaker and not self._breaker.allow_request():
+                raise CircuitOpenException("logs intake circuit is open")
             try:
                 self._client.send(logs)
+            except RetriableException as e:
+                if self._breaker:
+                    self._breaker.record_failure(retry_after=e.retry_after)
+                delay = backoff if e.retry_after is None else e.retry_after
+                if attempt == self._max_attempts or delay > self._max_backoff:
+                    raise
+                time.sleep(delay)
+                backoff = min(backoff * 2, self._max_backoff)
+            except Exception:
+                # The intake answered, e.g. 400, or the batch could not be
+                # sent: the intake is not failing, and a half-open probe must
+                # not be left without an outcome
+                if self._breaker:
+                    self._breaker.record_success()
+                raise
+            else:
+                if self._breaker:
+                    self._breaker.record_success()
                 return
-            except RetriableException:
-                time.sleep(backoff)
-                if backoff < self._max_backoff:
-                    backoff *= 2
-                continue
 
     def __enter__(self):
         self._client.__enter__()
@@ -6,10 +6,13 @@
 
 import logging
 import os
+import time
+from email.utils import parsedate_to_datetime
 
 from requests_futures.sessions import FuturesSession
 
-from logs.exceptions import ScrubbingException
+from instrumentation import stage_timings
+from logs.exceptions import RetriableException, ScrubbingException
 from logs.helpers import compress_logs
 from settings import (
     DD_COMPRESSION_LEVEL,
@@ -23,6 +26,9 @@ from settings import (
 logger = logging.getLogger()
 logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
 
+# Throttled or unavailable intake, the batch may be sent again later
+RETRIABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
 
 def get_dd_storage_tag_header():
     storage_tag = ""
@@ -38,6 +44,20 @@ def get_dd_storage_tag_header():
     return storage_tag
 
 
+def parse_retry_after(value):
+    """Returns the seconds to wait from a Retry-After header, in seconds or as a date"""
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
 class DatadogHTTPClient(object):
     """
     Client that sends a batch of logs over HTTP.
@@ -89,16 +109,32 @@ class DatadogHTTPClient(object):
         Sends a batch of log, only retry on server and network errors.
         """
         try:
-            data = self._scrubber.scrub("[{}]".format(",".join(logs)))
+            with stage_timings.stage("scrubbing"):
+                data = self._scrubber.scrub("[{}]".format(",".join(logs)))
         except ScrubbingException as e:
             raise Exception(f"could not scrub the payload: {e}")
+        stage_timings.count("scrubbing", events=len(logs), size=len(data))
         if DD_USE_COMPRESSION:
-            data = compress_logs(data, DD_COMPRESSION_LEVEL)
+            stage_timings.count("compression", events=len(logs), size=len(data))
+            with stage_timings.stage("compression"):
+                data = compress_logs(data, DD_COMPRESSION_LEVEL)
 
+        stage_timings.count("post", events=len(logs), size=len(data))
         # Resolve the future here so callers can attribute failures to this batch.
-        response = self._session.post(
-            self._url, data, timeout=self._timeout, verify=self._ssl_validation
-        ).result()
+        try:
+            with stage_timings.stage("post"):
+                response = self._session.post(
+                    self._url, data, timeout=self._timeout, verify=self._ssl_validation
+                ).result()
+        except Exception as e:
+            # Network error or timeout
+            raise RetriableException(str(e)) from e
+
+        if response.status_code in RETRIABLE_STATUS_CODES:
+            raise RetriableException(
+                f"logs intake responded {response.status_code}",
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+            )
         response.raise_for_status()
 
     def __enter__(self):
@@ -5,6 +5,13 @@
 
 
 class RetriableException(Exception):
+    def __init__(self, message="", retry_after=None):
+        super().__init__(message)
+        # Seconds the intake asked to wait before retrying, if it did
+        self.retry_after = retry_after
+
+
+class CircuitOpenException(Exception):
     pass
 
 
@@ -49,7 +49,10 @@ def compileRegex(rule, pattern):
 def add_retry_tag(log):
     try:
         log = json.loads(log)
-        log[DD_CUSTOM_TAGS] = log.get(DD_CUSTOM_TAGS, "") + f",{DD_RETRY_KEYWORD}:true"
+        retry_tag = f"{DD_RETRY_KEYWORD}:true"
+        # Logs failing again are stored with the tag already
+        if retry_tag not in log.get(DD_CUSTOM_TAGS, "").split(","):
+            log[DD_CUSTOM_TAGS] = log.get(DD_CUSTOM_TAGS, "") + f",{retry_tag}"
     except Exception:
         logger.warning(f"cannot add retry tag for log {log}")
 
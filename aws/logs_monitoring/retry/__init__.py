@@ -1,11 +1,29 @@
 from retry.base_storage import BaseStorage
-from settings import DD_SQS_QUEUE_URL
+from settings import DD_RETRY_DISK_PATH, DD_RETRY_DISK_WRITE_BEHIND, DD_SQS_QUEUE_URL
 
 
 def create_storage(function_prefix) -> BaseStorage:
     """Select the appropriate storage backend based on configuration.
 
-    If DD_SQS_QUEUE_URL is set, use SQS. Otherwise, fall back to S3.
+    If DD_RETRY_DISK_PATH is set, failed events go to disk first, and are
+    uploaded to the remote backend unless DD_RETRY_DISK_WRITE_BEHIND is false.
+    """
+    if DD_RETRY_DISK_PATH:
+        from retry.disk_storage import DiskStorage
+
+        local = DiskStorage(function_prefix)
+        if not DD_RETRY_DISK_WRITE_BEHIND:
+            return local
+
+        from retry.write_behind_storage import WriteBehindStorage
+
+        return WriteBehindStorage(local, _create_remote_storage(function_prefix))
+
+    return _create_remote_storage(function_prefix)
+
+
+def _create_remote_storage(function_prefix) -> BaseStorage:
+    """If DD_SQS_QUEUE_URL is set, use SQS. Otherwise, fall back to S3.
     The S3 backend may be initialized with an empty bucket name when the
     retry feature is disabled (DD_STORE_FAILED_EVENTS=false) — this is
     safe because storage methods are only called when retry is enabled.
@@ -7,12 +7,33 @@ class BaseStorage(ABC):
         """Retrieve stored data for a given prefix. Returns {key: data}."""
         ...
 
+    def iter_data(self, prefix, deadline=None):
+        """Yield stored (key, data) for a given prefix, stopping at the deadline.
+
+        The deadline is a time.monotonic() value. Backends able to stream
+        their data override this, the default reads everything with get_data.
+        """
+        yield from self.get_data(prefix).items()
+
+    def iter_all_data(self, prefixes, deadline=None):
+        """Yield stored (prefix, key, data) for all given prefixes, in their order.
+
+        Backends able to read every prefix in one pass override this.
+        """
+        for prefix in prefixes:
+            for key, data in self.iter_data(prefix, deadline=deadline):
+                yield prefix, key, data
+
     @abstractmethod
-    def store_data(self, prefix, data) -> None:
-        """Store data under the given prefix."""
+    def store_data(self, prefix, data) -> bool:
+        """Store data under the given prefix. Returns whether it was stored."""
         ...
 
     @abstractmethod
     def delete_data(self, key) -> None:
         """Delete stored data by key."""
         ...
+
+    def flush(self) -> None:
+        """Send operations the backend buffered, e.g. batched deletions."""
+        ...
@@ -0,0 +1,236 @@
+import fcntl
+import json
+import logging
+import os
+from contextlib import contextmanager
+from itertools import count
+from time import monotonic, time_ns
+
+from retry.base_storage import BaseStorage
+from settings import DD_RETRY_DISK_MAX_BYTES, DD_RETRY_DISK_PATH
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
+
+DISK_KEY_PREFIX = "disk:"
+DISK_SEGMENT_PREFIX = "segment-"
+DISK_SEGMENT_SUFFIX = ".log"
+# A new segment is started once the active one reaches this size
+DISK_SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+# Live records are rewritten once they take less than this share of the log
+DISK_COMPACTION_LIVE_RATIO = 0.5
+
+_PUT = "put"
+_DELETE = "del"
+
+
+class DiskStorage(BaseStorage):
+    """Failed events stored in an append-only log on local disk or an EFS mount.
+
+    The log is a sequence of segment files of records, one per line: a JSON
+    header, a tab, then the JSON data. Deletions append a tombstone, and
+    flush compacts the log once most of it is deleted. Stored data is synced
+    to disk before store_data returns. Every operation holds a lock on the
+    directory, so several processes can share it.
+    """
+
+    def __init__(self, function_prefix, path=None):
+        self.directory = os.path.join(path or DD_RETRY_DISK_PATH, function_prefix)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_path = os.path.join(self.directory, "lock")
+        self._ids = count()
+        self._has_deletes = False
+
+    @staticmethod
+    def is_disk_key(key):
+        return isinstance(key, str) and key.startswith(DISK_KEY_PREFIX)
+
+    def get_data(self, prefix):
+        return dict(self.iter_data(prefix))
+
+    def iter_data(self, prefix, deadline=None):
+        for _, key, data in self.iter_all_data([prefix], deadline=deadline):
+            yield key, data
+
+    def iter_all_data(self, prefixes, deadline=None):
+        with self._locked():
+            live_records, _, _ = self._scan()
+
+        for prefix in prefixes:
+            for key, (record_prefix, path, offset, size) in live_records.items():
+                if record_prefix != str(prefix):
+                    continue
+                if deadline is not None and monotonic() >= deadline:
+                    logger.warning(
+                        f"Stopped reading retry data for prefix {prefix}: deadline reached"
+                    )
+                    return
+                yield prefix, key, self._read_data(path, offset, size)
+
+    def store_data(self, prefix, data):
+        return self.append(prefix, data) is not None
+
+    def append(self, prefix, data):
+        """Store data under the given prefix. Returns its key, None on failure."""
+        key = f"{DISK_KEY_PREFIX}{time_ns()}-{os.getpid()}-{next(self._ids)}"
+        record = self._encode_record(
+            {"op": _PUT, "key": key, "prefix": str(prefix)},
+            json.dumps(data, ensure_ascii=False),
+        )
+        try:
+            with self._locked():
+                segments = self._segments()
+                used_bytes = sum(os.path.getsize(path) for path in segments)
+                if used_bytes + len(record) > DD_RETRY_DISK_MAX_BYTES:
+                    logger.error(
+                        f"Failed to store retry data for prefix {prefix}: "
+                        f"{DD_RETRY_DISK_MAX_BYTES} bytes on disk already"
+                    )
+                    return None
+                self._write(segments, record, sync=True)
+        except OSError as e:
+            logger.error(f"Failed to store retry data for prefix {prefix}: {e}")
+            return None
+
+        return key
+
+    def delete_data(self, key):
+        """Append a tombstone for key, synced to disk on flush."""
+        record = self._encode_record({"op": _DELETE, "key": key})
+        try:
+            with self._locked():
+                self._write(self._segments(), record, sync=False)
+            self._has_deletes = True
+        except OSError as e:
+            logger.error(f"Failed to delete retry data for key {key}: {e}")
+
+    def flush(self):
+        """Sync the tombstones to disk and compact the log."""
+        if not self._has_deletes:
+            return
+        self._has_deletes = False
+
+        try:
+            with self._locked():
+                segments = self._segments()
+                if segments:
+                    self._sync(segments[-1])
+                self._compact(segments)
+        except OSError as e:
+            logger.error(f"Failed to compact retry data: {e}")
+
+    def _compact(self, segments):
+        """Rewrite the live records into a new segment, once most of the log is dead."""
+        live_records, live_bytes, total_bytes = self._scan(segments)
+        if live_bytes >= total_bytes * DISK_COMPACTION_LIVE_RATIO:
+            return
+
+        if live_records:
+            compacted_path = os.path.join(self.directory, "compaction.tmp")
+            with open(compacted_path, "wb") as compacted_file:
+                for _, path, offset, size in live_records.values():
+                    with open(path, "rb") as segment_file:
+                        segment_file.seek(offset)
+                        compacted_file.write(segment_file.read(size))
+                compacted_file.flush()
+                os.fsync(compacted_file.fileno())
+            # Records found twice after a crash here are deduped by key on scan
+            os.replace(compacted_path, self._next_segment_path(segments))
+
+        for path in segments:
+            os.remove(path)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Compacted retry data from {total_bytes} to {live_bytes} bytes"
+            )
+
+    def _scan(self, segments=None):
+        """Returns the live records {key: (prefix, path, offset, size)}, their size and the log size."""
+        live_records = {}
+        total_bytes = 0
+        for path in self._segments() if segments is None else segments:
+            with open(path, "rb") as segment_file:
+                offset = 0
+                for line in segment_file:
+                    # Torn write at the end of a segment
+                    if not line.endswith(b"\n"):
+                        break
+                    size = len(line)
+                    try:
+                        header = json.loads(line.partition(b"\t")[0])
+                    except ValueError:
+                        logger.warning(f"Skipping corrupted retry record in {path}")
+                        header = {}
+                    if header.get("op") == _PUT:
+                        live_records[header["key"]] = (
+                            header["prefix"],
+                            path,
+                            offset,
+                            size,
+                        )
+                    elif header.get("op") == _DELETE:
+                        live_records.pop(header["key"], None)
+                    offset += size
+                    total_bytes += size
+
+        live_bytes = sum(size for _, _, _, size in live_records.values())
+        return live_records, live_bytes, total_bytes
+
+    def _read_data(self, path, offset, size):
+        try:
+            with open(path, "rb") as segment_file:
+                segment_file.seek(offset)
+                line = segment_file.read(size)
+            return json.loads(line.partition(b"\t")[2])
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read retry data from {path}: {e}")
+            return None
+
+    def _write(self, segments, record, sync):
+        if not segments or os.path.getsize(segments[-1]) >= DISK_SEGMENT_MAX_BYTES:
+            path = self._next_segment_path(segments)
+        else:
+            path = segments[-1]
+
+        with open(path, "ab") as segment_file:
+            segment_file.write(record)
+            segment_file.flush()
+            if sync:
+                os.fsync(segment_file.fileno())
+
+    def _sync(self, path):
+        with open(path, "ab") as segment_file:
+            os.fsync(segment_file.fileno())
+
+    def _segments(self):
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith(DISK_SEGMENT_PREFIX)
+            and name.endswith(DISK_SEGMENT_SUFFIX)
+        )
+
+    def _next_segment_path(self, segments):
+        sequence = 0
+        if segments:
+            name = os.path.basename(segments[-1])
+            sequence = int(name[len(DISK_SEGMENT_PREFIX) : -len(DISK_SEGMENT_SUFFIX)])
+            sequence += 1
+        return os.path.join(
+            self.directory,
+            f"{DISK_SEGMENT_PREFIX}{sequence:010d}{DISK_SEGMENT_SUFFIX}",
+        )
+
+    @contextmanager
+    def _locked(self):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _encode_record(header, data=""):
+        return (json.dumps(header) + "\t" + data + "\n").encode("UTF-8")
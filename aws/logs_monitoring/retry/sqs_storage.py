@@ -1,10 +1,15 @@
+import base64
+import gzip
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from threading import Lock
 
-import boto3
 from botocore.exceptions import ClientError
 
+from aws_clients import get_client
 from retry.base_storage import BaseStorage
 from settings import DD_SQS_QUEUE_URL
 
@@ -15,108 +20,276 @@ logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").uppe
 SQS_MAX_CHUNK_BYTES = 240 * 1024
 SQS_MAX_MESSAGES_PER_RECEIVE = 10
 SQS_MAX_POLL_ITERATIONS = 10
+# Batch APIs take at most 10 entries and 256KB of messages per call
+SQS_MAX_BATCH_ENTRIES = 10
+SQS_MAX_BATCH_BYTES = SQS_MAX_CHUNK_BYTES
+SQS_MAX_BATCH_ATTEMPTS = 3
+SQS_MAX_BATCH_WORKERS = 4
+# Marks bodies holding gzipped JSON, bodies without it are plain JSON
+SQS_CONTENT_ENCODING_GZIP = "gzip+base64"
 
 
 class SQSStorage(BaseStorage):
     def __init__(self, function_prefix):
         self.queue_url = DD_SQS_QUEUE_URL
-        self.sqs_client = boto3.client("sqs")
         self.function_prefix = function_prefix
+        self._pending_deletes = {}
+        self._pending_deletes_lock = Lock()
+        # Messages received for retry and not handed out yet, released on
+        # flush: {prefix: {receipt_handle: data}}
+        self._received = {}
+
+    @cached_property
+    def sqs_client(self):
+        return get_client("sqs")
 
     def get_data(self, prefix):
         """Poll SQS for messages matching prefix and function_prefix.
 
-        Returns {receipt_handle: data} for matching messages.
-        Non-matching messages are released immediately by resetting their
-        visibility timeout to 0.
+        Returns {receipt_handle: data} for matching messages. Messages of
+        other prefixes or functions are released as soon as they are
+        received, by resetting their visibility timeout to 0, so they are
+        not held invisible while this prefix is retried.
+        """
+        self._poll({str(prefix)})
+        key_data = self._received.pop(str(prefix), {})
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Found {len(key_data)} SQS retry messages for prefix {prefix}"
+            )
+
+        return key_data
+
+    def iter_all_data(self, prefixes, deadline=None):
+        """Yield (prefix, key, data) of all prefixes from a single polling pass.
+
+        Messages of other functions are released as soon as they are received,
+        messages not yielded are released on flush.
         """
-        key_data = {}
+        self._poll({str(prefix) for prefix in prefixes})
+
+        for prefix in prefixes:
+            key_data = self._received.get(str(prefix), {})
+            for receipt_handle in list(key_data):
+                yield prefix, receipt_handle, key_data.pop(receipt_handle)
 
+    def _poll(self, retry_prefixes):
+        """Receive the messages of this function and retry_prefixes into self._received.
+
+        Other messages are released right away. Messages which cannot be
+        deserialized would be received again forever, they are deleted.
+        """
         for _ in range(SQS_MAX_POLL_ITERATIONS):
             try:
                 response = self.sqs_client.receive_message(
                     QueueUrl=self.queue_url,
                     MaxNumberOfMessages=SQS_MAX_MESSAGES_PER_RECEIVE,
-                    MessageAttributeNames=["retry_prefix", "function_prefix"],
+                    MessageAttributeNames=[
+                        "retry_prefix",
+                        "function_prefix",
+                        "content_encoding",
+                    ],
                     WaitTimeSeconds=0,
                 )
             except ClientError as e:
                 logger.error(f"Failed to receive SQS messages: {e}")
-                break
+                return
 
             messages = response.get("Messages", [])
             if not messages:
-                break
+                return
 
+            to_release = []
+            to_delete = []
             for message in messages:
                 receipt_handle = message["ReceiptHandle"]
                 msg_retry_prefix = self._get_message_attr(message, "retry_prefix")
                 msg_function_prefix = self._get_message_attr(message, "function_prefix")
 
                 if (
-                    msg_retry_prefix != str(prefix)
+                    msg_retry_prefix not in retry_prefixes
                     or msg_function_prefix != self.function_prefix
                 ):
-                    self._release_message(receipt_handle)
+                    to_release.append(receipt_handle)
                     continue
 
-                data = self._deserialize(message["Body"])
-                if data is not None:
-                    key_data[receipt_handle] = data
-
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(
-                f"Found {len(key_data)} SQS retry messages for prefix {prefix}"
-            )
+                data = self._deserialize(
+                    message["Body"],
+                    self._get_message_attr(message, "content_encoding"),
+                )
+                if data is None:
+                    logger.error(
+                        f"Deleting SQS message of prefix {msg_retry_prefix} "
+                        "which cannot be deserialized"
+                    )
+                    to_delete.append(receipt_handle)
+                    continue
+                self._received.setdefault(msg_retry_prefix, {})[receipt_handle] = data
 
-        return key_data
+            self._release_messages(to_release)
+            self._delete_messages(to_delete)
 
     def store_data(self, prefix, data):
         """Store data as one or more SQS messages, chunking to stay under the size limit."""
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"Storing retry data to SQS for prefix {prefix}")
 
-        chunks = self._chunk_data(data)
-        for chunk in chunks:
-            serialized = self._serialize(chunk)
+        attributes = {
+            "retry_prefix": {
+                "DataType": "String",
+                "StringValue": str(prefix),
+            },
+            "function_prefix": {
+                "DataType": "String",
+                "StringValue": self.function_prefix,
+            },
+            "content_encoding": {
+                "DataType": "String",
+                "StringValue": SQS_CONTENT_ENCODING_GZIP,
+            },
+        }
+        entries = [
+            {"Id": str(i), "MessageBody": serialized, "MessageAttributes": attributes}
+            for i, (_, serialized) in enumerate(self._serialize_chunks(data))
+        ]
+        failed = self._call_batches("send_message_batch", entries)
+        if failed:
+            logger.error(
+                f"Failed to send {len(failed)} SQS messages for prefix {prefix}"
+            )
+        return not failed
+
+    def delete_data(self, key):
+        """Queue a message for deletion by receipt handle.
+
+        Deletions are sent in batches, as soon as a batch is full and on flush.
+        Idempotent — errors are logged and swallowed.
+        """
+        with self._pending_deletes_lock:
+            self._pending_deletes[key] = None
+            if len(self._pending_deletes) < SQS_MAX_BATCH_ENTRIES:
+                return
+            receipt_handles = list(self._pending_deletes)
+            self._pending_deletes = {}
+
+        self._delete_messages(receipt_handles)
+
+    def flush(self):
+        """Send the queued deletions and release the messages left unretried"""
+        with self._pending_deletes_lock:
+            receipt_handles = list(self._pending_deletes)
+            self._pending_deletes = {}
+
+        self._delete_messages(receipt_handles)
+
+        self._release_messages(
+            [
+                receipt_handle
+                for key_data in self._received.values()
+                for receipt_handle in key_data
+            ]
+        )
+        self._received = {}
+
+    def _delete_messages(self, receipt_handles):
+        entries = [
+            {"Id": str(i), "ReceiptHandle": receipt_handle}
+            for i, receipt_handle in enumerate(receipt_handles)
+        ]
+        failed = self._call_batches("delete_message_batch", entries)
+        if failed:
+            logger.error(f"Failed to delete {len(failed)} SQS messages")
+
+    def _release_messages(self, receipt_handles):
+        """Make messages we won't process immediately visible to other consumers."""
+        entries = [
+            {"Id": str(i), "ReceiptHandle": receipt_handle, "VisibilityTimeout": 0}
+            for i, receipt_handle in enumerate(receipt_handles)
+        ]
+        failed = self._call_batches("change_message_visibility_batch", entries)
+        if failed:
+            logger.error(f"Failed to release {len(failed)} SQS messages")
+
+    def _call_batches(self, operation_name, entries):
+        """Call an SQS batch API over entries, batches being sent in parallel.
+
+        Returns the entries that could not be processed.
+        """
+        batches = self._make_batches(entries)
+        if len(batches) <= 1:
+            return self._call_batch(operation_name, batches[0]) if batches else []
+
+        failed = []
+        with ThreadPoolExecutor(
+            max_workers=min(len(batches), SQS_MAX_BATCH_WORKERS)
+        ) as executor:
+            for batch_failed in executor.map(
+                lambda batch: self._call_batch(operation_name, batch), batches
+            ):
+                failed.extend(batch_failed)
+        return failed
+
+    def _call_batch(self, operation_name, batch):
+        """Call an SQS batch API, retrying the entries that failed on the SQS side.
+
+        Returns the entries that could not be processed.
+        """
+        operation = getattr(self.sqs_client, operation_name)
+        for _ in range(SQS_MAX_BATCH_ATTEMPTS):
             try:
-                self.sqs_client.send_message(
-                    QueueUrl=self.queue_url,
-                    MessageBody=serialized,
-                    MessageAttributes={
-                        "retry_prefix": {
-                            "DataType": "String",
-                            "StringValue": str(prefix),
-                        },
-                        "function_prefix": {
-                            "DataType": "String",
-                            "StringValue": self.function_prefix,
-                        },
-                    },
-                )
+                response = operation(QueueUrl=self.queue_url, Entries=batch)
             except ClientError as e:
-                logger.error(f"Failed to send SQS message for prefix {prefix}: {e}")
+                logger.error(f"Failed to call SQS {operation_name}: {e}")
+                return batch
 
-    def delete_data(self, key):
-        """Delete a message by receipt handle. Idempotent — logs and swallows errors."""
-        try:
-            self.sqs_client.delete_message(
-                QueueUrl=self.queue_url,
-                ReceiptHandle=key,
-            )
-        except ClientError as e:
-            logger.error(f"Failed to delete SQS message (receipt={key}): {e}")
+            failures = {
+                failure["Id"]: failure for failure in response.get("Failed", [])
+            }
+            if not failures:
+                return []
 
-    def _release_message(self, receipt_handle):
-        """Make a non-matching message immediately visible to other consumers."""
-        try:
-            self.sqs_client.change_message_visibility(
-                QueueUrl=self.queue_url,
-                ReceiptHandle=receipt_handle,
-                VisibilityTimeout=0,
-            )
-        except ClientError as e:
-            logger.error(f"Failed to release SQS message: {e}")
+            retryable = []
+            for entry in batch:
+                failure = failures.get(entry["Id"])
+                if failure is None:
+                    continue
+                if failure.get("SenderFault"):
+                    # Retrying would fail the same way, e.g. an expired receipt handle
+                    logger.error(
+                        f"SQS {operation_name} rejected entry: {failure.get('Code')}"
+                    )
+                else:
+                    retryable.append(entry)
+
+            batch = retryable
+            if not batch:
+                return []
+
+        return batch
+
+    @staticmethod
+    def _make_batches(entries):
+        """Group entries by SQS_MAX_BATCH_ENTRIES, keeping message bodies under SQS_MAX_BATCH_BYTES."""
+        batches = []
+        current_batch = []
+        current_size = 0
+        for entry in entries:
+            entry_size = len(entry.get("MessageBody", ""))
+            if current_batch and (
+                len(current_batch) >= SQS_MAX_BATCH_ENTRIES
+                or current_size + entry_size > SQS_MAX_BATCH_BYTES
+            ):
+                batches.append(current_batch)
+                current_batch = []
+                current_size = 0
+            current_batch.append(entry)
+            current_size += entry_size
+
+        if current_batch:
+            batches.append(current_batch)
+
+        return batches
 
     @staticmethod
     def _get_message_attr(message, attr_name):
@@ -125,46 +298,46 @@ class SQSStorage(BaseStorage):
         return attrs.get(attr_name, {}).get("StringValue")
 
     def _chunk_data(self, data):
-        """Split a list of items into chunks that each fit under SQS_MAX_CHUNK_BYTES."""
-        if not isinstance(data, list):
-            return [data]
+        """Split a list of items into chunks that each fit under SQS_MAX_CHUNK_BYTES once compressed."""
+        return [chunk for chunk, _ in self._serialize_chunks(data)]
 
-        chunks = []
-        current_chunk = []
-        current_size = 2  # account for JSON array brackets "[]"
-
-        for item in data:
-            item_json = json.dumps(item, ensure_ascii=False)
-            item_size = len(item_json.encode("UTF-8"))
-            # +1 for the comma separator between items
-            separator_size = 1 if current_chunk else 0
-
-            if current_size + separator_size + item_size > SQS_MAX_CHUNK_BYTES:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                if 2 + item_size > SQS_MAX_CHUNK_BYTES:
-                    logger.warning(
-                        f"Single item exceeds SQS message size limit "
-                        f"({item_size} bytes > {SQS_MAX_CHUNK_BYTES} bytes). "
-                        f"SQS send will fail for this chunk."
-                    )
-                current_chunk = [item]
-                current_size = 2 + item_size
-            else:
-                current_chunk.append(item)
-                current_size += separator_size + item_size
+    def _serialize_chunks(self, data):
+        """Split data into (chunk, serialized chunk) pairs fitting in an SQS message.
 
-        if current_chunk:
-            chunks.append(current_chunk)
+        Sizes are those of the compressed bodies, so a list is only split when
+        it does not fit compressed. It is cut in as many even parts as its
+        compressed size suggests, and parts still too large are cut again.
+        """
+        serialized = self._serialize(data)
+        if len(serialized) <= SQS_MAX_CHUNK_BYTES:
+            return [(data, serialized)]
 
-        return chunks or [data]
+        if not isinstance(data, list) or len(data) < 2:
+            logger.warning(
+                f"Single item exceeds SQS message size limit "
+                f"({len(serialized)} bytes > {SQS_MAX_CHUNK_BYTES} bytes). "
+                f"SQS send will fail for this chunk."
+            )
+            return [(data, serialized)]
+
+        parts_count = min(len(data), max(2, -(-len(serialized) // SQS_MAX_CHUNK_BYTES)))
+        part_size = -(-len(data) // parts_count)
+        chunks = []
+        for start in range(0, len(data), part_size):
+            chunks.extend(self._serialize_chunks(data[start : start + part_size]))
+        return chunks
 
     def _serialize(self, data):
-        return json.dumps(data, ensure_ascii=False)
+        compressed = gzip.compress(
+            json.dumps(data, ensure_ascii=False).encode("UTF-8"), compresslevel=6
+        )
+        return base64.b64encode(compressed).decode("ascii")
 
-    def _deserialize(self, data):
+    def _deserialize(self, data, content_encoding=None):
         try:
+            if content_encoding == SQS_CONTENT_ENCODING_GZIP:
+                data = gzip.decompress(base64.b64decode(data))
             return json.loads(data)
-        except (json.JSONDecodeError, TypeError) as e:
+        except (json.JSONDecodeError, TypeError, ValueError, OSError) as e:
             logger.error(f"Failed to deserialize SQS message body: {e}")
             return None
@@ -1,34 +1,83 @@
+import gzip
 import json
 import logging
 import os
-from time import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import cached_property
+from time import monotonic, time
 
-import boto3
 from botocore.exceptions import ClientError
 
+from aws_clients import get_client
 from retry.base_storage import BaseStorage
-from settings import DD_S3_BUCKET_NAME, DD_S3_RETRY_DIRNAME
+from settings import DD_S3_BUCKET_NAME, DD_S3_RETRY_DIRNAME, DD_S3_RETRY_MAX_WORKERS
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
 
+GZIP_MAGIC_NUMBER = b"\x1f\x8b"
+
 
 class S3Storage(BaseStorage):
     def __init__(self, function_prefix):
         self.bucket_name = DD_S3_BUCKET_NAME
-        self.s3_client = boto3.client("s3")
         self.function_prefix = function_prefix
 
+    @cached_property
+    def s3_client(self):
+        return get_client("s3")
+
     def get_data(self, prefix):
-        keys = self._list_keys(prefix)
-        key_data = {}
-        for key in keys:
-            key_data[key] = self._fetch_data_for_key(key)
+        return dict(self.iter_data(prefix))
 
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f"Found {len(keys)} retry keys for prefix {prefix}")
+    def iter_data(self, prefix, deadline=None):
+        """Stream (key, data) for every retry object of the prefix.
 
-        return key_data
+        Keys are listed page by page and downloaded by a bounded pool, each
+        object is yielded as soon as it is downloaded. No new download is
+        started once the deadline is reached.
+        """
+        prefixed_keys = ((prefix, key) for key in self._list_keys(prefix, deadline))
+        for _, key, data in self._fetch(prefixed_keys, deadline):
+            yield key, data
+
+    def iter_all_data(self, prefixes, deadline=None):
+        """Stream (prefix, key, data) for the retry objects of all prefixes.
+
+        Prefixes are listed in the given order, page by page, through a single
+        download pool, so downloads start with the first page and no page is
+        listed once the deadline is reached.
+        """
+        prefixed_keys = (
+            (prefix, key)
+            for prefix in prefixes
+            for key in self._list_keys(prefix, deadline)
+        )
+        yield from self._fetch(prefixed_keys, deadline)
+
+    def _fetch(self, prefixed_keys, deadline):
+        """Download (prefix, key) pairs with a bounded pool, yielding (prefix, key, data)."""
+        max_in_flight = 2 * DD_S3_RETRY_MAX_WORKERS
+        in_flight = set()
+        executor = ThreadPoolExecutor(max_workers=DD_S3_RETRY_MAX_WORKERS)
+        try:
+            for prefix, key in prefixed_keys:
+                if deadline is not None and monotonic() >= deadline:
+                    logger.warning(
+                        f"Stopped fetching retry data for prefix {prefix}: deadline reached"
+                    )
+                    break
+
+                in_flight.add(executor.submit(self._fetch_key, prefix, key))
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+
+            for future in in_flight:
+                yield future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
     def store_data(self, prefix, data):
         if logger.isEnabledFor(logging.DEBUG):
@@ -39,10 +88,15 @@ class S3Storage(BaseStorage):
         serialized_data = self._serialize(data)
         try:
             self.s3_client.put_object(
-                Bucket=self.bucket_name, Key=key, Body=serialized_data
+                Bucket=self.bucket_name,
+                Key=key,
+                Body=serialized_data,
+                ContentEncoding="gzip",
             )
         except ClientError as e:
             logger.error(f"Failed to store retry data for prefix {prefix}: {e}")
+            return False
+        return True
 
     def delete_data(self, key):
         try:
@@ -50,18 +104,36 @@ class S3Storage(BaseStorage):
         except ClientError as e:
             logger.error(f"Failed to delete retry data for key {key}: {e}")
 
-    def _list_keys(self, prefix):
-        key_prefix = self._get_key_prefix(prefix)
-        try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name, Prefix=key_prefix
-            )
-            return [content["Key"] for content in response.get("Contents", [])]
-        except ClientError as e:
-            logger.error(
-                f"Failed to list retry keys for prefix {key_prefix} because of {e}"
-            )
-            return []
+    def _list_keys(self, prefix, deadline=None):
+        return self._list_objects(self._get_key_prefix(prefix), deadline)
+
+    def _list_objects(self, key_prefix, deadline=None):
+        """Yield the keys under key_prefix, no page is listed once the deadline is reached"""
+        kwargs = {"Bucket": self.bucket_name, "Prefix": key_prefix}
+        while True:
+            if deadline is not None and monotonic() >= deadline:
+                logger.warning(
+                    f"Stopped listing retry keys for prefix {key_prefix}: deadline reached"
+                )
+                return
+
+            try:
+                response = self.s3_client.list_objects_v2(**kwargs)
+            except ClientError as e:
+                logger.error(
+                    f"Failed to list retry keys for prefix {key_prefix} because of {e}"
+                )
+                return
+
+            for content in response.get("Contents", []):
+                yield content["Key"]
+
+            if response.get("IsTruncated") is not True:
+                return
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    def _fetch_key(self, prefix, key):
+        return prefix, key, self._fetch_data_for_key(key)
 
     def _fetch_data_for_key(self, key):
         try:
@@ -79,10 +151,16 @@ class S3Storage(BaseStorage):
             return None
 
     def _get_key_prefix(self, retry_prefix):
-        return f"{DD_S3_RETRY_DIRNAME}/{self.function_prefix}/{str(retry_prefix)}/"
+        return f"{self._get_function_key_prefix()}{str(retry_prefix)}/"
+
+    def _get_function_key_prefix(self):
+        return f"{DD_S3_RETRY_DIRNAME}/{self.function_prefix}/"
 
     def _serialize(self, data):
-        return json.dumps(data).encode("UTF-8")
+        return gzip.compress(json.dumps(data).encode("UTF-8"), compresslevel=6)
 
     def _deserialize(self, data):
+        # Objects stored before compression was introduced are plain JSON
+        if data[:2] == GZIP_MAGIC_NUMBER:
+            data = gzip.decompress(data)
         return json.loads(data.decode("UTF-8"))
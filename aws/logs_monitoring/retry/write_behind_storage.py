@@ -0,0 +1,89 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+
+from retry.base_storage import BaseStorage
+from retry.disk_storage import DiskStorage
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
+
+# How long flush and retries wait for the background uploads
+UPLOAD_WAIT_SECONDS = 5
+
+
+class WriteBehindStorage(BaseStorage):
+    """Failed events written to a DiskStorage, then uploaded to a remote storage.
+
+    store_data only costs a local write, the upload to S3 or SQS runs in a
+    background thread and the local copy is deleted once uploaded. Data not
+    uploaded yet is retried straight from disk.
+    """
+
+    def __init__(self, local, remote):
+        self.local = local
+        self.remote = remote
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # Background uploads: {future: local key}, stored from the trace
+        # thread as well as the logs and metrics path
+        self._uploads = {}
+        self._uploads_lock = Lock()
+
+    def get_data(self, prefix):
+        return dict(self.iter_data(prefix))
+
+    def iter_data(self, prefix, deadline=None):
+        for _, key, data in self.iter_all_data([prefix], deadline=deadline):
+            yield key, data
+
+    def iter_all_data(self, prefixes, deadline=None):
+        self._wait_for_uploads()
+        for prefix, key, data in self.local.iter_all_data(prefixes, deadline=deadline):
+            # Don't retry from disk data which is still being uploaded
+            with self._uploads_lock:
+                uploading = key in self._uploads.values()
+            if not uploading:
+                yield prefix, key, data
+        yield from self.remote.iter_all_data(prefixes, deadline=deadline)
+
+    def store_data(self, prefix, data):
+        key = self.local.append(prefix, data)
+        if key is None:
+            # Disk full or failing, upload right away
+            return self.remote.store_data(prefix, data)
+
+        with self._uploads_lock:
+            self._uploads[self._executor.submit(self._upload, prefix, key, data)] = key
+        return True
+
+    def delete_data(self, key):
+        if DiskStorage.is_disk_key(key):
+            self.local.delete_data(key)
+        else:
+            self.remote.delete_data(key)
+
+    def flush(self):
+        self._wait_for_uploads()
+        self.local.flush()
+        self.remote.flush()
+
+    def _upload(self, prefix, key, data):
+        if self.remote.store_data(prefix, data):
+            self.local.delete_data(key)
+
+    def _wait_for_uploads(self):
+        with self._uploads_lock:
+            uploads = list(self._uploads)
+        if not uploads:
+            return
+
+        done, _ = wait(uploads, timeout=UPLOAD_WAIT_SECONDS)
+        # Uploads stored while waiting are kept
+        with self._uploads_lock:
+            for future in done:
+                del self._uploads[future]
+            running_count = len(self._uploads)
+
+        if running_count:
+            logger.warning(f"{running_count} retry uploads still running, kept on disk")
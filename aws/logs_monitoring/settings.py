@@ -8,8 +8,6 @@ import json
 import logging
 import os
 
-import boto3
-import botocore.config
 import requests
 
 logger = logging.getLogger()
@@ -100,6 +98,29 @@ DD_TAGS = get_env_var("DD_TAGS", "")
 ## @param DD_MAX_WORKERS - Max number of workers sending logs concurrently
 DD_MAX_WORKERS = int(os.getenv("DD_MAX_WORKERS", 20))
 
+## @param DD_INTAKE_MAX_SEND_ATTEMPTS - integer - optional - default: 3
+## Max number of times a batch of logs is sent when the intake is throttling
+## or unavailable, before it goes to the failed events storage.
+#
+DD_INTAKE_MAX_SEND_ATTEMPTS = max(
+    1, int(get_env_var("DD_INTAKE_MAX_SEND_ATTEMPTS", default=3))
+)
+
+## @param DD_INTAKE_CIRCUIT_BREAKER_THRESHOLD - integer - optional - default: 5
+## Number of consecutive failed sends after which no more logs are sent to the
+## intake for a while, they go straight to the failed events storage.
+#
+DD_INTAKE_CIRCUIT_BREAKER_THRESHOLD = max(
+    1, int(get_env_var("DD_INTAKE_CIRCUIT_BREAKER_THRESHOLD", default=5))
+)
+
+## @param DD_INTAKE_CIRCUIT_BREAKER_COOLDOWN_SECONDS - integer - optional - default: 30
+## Seconds before a single batch is sent again to probe the intake.
+#
+DD_INTAKE_CIRCUIT_BREAKER_COOLDOWN_SECONDS = int(
+    get_env_var("DD_INTAKE_CIRCUIT_BREAKER_COOLDOWN_SECONDS", default=30)
+)
+
 ## @param DD_API_URL - Url to use for  validating the the api key.
 DD_API_URL = get_env_var(
     "DD_API_URL",
@@ -112,6 +133,31 @@ DD_TRACE_INTAKE_URL = get_env_var(
     default="{}://trace.agent.{}".format("http" if DD_NO_SSL else "https", DD_SITE),
 )
 
+## @param DD_TRACE_CHUNK_BYTES - integer - optional - default: 2097152
+## Max size of the serialized trace payloads sent to the trace intake at once.
+## A burst of traces is split in chunks sent concurrently and retried independently.
+#
+DD_TRACE_CHUNK_BYTES = int(get_env_var("DD_TRACE_CHUNK_BYTES", default=2 * 1024 * 1024))
+
+## @param DD_TRACE_MAX_WORKERS - integer - optional - default: 4
+## Max number of trace chunks sent concurrently.
+#
+DD_TRACE_MAX_WORKERS = max(1, int(get_env_var("DD_TRACE_MAX_WORKERS", default=4)))
+
+## @param DD_TRACE_CONNECTION - string - optional - default: go
+## Client sending traces to the trace intake: "go" for the trace-intake library,
+## "python" for the pure-Python client, which needs no native library. Its
+## obfuscation is a port of the Go one, checked against it in the tests.
+#
+DD_TRACE_CONNECTION = get_env_var("DD_TRACE_CONNECTION", default="go").lower()
+
+## @param DD_STAGE_TIMINGS - boolean - optional - default: false
+## Set to true to measure the time, events and bytes of each stage of the
+## forwarder (parsing, enrichment, scrubbing, compression, sending...). They are
+## logged in a one-line summary per invocation and submitted as telemetry metrics.
+#
+DD_STAGE_TIMINGS = get_env_var("DD_STAGE_TIMINGS", "false", boolean=True)
+
 
 DD_URL = get_env_var("DD_URL", default="http-intake.logs." + DD_SITE)
 DD_PORT = int(get_env_var("DD_PORT", default="443"))
@@ -158,10 +204,24 @@ SCRUBBING_RULE_CONFIGS = [
 INCLUDE_AT_MATCH = get_env_var("INCLUDE_AT_MATCH", default=None)
 EXCLUDE_AT_MATCH = get_env_var("EXCLUDE_AT_MATCH", default=None)
 
-# Set boto3 timeout
-boto3_config = botocore.config.Config(
-    connect_timeout=5, read_timeout=5, retries={"max_attempts": 2}
-)
+
+def get_api_key_client(service_name, region_name=None):
+    """
+    Return a boto3 client, with short timeouts, to fetch the API key with.
+
+    boto3 is only imported when the API key is stored in AWS, so forwarders
+    given the key directly do not pay for its import during a cold start.
+    The client is created from the default session, shared with the other
+    clients of the forwarder.
+    """
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        service_name,
+        region_name=region_name,
+        config=Config(connect_timeout=5, read_timeout=5, retries={"max_attempts": 2}),
+    )
 
 
 def get_region_from_arn(arn):
@@ -189,10 +249,8 @@ if "DD_API_KEY_SECRET_ARN" in os.environ:
     logger.debug(f"Fetching the Datadog API key from SecretsManager: {SECRET_ARN}")
 
     # Fetch the secret from Secrets Manager, from the region the ARN points to
-    secret_response = boto3.client(
-        "secretsmanager",
-        region_name=get_region_from_arn(SECRET_ARN),
-        config=boto3_config,
+    secret_response = get_api_key_client(
+        "secretsmanager", get_region_from_arn(SECRET_ARN)
     ).get_secret_value(SecretId=SECRET_ARN)
 
     # The secret could be either a plain string or a JSON object
@@ -222,15 +280,13 @@ if "DD_API_KEY_SECRET_ARN" in os.environ:
 elif "DD_API_KEY_SSM_NAME" in os.environ:
     SECRET_NAME = os.environ["DD_API_KEY_SSM_NAME"]
     logger.debug(f"Fetching the Datadog API key from SSM: {SECRET_NAME}")
-    DD_API_KEY = boto3.client(
-        "ssm",
-        region_name=get_region_from_arn(SECRET_NAME),
-        config=boto3_config,
+    DD_API_KEY = get_api_key_client(
+        "ssm", get_region_from_arn(SECRET_NAME)
     ).get_parameter(Name=SECRET_NAME, WithDecryption=True)["Parameter"]["Value"]
 elif "DD_KMS_API_KEY" in os.environ:
     ENCRYPTED = os.environ["DD_KMS_API_KEY"]
     logger.debug(f"Fetching the Datadog API key from KMS: {ENCRYPTED}")
-    DD_API_KEY = boto3.client("kms", config=boto3_config).decrypt(
+    DD_API_KEY = get_api_key_client("kms").decrypt(
         CiphertextBlob=base64.b64decode(ENCRYPTED)
     )["Plaintext"]
     if type(DD_API_KEY) is bytes:
@@ -388,7 +444,24 @@ DD_S3_TAGS_CACHE_LOCK_FILENAME = "s3.lock"
 
 DD_S3_LOG_GROUP_CACHE_DIRNAME = "log-group"
 
+## @param DD_S3_LOG_GROUP_CACHE_SHARD_COUNT - integer - optional - default: 16
+## Number of S3 objects the log group tags cache is spread over.
+## Log groups are assigned to a shard by hash, and a whole shard is read in one request.
+#
+DD_S3_LOG_GROUP_CACHE_SHARD_COUNT = int(
+    get_env_var("DD_S3_LOG_GROUP_CACHE_SHARD_COUNT", default=16)
+)
+
 DD_TAGS_CACHE_TTL_SECONDS = int(get_env_var("DD_TAGS_CACHE_TTL_SECONDS", default=300))
+
+## @param DD_TAGS_CACHE_PREFETCH_MAX_WORKERS - integer - optional - default: 8
+## Max number of tag lookups run concurrently when an invocation carries logs
+## from several log groups. Kinesis records are also decompressed this many at
+## a time, so that the tags of their log groups are looked up together.
+#
+DD_TAGS_CACHE_PREFETCH_MAX_WORKERS = max(
+    1, int(get_env_var("DD_TAGS_CACHE_PREFETCH_MAX_WORKERS", default=8))
+)
 DD_S3_CACHE_LOCK_TTL_SECONDS = 60
 GET_RESOURCES_LAMBDA_FILTER = "lambda"
 GET_RESOURCES_S3_FILTER = "s3:bucket"
@@ -398,4 +471,50 @@ GET_RESOURCES_S3_FILTER = "s3:bucket"
 DD_S3_RETRY_DIRNAME = "failed_events"
 DD_RETRY_KEYWORD = "retry"
 DD_STORE_FAILED_EVENTS = get_env_var("DD_STORE_FAILED_EVENTS", "false", boolean=True)
+## @param DD_SQS_QUEUE_URL - string - optional
+## SQS queue storing failed events instead of the S3 bucket.
+## Give each forwarder its own queue so retry polling only receives its own backlog.
+#
 DD_SQS_QUEUE_URL = get_env_var("DD_SQS_QUEUE_URL", default=None)
+
+## @param DD_RETRY_DISK_PATH - string - optional
+## Directory, e.g. under /tmp or on an EFS mount, where failed events are written
+## first. They are then uploaded to the SQS queue or S3 bucket in the background,
+## unless DD_RETRY_DISK_WRITE_BEHIND is false.
+#
+DD_RETRY_DISK_PATH = get_env_var("DD_RETRY_DISK_PATH", default=None)
+
+## @param DD_RETRY_DISK_WRITE_BEHIND - boolean - optional - default: true
+## Set to false to keep failed events on disk only.
+#
+DD_RETRY_DISK_WRITE_BEHIND = get_env_var(
+    "DD_RETRY_DISK_WRITE_BEHIND", "true", boolean=True
+)
+
+## @param DD_RETRY_DISK_MAX_BYTES - integer - optional - default: 268435456
+## Max size of the failed events kept in DD_RETRY_DISK_PATH.
+#
+DD_RETRY_DISK_MAX_BYTES = int(
+    get_env_var("DD_RETRY_DISK_MAX_BYTES", default=256 * 1024 * 1024)
+)
+
+## @param DD_S3_RETRY_MAX_WORKERS - integer - optional - default: 8
+## Max number of stored retry objects downloaded from S3 concurrently.
+#
+DD_S3_RETRY_MAX_WORKERS = max(1, int(get_env_var("DD_S3_RETRY_MAX_WORKERS", default=8)))
+
+## @param DD_RETRY_MAX_PAYLOADS_PER_INVOCATION - integer - optional - default: 0
+## Max number of stored payloads (S3 objects or SQS messages) retried by one
+## invocation, the rest is retried by later invocations. 0 means no limit.
+#
+DD_RETRY_MAX_PAYLOADS_PER_INVOCATION = max(
+    0, int(get_env_var("DD_RETRY_MAX_PAYLOADS_PER_INVOCATION", default=0))
+)
+
+## @param DD_RETRY_TIMEOUT_MARGIN_SECONDS - integer - optional - default: 10
+## Retrying stops this many seconds before the invocation times out,
+## remaining data is retried by a later invocation.
+#
+DD_RETRY_TIMEOUT_MARGIN_SECONDS = int(
+    get_env_var("DD_RETRY_TIMEOUT_MARGIN_SECONDS", default=10)
+)
@@ -3,7 +3,6 @@ import logging
 import os
 import re
 
-from enhanced_lambda_metrics import parse_lambda_tags_from_arn
 from settings import DD_CUSTOM_TAGS, DD_HOST, DD_SERVICE, DD_SOURCE
 from steps.enums import AwsEventSource
 
@@ -49,75 +48,36 @@ def add_metadata_to_lambda_log(event, cache_layer):
         return
 
     # Function name is the seventh piece of the ARN
-    try:
-        function_name = lambda_log_arn.split(":")[6]
-    except IndexError:
+    if len(lambda_log_arn.split(":")) < 7:
         logger.error(f"Failed to extract function name from ARN: {lambda_log_arn}")
         return
 
+    # Tags are derived once per ARN, see LambdaTagsBundle
+    lambda_tags = cache_layer.get_lambda_tags_bundle(lambda_log_arn)
+
     # Set Lambda ARN to "host"
     event[DD_HOST] = lambda_log_arn
 
-    tags = [f"functionname:{function_name}"]
-
-    # Get custom tags of the Lambda function
-    custom_lambda_tags = get_enriched_lambda_log_tags(event, cache_layer)
-
     # If not set during parsing or has a default value
     # then set the service tag from lambda tags cache or using the function name
     # otherwise, remove the service tag from the custom lambda tags if exists to avoid duplication
     if not event.get(DD_SERVICE) or event.get(DD_SERVICE) == event.get(DD_SOURCE):
-        service_tag = next(
-            (tag for tag in custom_lambda_tags if tag.startswith("service:")),
-            f"service:{function_name}",
-        )
-        if service_tag:
-            tags.append(service_tag)
-            event[DD_SERVICE] = service_tag.split(":")[1]
+        tags = lambda_tags.tags_with_service
+        event[DD_SERVICE] = lambda_tags.service
     else:
-        custom_lambda_tags = [
-            tag for tag in custom_lambda_tags if not tag.startswith("service:")
-        ]
+        tags = lambda_tags.tags_without_service
 
     # Check if one of the Lambda's custom tags is env
     # If an env tag exists, remove the env:none placeholder
-    custom_env_tag = next(
-        (tag for tag in custom_lambda_tags if tag.startswith("env:")), None
-    )
-    if custom_env_tag:
+    if lambda_tags.has_env_tag:
         event[DD_CUSTOM_TAGS] = ",".join(
             [t for t in event.get(DD_CUSTOM_TAGS, "").split(",") if t != "env:none"]
         )
 
-    tags.extend(custom_lambda_tags)
-
-    # Dedup tags, so we don't end up with functionname twice
-    tags = list(set(tags))
-    tags.sort()  # Keep order deterministic
-
     if custom_tags := event.get(DD_CUSTOM_TAGS):
-        event[DD_CUSTOM_TAGS] = ",".join([custom_tags] + tags)
+        event[DD_CUSTOM_TAGS] = f"{custom_tags},{tags}"
     else:
-        event[DD_CUSTOM_TAGS] = ",".join(tags)
-
-
-def get_enriched_lambda_log_tags(log_event, cache_layer):
-    """Retrieves extra tags from lambda, either read from the function arn, or by fetching lambda tags from the function itself.
-
-    Args:
-        log_event (dict<str, str | dict | int>): a log parsed from the event in the split method
-    """
-    # Note that this arn attribute has been lowercased already
-    log_function_arn = log_event.get("lambda", {}).get("arn")
-
-    if not log_function_arn:
-        return []
-    tags_from_arn = parse_lambda_tags_from_arn(log_function_arn)
-    lambda_custom_tags = cache_layer.get_lambda_tags_cache().get(log_function_arn)
-
-    # Combine and dedup tags
-    tags = list(set(tags_from_arn + lambda_custom_tags))
-    return tags
+        event[DD_CUSTOM_TAGS] = tags
 
 
 def extract_ddtags_from_message(event):
@@ -9,6 +9,7 @@ from customized_log_group import (
     get_lambda_function_name_from_logstream_name,
     is_lambda_customized_log_group,
 )
+from instrumentation import stage_timings
 from settings import DD_CUSTOM_TAGS, DD_HOST, DD_SOURCE
 from steps.common import (
     add_service_tag,
@@ -28,11 +29,12 @@ class AwsLogsHandler:
         self.context = context
         self.cache_layer = cache_layer
 
-    def handle(self, event):
+    def handle(self, event, logs=None):
         # Generate metadata
         metadata = generate_metadata(self.context)
-        # Get logs
-        logs = self.extract_logs(event)
+        # Get logs, unless they were already extracted to prefetch their tags
+        if logs is None:
+            logs = self.extract_logs(event)
         # Build aws attributes
         aws_attributes = AwsAttributes(
             self.context,
@@ -65,14 +67,36 @@ class AwsLogsHandler:
 
     @staticmethod
     def extract_logs(event):
-        with gzip.GzipFile(
-            fileobj=BytesIO(base64.b64decode(event["awslogs"]["data"]))
-        ) as decompress_stream:
-            # Reading line by line avoid a bug where gzip would take a very long
-            # time (>5min) for file around 60MB gzipped
-            data = b"".join(BufferedReader(decompress_stream))
+        with stage_timings.stage("decompression"):
+            with gzip.GzipFile(
+                fileobj=BytesIO(base64.b64decode(event["awslogs"]["data"]))
+            ) as decompress_stream:
+                # Reading line by line avoid a bug where gzip would take a very long
+                # time (>5min) for file around 60MB gzipped
+                data = b"".join(BufferedReader(decompress_stream))
+        stage_timings.count("decompression", events=1, size=len(data))
         return json.loads(data)
 
+    def prefetch_tags(self, logs_list):
+        """Resolve the tags of every log group and Lambda function in a batch
+        of extracted logs concurrently, before the logs are handled"""
+        log_group_arns = set()
+        lambda_arns = set()
+        for logs in logs_list:
+            if not logs.get("logGroup"):
+                continue
+            aws_attributes = AwsAttributes(
+                self.context, logs.get("logGroup"), logs.get("logStream")
+            )
+            self.set_account_region(aws_attributes)
+            log_group_arns.add(aws_attributes.get_log_group_arn())
+            if lambda_arn := self.get_lower_cased_lambda_arn(aws_attributes):
+                lambda_arns.add(lambda_arn)
+
+        self.cache_layer.prefetch(
+            log_group_arns=log_group_arns, lambda_arns=lambda_arns
+        )
+
     def set_account_region(self, aws_attributes):
         try:
             aws_attributes.set_account_region(self.context.invoked_function_arn)
@@ -126,30 +150,33 @@ class AwsLogsHandler:
 
     # Lambda logs can be from either default or customized log group
     def process_lambda_logs(self, metadata, aws_attributes):
+        lower_cased_lambda_arn = self.get_lower_cased_lambda_arn(aws_attributes)
+
+        if lower_cased_lambda_arn is None:
+            return
+
+        # Add the lower_cased arn as a log attribute
+        aws_attributes.set_lambda_arn(lower_cased_lambda_arn)
+        env_tag_exists = (
+            metadata[DD_CUSTOM_TAGS].startswith("env:")
+            or ",env:" in metadata[DD_CUSTOM_TAGS]
+        )
+        # If there is no env specified, default to env:none
+        if not env_tag_exists:
+            metadata[DD_CUSTOM_TAGS] += ",env:none"
+
+    # Rebuild the arn of the monitored lambda from the arn of the forwarder
+    def get_lower_cased_lambda_arn(self, aws_attributes):
         lower_cased_lambda_function_name = self.get_lower_cased_lambda_function_name(
             aws_attributes
         )
 
         if lower_cased_lambda_function_name is None:
-            return
+            return None
 
         # Split the arn of the forwarder to extract the prefix
-        arn_parts = self.context.invoked_function_arn.split("function:")
-        if len(arn_parts) > 0:
-            arn_prefix = arn_parts[0]
-            # Rebuild the arn with the lowercased function name
-            lower_cased_lambda_arn = (
-                arn_prefix + "function:" + lower_cased_lambda_function_name
-            )
-            # Add the lowe_rcased arn as a log attribute
-            aws_attributes.set_lambda_arn(lower_cased_lambda_arn)
-            env_tag_exists = (
-                metadata[DD_CUSTOM_TAGS].startswith("env:")
-                or ",env:" in metadata[DD_CUSTOM_TAGS]
-            )
-            # If there is no env specified, default to env:none
-            if not env_tag_exists:
-                metadata[DD_CUSTOM_TAGS] += ",env:none"
+        arn_prefix = self.context.invoked_function_arn.split("function:")[0]
+        return arn_prefix + "function:" + lower_cased_lambda_function_name
 
     # The lambda function name can be inferred from either a customized logstream name, or a loggroup name
     def get_lower_cased_lambda_function_name(self, aws_attributes):
@@ -6,9 +6,8 @@ import re
 import urllib.parse
 from io import BufferedReader, BytesIO
 
-import boto3
-import botocore
-
+from aws_clients import get_client
+from instrumentation import stage_timings
 from settings import (
     CN_STRING,
     DD_CUSTOM_TAGS,
@@ -39,14 +38,12 @@ _MULTILINE_REGEX_PATTERN = (
 
 
 def create_s3_client():
-    """Create a boto3 S3 client with VPC-aware configuration when applicable."""
+    """Return the shared boto3 S3 client, with VPC-aware configuration when applicable."""
     if DD_USE_VPC:
-        return boto3.client(
-            "s3",
-            os.environ["AWS_REGION"],
-            config=botocore.config.Config(s3={"addressing_style": "path"}),
+        return get_client(
+            "s3", os.environ["AWS_REGION"], s3={"addressing_style": "path"}
         )
-    return boto3.client("s3")
+    return get_client("s3")
 
 
 class S3EventDataStore:
@@ -152,12 +149,15 @@ class S3EventHandler:
     def _decompress_data(self):
         # Decompress data that has a .gz extension or magic header http://www.onicos.com/staff/iz/formats/gzip.html
         if self.data_store.key[-3:] == ".gz" or self.data_store.data[:2] == b"\x1f\x8b":
-            with gzip.GzipFile(
+            with stage_timings.stage("decompression"), gzip.GzipFile(
                 fileobj=BytesIO(self.data_store.data)
             ) as decompress_stream:
                 # Reading line by line avoid a bug where gzip would take a very long time (>5min) for
                 # file around 60MB gzipped
                 self.data_store.data = b"".join(BufferedReader(decompress_stream))
+            stage_timings.count(
+                "decompression", events=1, size=len(self.data_store.data)
+            )
 
     def _extract_cloudtrail_logs(self):
         try:
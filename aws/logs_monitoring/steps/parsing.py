@@ -8,7 +8,7 @@ import json
 import logging
 import os
 
-from settings import DD_SERVICE, DD_SOURCE
+from settings import DD_SERVICE, DD_SOURCE, DD_TAGS_CACHE_PREFETCH_MAX_WORKERS
 from steps.common import (
     generate_metadata,
     get_service_from_tags_and_remove_duplicates,
@@ -34,7 +34,9 @@ def parse(event, context, cache_layer):
         match event_type:
             case AwsEventType.AWSLOGS:
                 aws_handler = AwsLogsHandler(context, cache_layer)
-                events = aws_handler.handle(event)
+                logs = aws_handler.extract_logs(event)
+                aws_handler.prefetch_tags([logs])
+                events = aws_handler.handle(event, logs)
                 return collect_and_count(events)
             case AwsEventType.S3:
                 s3_handler = S3EventHandler(context, metadata, cache_layer)
@@ -222,9 +224,15 @@ def kinesis_awslogs_handler(event, context, cache_layer):
         return {"awslogs": {"data": record["kinesis"]["data"]}}
 
     awslogs_handler = AwsLogsHandler(context, cache_layer)
-    return itertools.chain.from_iterable(
-        awslogs_handler.handle(reformat_record(r)) for r in event["Records"]
-    )
+    records = (reformat_record(r) for r in event["Records"])
+    # Records are extracted a window at a time: the tags of the log groups of
+    # a window are fetched at once, while only the records of one window are
+    # held decompressed
+    while window := list(itertools.islice(records, DD_TAGS_CACHE_PREFETCH_MAX_WORKERS)):
+        logs_list = [awslogs_handler.extract_logs(record) for record in window]
+        awslogs_handler.prefetch_tags(logs_list)
+        for record, logs in zip(window, logs_list):
+            yield from awslogs_handler.handle(record, logs)
 
 
 def normalize_events(events, metadata):
@@ -7,14 +7,21 @@ logger = logging.getLogger()
 logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
 
 
-def split(events):
-    """Split events into metrics, logs, and trace payloads"""
+def split(events, log_tap=None):
+    """Split events into metrics, logs, and trace payloads
+
+    Args:
+        log_tap (callable): optional, called with each log and its message
+            decoded from JSON (None if it isn't JSON), as it is split
+    """
     metrics, logs, trace_payloads = [], [], []
     for event in events:
         try:
             parsed = json.loads(event["message"])
         except Exception:
             logs.append(event)
+            if log_tap:
+                log_tap(event, None)
             continue
 
         metric = extract_metric(parsed, event)
@@ -26,6 +33,8 @@ def split(events):
             )
         else:
             logs.append(event)
+            if log_tap:
+                log_tap(event, parsed)
 
     if logger.isEnabledFor(logging.DEBUG):
         logger.debug(
@@ -3,6 +3,12 @@
 # This product includes software developed at Datadog (https://www.datadoghq.com/).
 # Copyright 2021 Datadog, Inc.
 
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from time import monotonic, time
+
 try:
     from datadog_lambda.metric import lambda_metric
 
@@ -12,9 +18,16 @@ except ImportError:
 
 from settings import DD_FORWARDER_VERSION
 
+logger = logging.getLogger()
+logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
+
 DD_FORWARDER_TELEMETRY_NAMESPACE_PREFIX = "aws.dd_forwarder"
 DD_FORWARDER_TELEMETRY_TAGS = []
 
+# Distribution points older than this are dropped, like the Datadog Lambda
+# layer does
+DISTRIBUTION_MAX_AGE_SECONDS = 4 * 60 * 60
+
 
 def set_forwarder_telemetry_tags(context, event_type):
     """Helper function to set tags on telemetry metrics
@@ -30,30 +43,164 @@ def set_forwarder_telemetry_tags(context, event_type):
 
 
 def send_forwarder_internal_metrics(name, additional_tags=[]):
+    """Count an occurrence of a forwarder event, submitted on flush"""
     if not DD_SUBMIT_ENHANCED_METRICS:
         return
 
-    """Send forwarder's internal metrics to DD"""
-    lambda_metric(
-        "{}.{}".format(DD_FORWARDER_TELEMETRY_NAMESPACE_PREFIX, name),
-        1,
-        tags=DD_FORWARDER_TELEMETRY_TAGS + additional_tags,
-    )
+    telemetry_registry.increment(name, additional_tags)
 
 
-def send_event_metric(metric_name, metric_value):
+def send_event_metric(metric_name, metric_value, additional_tags=()):
+    """Record a value of a forwarder metric, submitted on flush"""
     if not DD_SUBMIT_ENHANCED_METRICS:
         return
 
-    lambda_metric(
-        "{}.{}".format(DD_FORWARDER_TELEMETRY_NAMESPACE_PREFIX, metric_name),
-        metric_value,
-        tags=DD_FORWARDER_TELEMETRY_TAGS,
-    )
+    telemetry_registry.distribution(metric_name, metric_value, additional_tags)
 
 
-def send_log_metric(metric):
+def flush_forwarder_telemetry():
+    """Submit the forwarder telemetry recorded since the last flush"""
     if not DD_SUBMIT_ENHANCED_METRICS:
         return
 
-    lambda_metric(metric["m"], metric["v"], timestamp=metric["e"], tags=metric["t"])
+    telemetry_registry.flush()
+
+
+class TelemetryRegistry(object):
+    """
+    Aggregates the forwarder telemetry of an invocation in memory.
+
+    Counters, gauges and timers are keyed by name and extra tags, and only
+    submitted on flush, with the forwarder telemetry tags. Every metric is
+    submitted as a distribution, as it was when each occurrence was sent with
+    lambda_metric. A counter incremented n times submits a single point of n,
+    so the sum of its distribution is unchanged.
+
+    Values that are not numbers are logged and dropped when recorded, so that
+    flushing never fails once the invocation has forwarded its data.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {(name, tags): count}
+        self._counters = {}
+        # {(name, tags): value}
+        self._gauges = {}
+        # {(name, tags): [values]}
+        self._distributions = {}
+
+    def increment(self, name, tags=(), value=1):
+        value = self._to_number(name, value)
+        if value is None:
+            return
+        key = (name, tags if type(tags) is tuple else tuple(tags))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, tags=()):
+        value = self._to_number(name, value)
+        if value is None:
+            return
+        key = (name, tags if type(tags) is tuple else tuple(tags))
+        with self._lock:
+            self._gauges[key] = value
+
+    def distribution(self, name, value, tags=()):
+        value = self._to_number(name, value)
+        if value is None:
+            return
+        key = (name, tags if type(tags) is tuple else tuple(tags))
+        with self._lock:
+            values = self._distributions.get(key)
+            if values is None:
+                values = self._distributions[key] = []
+            values.append(value)
+
+    @staticmethod
+    def _to_number(name, value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            logger.error(f"Invalid value {value!r} for forwarder metric {name}")
+            return None
+
+    @contextmanager
+    def timer(self, name, tags=()):
+        """Record the duration of the block in milliseconds"""
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.distribution(name, (monotonic() - start) * 1000, tags)
+
+    def flush(self):
+        """Submit the recorded metrics. Returns the number of series submitted."""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges, self._gauges = self._gauges, {}
+            distributions, self._distributions = self._distributions, {}
+
+        series = [(key, [count]) for key, count in counters.items()]
+        series += [(key, [value]) for key, value in gauges.items()]
+        series += distributions.items()
+        if series and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Submitting {len(series)} forwarder telemetry series")
+
+        timestamp = time()
+        base_tags = list(DD_FORWARDER_TELEMETRY_TAGS)
+        for (name, tags), values in series:
+            name = f"{DD_FORWARDER_TELEMETRY_NAMESPACE_PREFIX}.{name}"
+            tags = base_tags + list(tags)
+            for value in values:
+                submit_distribution_point(name, value, timestamp, tags)
+        return len(series)
+
+
+telemetry_registry = TelemetryRegistry()
+
+
+def send_log_metrics(metrics):
+    """Submit custom metrics sent via logs, as distributions.
+
+    Each metric is a single point, submitted with lambda_metric at its own
+    timestamp. Returns the metrics that were not submitted.
+    """
+    if not DD_SUBMIT_ENHANCED_METRICS:
+        return []
+
+    failed_metrics = []
+    for metric in metrics:
+        try:
+            name, value, timestamp = metric["m"], float(metric["v"]), metric["e"]
+            tags = list(metric["t"] or ())
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Invalid metric {metric}: {e}")
+            failed_metrics.append(metric)
+            continue
+
+        if not submit_distribution_point(name, value, timestamp, tags):
+            failed_metrics.append(metric)
+
+    return failed_metrics
+
+
+def submit_distribution_point(name, value, timestamp, tags):
+    """Submit a point at a timestamp in seconds with lambda_metric
+
+    lambda_metric routes it like any metric of the Datadog Lambda layer: to the
+    extension when it runs, to the logs with DD_FLUSH_TO_LOG, and otherwise to
+    the layer's buffer, submitted once at the end of the invocation. Points
+    older than 4 hours are dropped, as the intake would reject them.
+
+    Returns False if the point could not be submitted.
+    """
+    if timestamp < time() - DISTRIBUTION_MAX_AGE_SECONDS:
+        logger.warning(f"Dropping point of {name}: older than 4 hours")
+        return True
+
+    try:
+        lambda_metric(name, value, timestamp=timestamp, tags=tags)
+    except Exception as e:
+        logger.error(f"Exception while submitting metric {name}: {e}")
+        return False
+    return True
@@ -0,0 +1,38 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import aws_clients
+from aws_clients import get_client, get_resource
+
+
+@patch.dict(aws_clients._clients, clear=True)
+class TestAwsClients(unittest.TestCase):
+    @patch("aws_clients._create", side_effect=lambda *args: MagicMock())
+    def test_clients_created_once_per_service_and_config(self, mock_create):
+        s3_client = get_client("s3")
+
+        self.assertIs(get_client("s3"), s3_client)
+        self.assertIsNot(get_client("s3", "eu-west-1"), s3_client)
+        self.assertIsNot(get_resource("s3"), s3_client)
+        self.assertIs(
+            get_client("logs", retries={"mode": "standard"}),
+            get_client("logs", retries={"mode": "standard"}),
+        )
+        self.assertEqual(mock_create.call_count, 4)
+
+    @patch("boto3.DEFAULT_SESSION")
+    def test_clients_share_the_default_session(self, mock_session):
+        get_client("logs", retries={"mode": "standard"})
+        get_resource("s3")
+
+        service_name = mock_session.client.call_args.args[0]
+        config = mock_session.client.call_args.kwargs["config"]
+        self.assertEqual(service_name, "logs")
+        self.assertEqual(config.retries, {"mode": "standard"})
+        mock_session.resource.assert_called_once_with(
+            "s3", region_name=None, config=None
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -292,6 +292,32 @@ class TestLambdaCustomizedLogGroup(unittest.TestCase):
         )
 
 
+class TestPrefetchTags(unittest.TestCase):
+    def test_prefetch_tags_collects_distinct_arns(self):
+        context = Context(
+            invoked_function_arn="arn:aws:lambda:us-east-1:12345678910:function:forwarder"
+        )
+        cache_layer = MagicMock()
+        aws_handler = AwsLogsHandler(context, cache_layer)
+
+        aws_handler.prefetch_tags(
+            [
+                {"logGroup": "/aws/lambda/Foo", "logStream": "stream"},
+                {"logGroup": "/aws/lambda/Foo", "logStream": "other-stream"},
+                {"logGroup": "my-log-group", "logStream": "stream"},
+                {"logGroup": "", "logStream": ""},
+            ]
+        )
+
+        cache_layer.prefetch.assert_called_once_with(
+            log_group_arns={
+                "arn:aws:logs:us-east-1:12345678910:log-group:/aws/lambda/Foo",
+                "arn:aws:logs:us-east-1:12345678910:log-group:my-log-group",
+            },
+            lambda_arns={"arn:aws:lambda:us-east-1:12345678910:function:foo"},
+        )
+
+
 class TestAwsPartitionExtraction(unittest.TestCase):
     def test_get_log_group_aws_partition(self):
         # default partition
@@ -0,0 +1,168 @@
+import io
+import json
+import unittest
+from hashlib import md5
+from time import time
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+
+from caching.common import deserialize_tags_cache
+from caching.lambda_cache import LambdaTagsCache
+from settings import DD_S3_CACHE_LOCK_TTL_SECONDS
+
+
+class FakeS3Object:
+    """In-memory stand-in for a boto3 S3 Object honouring conditional writes"""
+
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+
+    def put(self, Body, IfNoneMatch=None, IfMatch=None):
+        current = self.store.get(self.key)
+        if IfNoneMatch == "*" and current is not None:
+            raise ClientError(
+                {"Error": {"Code": "PreconditionFailed", "Message": ""}}, "PutObject"
+            )
+        if IfMatch is not None and (current is None or current[1] != IfMatch):
+            raise ClientError(
+                {"Error": {"Code": "PreconditionFailed", "Message": ""}}, "PutObject"
+            )
+        etag = md5(Body + str(len(self.store)).encode()).hexdigest()
+        self.store[self.key] = (Body, etag)
+        return {"ETag": etag}
+
+    def get(self):
+        if self.key not in self.store:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": ""}}, "Get")
+        body, etag = self.store[self.key]
+        return {
+            "Body": io.BytesIO(body),
+            "ETag": etag,
+            "ResponseMetadata": {
+                "HTTPHeaders": {"last-modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+            },
+        }
+
+    def delete(self, IfMatch=None):
+        current = self.store.get(self.key)
+        if IfMatch is not None and current is not None and current[1] != IfMatch:
+            raise ClientError(
+                {"Error": {"Code": "PreconditionFailed", "Message": ""}}, "DeleteObject"
+            )
+        self.store.pop(self.key, None)
+
+
+class FakeS3Resource:
+    def __init__(self):
+        self.store = {}
+
+    def Object(self, bucket, key):
+        return FakeS3Object(self.store, key)
+
+
+@patch("caching.base_tags_cache.send_forwarder_internal_metrics", MagicMock())
+class TestS3CacheLock(unittest.TestCase):
+    def setUp(self):
+        self.s3 = FakeS3Resource()
+        self.caches = []
+        for _ in range(2):
+            cache = LambdaTagsCache("prefix")
+            cache.s3_client = self.s3
+            self.caches.append(cache)
+
+    def lock_key(self):
+        return self.caches[0].get_cache_lock_with_prefix()
+
+    def test_only_one_forwarder_acquires_the_lock(self):
+        first, second = self.caches
+        self.assertTrue(first.acquire_s3_cache_lock())
+        self.assertFalse(second.acquire_s3_cache_lock())
+
+        first.release_s3_cache_lock()
+        self.assertNotIn(self.lock_key(), self.s3.store)
+        self.assertTrue(second.acquire_s3_cache_lock())
+
+    def test_expired_lock_is_taken_over_and_fences_the_previous_owner(self):
+        first, second = self.caches
+        self.assertTrue(first.acquire_s3_cache_lock())
+
+        with patch("caching.base_tags_cache.time", return_value=10**12):
+            self.assertTrue(second.acquire_s3_cache_lock())
+
+        # the previous owner can neither renew, write the cache nor release
+        self.assertFalse(first.renew_s3_cache_lock(force=True))
+        first.write_cache_to_s3({"arn": ["team:a"]})
+        self.assertNotIn(first.get_cache_name_with_prefix(), self.s3.store)
+        first.release_s3_cache_lock()
+        self.assertIn(self.lock_key(), self.s3.store)
+
+        second.write_cache_to_s3({"arn": ["team:a"]})
+        body, _ = self.s3.store[second.get_cache_name_with_prefix()]
+        self.assertEqual(deserialize_tags_cache(body)[0], {"arn": ["team:a"]})
+
+    def test_lock_taken_over_after_read_is_not_released(self):
+        first, second = self.caches
+        self.assertTrue(first.acquire_s3_cache_lock())
+        read_lease = first._get_s3_cache_lock
+
+        def read_then_take_over(cache_lock_object):
+            lease = read_lease(cache_lock_object)
+            with patch("caching.base_tags_cache.time", return_value=10**12):
+                self.assertTrue(second.acquire_s3_cache_lock())
+            return lease
+
+        with patch.object(first, "_get_s3_cache_lock", read_then_take_over):
+            first.release_s3_cache_lock()
+
+        lease = json.loads(self.s3.store[self.lock_key()][0])
+        self.assertEqual(lease["owner"], second.cache_lock_owner)
+        self.assertIsNone(first.cache_lock_owner)
+
+    def test_tags_fetch_stops_when_lock_is_lost(self):
+        first, second = self.caches
+        now = [time()]
+        pages = [{"ResourceTagMappingList": []} for _ in range(3)]
+        fetched_pages = []
+
+        def paginate(**kwargs):
+            for page in pages:
+                fetched_pages.append(page)
+                yield page
+                # the lease expires and is taken over between two pages
+                now[0] += DD_S3_CACHE_LOCK_TTL_SECONDS + 1
+                self.assertTrue(second.acquire_s3_cache_lock())
+
+        paginator = MagicMock()
+        paginator.paginate.side_effect = paginate
+        first.get_resources_paginator = MagicMock(return_value=paginator)
+
+        with patch("caching.lambda_cache.send_forwarder_internal_metrics"), patch(
+            "caching.base_tags_cache.time", side_effect=lambda: now[0]
+        ):
+            self.assertTrue(first.acquire_s3_cache_lock())
+            success, _ = first.build_tags_cache()
+
+        self.assertFalse(success)
+        self.assertEqual(len(fetched_pages), 2)
+
+    def test_renew_extends_the_lease(self):
+        first, _ = self.caches
+        self.assertTrue(first.acquire_s3_cache_lock())
+        lease = json.loads(self.s3.store[self.lock_key()][0])
+
+        with patch("caching.base_tags_cache.time", return_value=lease["expires_at"]):
+            self.assertTrue(first.renew_s3_cache_lock())
+
+        renewed_lease = json.loads(self.s3.store[self.lock_key()][0])
+        self.assertEqual(renewed_lease["owner"], lease["owner"])
+        self.assertGreater(renewed_lease["expires_at"], lease["expires_at"])
+
+    def test_legacy_lock_file_expires_from_last_modified(self):
+        self.s3.store[self.lock_key()] = (b"lock", "legacy-etag")
+        self.assertTrue(self.caches[0].acquire_s3_cache_lock())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,11 @@
+import json
 import unittest
+from unittest.mock import MagicMock, patch
+
+from caching.cache_layer import CacheLayer
 from caching.common import (
+    deserialize_tags_cache,
+    serialize_tags_cache,
     sanitize_aws_tag_string,
     parse_get_resources_response_for_tags_by_arn,
     get_dd_tag_string_from_aws_dict,
@@ -94,6 +100,73 @@ class TestCaching(unittest.TestCase):
             },
         )
 
+    def test_tags_cache_serialization_round_trip(self):
+        tags_by_arn = {
+            "arn:aws:lambda:us-east-1:123497598159:function:a": ["env:prod", "team:x"],
+            "arn:aws:lambda:us-east-1:123497598159:function:b": ["env:prod"],
+            "arn:aws:lambda:us-east-1:123497598159:function:c": [],
+        }
+        body = serialize_tags_cache(tags_by_arn)
+
+        self.assertEqual(body[:2], b"\x1f\x8b")
+        self.assertEqual(deserialize_tags_cache(body), (tags_by_arn, {}))
+        self.assertEqual(
+            deserialize_tags_cache(serialize_tags_cache(tags_by_arn, {"arn:a": 1})),
+            (tags_by_arn, {"arn:a": 1}),
+        )
+
+    def test_tags_cache_deserializes_legacy_json(self):
+        self.assertEqual(
+            deserialize_tags_cache(json.dumps({"arn:a": ["env:prod"]}).encode()),
+            ({"arn:a": ["env:prod"]}, {}),
+        )
+        self.assertEqual(
+            deserialize_tags_cache(
+                json.dumps(
+                    {"arn:a": {"tags": ["env:prod"], "last_modified": 1}}
+                ).encode()
+            ),
+            ({"arn:a": ["env:prod"]}, {"arn:a": 1}),
+        )
+
+
+@patch("caching.cache_layer.get_fetch_lambda_tags", return_value=True)
+@patch("caching.cache_layer.get_fetch_log_group_tags", return_value=True)
+class TestCacheLayerPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.cache_layer = CacheLayer.__new__(CacheLayer)
+        self.cache_layer._cloudwatch_log_group_cache = MagicMock()
+        self.cache_layer._lambda_cache = MagicMock()
+
+    def test_prefetch_looks_up_each_log_group_and_lambda_cache_once(self, *_):
+        self.cache_layer.prefetch(
+            log_group_arns=["log-group-a", "log-group-b", "log-group-a"],
+            lambda_arns=["lambda-a", "lambda-b"],
+        )
+
+        log_group_cache = self.cache_layer._cloudwatch_log_group_cache
+        self.assertEqual(log_group_cache.get.call_count, 2)
+        self.assertEqual(
+            {c.args[0] for c in log_group_cache.get.call_args_list},
+            {"log-group-a", "log-group-b"},
+        )
+        self.assertEqual(self.cache_layer._lambda_cache.get.call_count, 1)
+
+    def test_prefetch_skips_single_lookup(self, *_):
+        self.cache_layer.prefetch(log_group_arns=["log-group-a"])
+        self.cache_layer._cloudwatch_log_group_cache.get.assert_not_called()
+
+    def test_prefetch_skips_disabled_caches(self, mock_fetch_log_group_tags, *_):
+        mock_fetch_log_group_tags.return_value = False
+        self.cache_layer.prefetch(
+            log_group_arns=["log-group-a", "log-group-b"], lambda_arns=["lambda-a"]
+        )
+        self.cache_layer._cloudwatch_log_group_cache.get.assert_not_called()
+
+    def test_prefetch_swallows_lookup_errors(self, *_):
+        self.cache_layer._cloudwatch_log_group_cache.get.side_effect = Exception("boom")
+        self.cache_layer.prefetch(log_group_arns=["log-group-a", "log-group-b"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -104,15 +104,11 @@ class TestS3CloudwatchParsing(unittest.TestCase):
         )
 
     @patch("caching.cloudwatch_log_group_cache.CloudwatchLogGroupTagsCache.__init__")
-    @patch("caching.base_tags_cache.boto3")
-    @patch("steps.handlers.s3_handler.boto3")
-    @patch("lambda_function.boto3")
-    def test_s3_cloudtrail_pasing_and_enrichment(
-        self, lambda_boto3, parsing_boto3, cache_boto3, mock_cache_init
-    ):
+    @patch("steps.handlers.s3_handler.get_client")
+    def test_s3_cloudtrail_pasing_and_enrichment(self, get_client, mock_cache_init):
         context = Context()
-        boto3 = parsing_boto3.client()
-        boto3.get_object.return_value = {"Body": self.get_test_data_gzipped()}
+        s3_client = get_client()
+        s3_client.get_object.return_value = {"Body": self.get_test_data_gzipped()}
 
         payload = {
             "s3": {
@@ -0,0 +1,157 @@
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import time
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+
+from caching.cloudwatch_log_group_cache import CloudwatchLogGroupTagsCache
+from caching.common import deserialize_tags_cache, serialize_tags_cache
+
+LOG_GROUP_ARN = "arn:aws:logs:us-east-1:123456789012:log-group:/aws/lambda/foo"
+OTHER_LOG_GROUP_ARN = "arn:aws:logs:us-east-1:123456789012:log-group:/aws/lambda/bar"
+
+
+def s3_response(body):
+    body_mock = MagicMock()
+    body_mock.read.return_value = json.dumps(body).encode("UTF-8")
+    return {"Body": body_mock, "LastModified": datetime.now(timezone.utc)}
+
+
+def no_such_key():
+    return ClientError({"Error": {"Code": "NoSuchKey", "Message": ""}}, "GetObject")
+
+
+@patch("caching.cloudwatch_log_group_cache.send_forwarder_internal_metrics")
+@patch("caching.cloudwatch_log_group_cache.get_fetch_log_group_tags")
+class TestCloudwatchLogGroupTagsCache(unittest.TestCase):
+    def setUp(self):
+        self.mock_s3 = MagicMock()
+        self.mock_logs = MagicMock()
+        self.cache = CloudwatchLogGroupTagsCache("prefix")
+        self.cache.cloudwatch_logs_client = self.mock_logs
+        self.cache.s3_client = self.mock_s3
+        self.cache.shard_count = 4
+
+    def test_shard_hit_serves_all_log_groups_of_the_shard(self, mock_fetch, _):
+        mock_fetch.return_value = True
+        self.cache.shard_count = 1
+        now = int(time())
+        self.mock_s3.get_object.return_value = s3_response(
+            {
+                LOG_GROUP_ARN: {"tags": ["team:a"], "last_modified": now},
+                OTHER_LOG_GROUP_ARN: {"tags": ["team:b"], "last_modified": now},
+            }
+        )
+
+        self.assertEqual(self.cache.get(LOG_GROUP_ARN), ["team:a"])
+        self.assertEqual(self.cache.get(OTHER_LOG_GROUP_ARN), ["team:b"])
+        self.mock_s3.get_object.assert_called_once_with(
+            Bucket=self.cache.bucket_name,
+            Key="cache/log-group/prefix/shards/0000.json",
+        )
+        self.mock_logs.list_tags_for_resource.assert_not_called()
+
+    def test_missing_log_group_is_fetched_once_and_flushed(self, mock_fetch, _):
+        mock_fetch.return_value = True
+        self.mock_s3.get_object.side_effect = no_such_key()
+        self.mock_logs.list_tags_for_resource.return_value = {"tags": {"Team": "A"}}
+
+        self.assertEqual(self.cache.get(LOG_GROUP_ARN), ["team:a"])
+        self.assertEqual(self.cache.get(LOG_GROUP_ARN), ["team:a"])
+        self.mock_logs.list_tags_for_resource.assert_called_once()
+        self.mock_s3.put_object.assert_not_called()
+
+        self.cache.flush()
+
+        self.mock_s3.put_object.assert_called_once()
+        call_kwargs = self.mock_s3.put_object.call_args[1]
+        shard_id = self.cache._get_shard_id(LOG_GROUP_ARN)
+        self.assertEqual(
+            call_kwargs["Key"], f"cache/log-group/prefix/shards/{shard_id:04d}.json"
+        )
+        tags_by_arn, last_modified_by_arn = deserialize_tags_cache(call_kwargs["Body"])
+        self.assertEqual(tags_by_arn, {LOG_GROUP_ARN: ["team:a"]})
+        self.assertIn(LOG_GROUP_ARN, last_modified_by_arn)
+        self.assertEqual(self.cache.pending_writes, {})
+
+    def test_flush_merges_entries_written_concurrently(self, mock_fetch, _):
+        mock_fetch.return_value = True
+        self.cache.shard_count = 1
+        now = int(time())
+        self.mock_s3.get_object.side_effect = [
+            no_such_key(),
+            s3_response(
+                {OTHER_LOG_GROUP_ARN: {"tags": ["team:b"], "last_modified": now}}
+            ),
+        ]
+        self.mock_logs.list_tags_for_resource.return_value = {"tags": {"team": "a"}}
+
+        self.cache.get(LOG_GROUP_ARN)
+        self.cache.flush()
+
+        tags_by_arn, _ = deserialize_tags_cache(
+            self.mock_s3.put_object.call_args[1]["Body"]
+        )
+        self.assertEqual(
+            tags_by_arn, {LOG_GROUP_ARN: ["team:a"], OTHER_LOG_GROUP_ARN: ["team:b"]}
+        )
+
+    def test_expired_shard_entry_is_refetched(self, mock_fetch, _):
+        mock_fetch.return_value = True
+        self.mock_s3.get_object.return_value = s3_response(
+            {LOG_GROUP_ARN: {"tags": ["team:old"], "last_modified": 1}}
+        )
+        self.mock_logs.list_tags_for_resource.return_value = {"tags": {"team": "new"}}
+
+        self.assertEqual(self.cache.get(LOG_GROUP_ARN), ["team:new"])
+
+    def test_flush_without_updates_does_not_write(self, mock_fetch, _):
+        mock_fetch.return_value = True
+        self.cache.flush()
+        self.mock_s3.get_object.assert_not_called()
+        self.mock_s3.put_object.assert_not_called()
+
+    def test_concurrent_lookups_load_a_shard_once(self, mock_fetch, _):
+        mock_fetch.return_value = True
+        self.cache.shard_count = 1
+        now = int(time())
+        self.mock_s3.get_object.return_value = s3_response(
+            {
+                LOG_GROUP_ARN: {"tags": ["team:a"], "last_modified": now},
+                OTHER_LOG_GROUP_ARN: {"tags": ["team:b"], "last_modified": now},
+            }
+        )
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(
+                executor.map(self.cache.get, [LOG_GROUP_ARN, OTHER_LOG_GROUP_ARN])
+            )
+
+        self.assertEqual(results, [["team:a"], ["team:b"]])
+        self.mock_s3.get_object.assert_called_once()
+
+    def test_compact_shard_is_read(self, mock_fetch, _):
+        mock_fetch.return_value = True
+        body_mock = MagicMock()
+        body_mock.read.return_value = serialize_tags_cache(
+            {LOG_GROUP_ARN: ["team:a"]}, {LOG_GROUP_ARN: int(time())}
+        )
+        self.mock_s3.get_object.return_value = {
+            "Body": body_mock,
+            "LastModified": datetime.now(timezone.utc),
+        }
+
+        self.assertEqual(self.cache.get(LOG_GROUP_ARN), ["team:a"])
+        self.mock_logs.list_tags_for_resource.assert_not_called()
+
+    def test_no_fetch_when_disabled(self, mock_fetch, _):
+        mock_fetch.return_value = False
+        self.assertEqual(self.cache.get(LOG_GROUP_ARN), [])
+        self.mock_s3.get_object.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -37,6 +37,31 @@ class TestDatadogHTTPClient(unittest.TestCase):
         with self.assertRaisesRegex(Exception, "403 Client Error"):
             self._client(session).send(['{"message":"hello"}'])
 
+    def test_send_raises_retriable_exception_when_throttled(self):
+        from logs.exceptions import RetriableException
+
+        response = MagicMock()
+        response.status_code = 429
+        response.headers = {"Retry-After": "7"}
+        future = MagicMock()
+        future.result.return_value = response
+        session = MagicMock()
+        session.post.return_value = future
+
+        with self.assertRaises(RetriableException) as context:
+            self._client(session).send(['{"message":"hello"}'])
+
+        self.assertEqual(context.exception.retry_after, 7)
+        response.raise_for_status.assert_not_called()
+
+    def test_parse_retry_after(self):
+        from logs.datadog_http_client import parse_retry_after
+
+        self.assertEqual(parse_retry_after("12"), 12)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+
     def test_send_returns_after_successful_response(self):
         response = MagicMock()
         future = MagicMock()
@@ -55,6 +80,7 @@ class TestForwarderFailedLogs(unittest.TestCase):
     @patch("forwarder.DD_STORE_FAILED_EVENTS", True)
     def test_forward_logs_stores_failed_batch(self, mock_http_client, mock_send_metric):
         from forwarder import Forwarder
+        from logs.circuit_breaker import CircuitBreaker
         from retry.enums import RetryPrefix
 
         client = MagicMock()
@@ -64,6 +90,7 @@ class TestForwarderFailedLogs(unittest.TestCase):
 
         forwarder = Forwarder.__new__(Forwarder)
         forwarder.storage = MagicMock()
+        forwarder._intake_breaker = CircuitBreaker(5, 30)
         forwarder._scrubber = MagicMock()
         forwarder._matcher = MagicMock()
         forwarder._matcher.match.return_value = True
@@ -75,7 +102,7 @@ class TestForwarderFailedLogs(unittest.TestCase):
         forwarder.storage.store_data.assert_called_once_with(
             RetryPrefix.LOGS, ['"hello"']
         )
-        mock_send_metric.assert_any_call("logs_failed", ['"hello"'])
+        mock_send_metric.assert_any_call("logs_failed", 1)
         mock_send_metric.assert_any_call("logs_forwarded", 0)
 
 
@@ -0,0 +1,165 @@
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from retry.disk_storage import DiskStorage
+from retry.write_behind_storage import WriteBehindStorage
+
+
+class TestDiskStorage(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.storage = DiskStorage("test_function_prefix", path=self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_store_and_get_data(self):
+        self.assertTrue(self.storage.store_data("logs", [{"message": "hello"}]))
+        self.assertTrue(self.storage.store_data("metrics", [{"m": "metric"}]))
+
+        result = self.storage.get_data("logs")
+
+        self.assertEqual(list(result.values()), [[{"message": "hello"}]])
+        self.assertTrue(DiskStorage.is_disk_key(list(result)[0]))
+
+    def test_data_survives_new_instance(self):
+        self.storage.store_data("logs", ["hello"])
+
+        storage = DiskStorage("test_function_prefix", path=self.temp_dir.name)
+
+        self.assertEqual(list(storage.get_data("logs").values()), [["hello"]])
+
+    def test_iter_all_data_in_prefix_order(self):
+        self.storage.store_data("logs", ["log"])
+        self.storage.store_data("metrics", ["metric"])
+
+        result = [
+            (prefix, data)
+            for prefix, _, data in self.storage.iter_all_data(["metrics", "logs"])
+        ]
+
+        self.assertEqual(result, [("metrics", ["metric"]), ("logs", ["log"])])
+
+    def test_delete_data(self):
+        self.storage.store_data("logs", ["first"])
+        self.storage.store_data("logs", ["second"])
+        first_key = next(
+            key
+            for key, data in self.storage.get_data("logs").items()
+            if data == ["first"]
+        )
+
+        self.storage.delete_data(first_key)
+
+        self.assertEqual(list(self.storage.get_data("logs").values()), [["second"]])
+
+    def test_flush_compacts_log(self):
+        for i in range(10):
+            self.storage.store_data("logs", [i])
+        for key in list(self.storage.get_data("logs"))[:8]:
+            self.storage.delete_data(key)
+
+        self.storage.flush()
+
+        segments = self.storage._segments()
+        self.assertEqual(len(segments), 1)
+        _, live_bytes, total_bytes = self.storage._scan()
+        self.assertEqual(live_bytes, total_bytes)
+        self.assertEqual(sorted(self.storage.get_data("logs").values()), [[8], [9]])
+
+    def test_flush_removes_segments_once_all_deleted(self):
+        self.storage.store_data("logs", ["hello"])
+        for key in self.storage.get_data("logs"):
+            self.storage.delete_data(key)
+
+        self.storage.flush()
+
+        self.assertEqual(self.storage._segments(), [])
+
+    @patch("retry.disk_storage.DISK_SEGMENT_MAX_BYTES", 10)
+    def test_segments_rolled_by_size(self):
+        self.storage.store_data("logs", ["first"])
+        self.storage.store_data("logs", ["second"])
+
+        self.assertEqual(len(self.storage._segments()), 2)
+        self.assertEqual(len(self.storage.get_data("logs")), 2)
+
+    @patch("retry.disk_storage.DD_RETRY_DISK_MAX_BYTES", 100)
+    def test_store_data_fails_when_disk_full(self):
+        self.assertFalse(self.storage.store_data("logs", ["x" * 200]))
+        self.assertEqual(self.storage.get_data("logs"), {})
+
+    def test_torn_write_ignored(self):
+        self.storage.store_data("logs", ["hello"])
+        with open(self.storage._segments()[-1], "ab") as segment_file:
+            segment_file.write(b'{"op": "put", "key": "disk:torn"')
+
+        self.assertEqual(list(self.storage.get_data("logs").values()), [["hello"]])
+
+
+class TestWriteBehindStorage(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.local = DiskStorage("test_function_prefix", path=self.temp_dir.name)
+        self.remote = MagicMock()
+        self.remote.iter_all_data.return_value = iter([("logs", "s3_key", ["remote"])])
+        self.storage = WriteBehindStorage(self.local, self.remote)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_uploaded_data_deleted_from_disk(self):
+        self.remote.store_data.return_value = True
+
+        self.assertTrue(self.storage.store_data("logs", ["hello"]))
+        self.storage.flush()
+
+        self.remote.store_data.assert_called_once_with("logs", ["hello"])
+        self.assertEqual(self.local.get_data("logs"), {})
+        self.assertEqual(self.local._segments(), [])
+
+    def test_data_not_uploaded_retried_from_disk(self):
+        self.remote.store_data.return_value = False
+
+        self.storage.store_data("logs", ["hello"])
+        result = list(self.storage.iter_all_data(["logs"]))
+
+        self.assertEqual(len(result), 2)
+        prefix, disk_key, data = result[0]
+        self.assertEqual((prefix, data), ("logs", ["hello"]))
+        self.assertEqual(result[1], ("logs", "s3_key", ["remote"]))
+
+        self.storage.delete_data(disk_key)
+        self.storage.delete_data("s3_key")
+        self.assertEqual(self.local.get_data("logs"), {})
+        self.remote.delete_data.assert_called_once_with("s3_key")
+
+    def test_upload_stored_while_waiting_is_kept(self):
+        def store_remotely(prefix, data):
+            # e.g. the trace thread failing while the logs path flushes
+            if data == ["first"]:
+                self.storage.store_data("logs", ["second"])
+            return True
+
+        self.remote.store_data.side_effect = store_remotely
+
+        self.storage.store_data("logs", ["first"])
+        self.storage.flush()
+        self.assertEqual(len(self.storage._uploads), 1)
+
+        self.storage.flush()
+        self.assertEqual(self.storage._uploads, {})
+        self.assertEqual(self.local.get_data("logs"), {})
+
+    @patch("retry.disk_storage.DD_RETRY_DISK_MAX_BYTES", 0)
+    def test_stores_remotely_when_disk_full(self):
+        self.remote.store_data.return_value = True
+
+        self.assertTrue(self.storage.store_data("logs", ["hello"]))
+
+        self.remote.store_data.assert_called_once_with("logs", ["hello"])
+
+
+if __name__ == "__main__":
+    unittest.main()
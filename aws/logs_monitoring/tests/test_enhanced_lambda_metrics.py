@@ -9,10 +9,15 @@ from unittest.mock import MagicMock, patch
 
 from approvaltests.approvals import verify_as_json
 
+from caching.cache_layer import CacheLayer
 from caching.lambda_cache import LambdaTagsCache
 from enhanced_lambda_metrics import (
+    OUT_OF_MEMORY_ERROR_STRINGS,
+    OUT_OF_MEMORY_MARKERS,
     create_out_of_memory_enhanced_metric,
-    generate_enhanced_lambda_metrics,
+    create_timeout_enhanced_metric,
+    EnhancedMetricsTap,
+    get_candidate_metric_parsers,
     parse_lambda_tags_from_arn,
     parse_metrics_from_json_report_log,
     parse_metrics_from_report_log,
@@ -200,29 +205,87 @@ class TestEnhancedLambdaMetrics(unittest.TestCase):
         success_message = "Success!"
         self.assertEqual(len(create_out_of_memory_enhanced_metric(success_message)), 0)
 
-    def test_generate_enhanced_lambda_metrics_json(
-        self,
-    ):
-        tags_cache = LambdaTagsCache("")
-        tags_cache.get = MagicMock(return_value=[])
+    def test_out_of_memory_error_strings_have_a_marker(self):
+        for error in OUT_OF_MEMORY_ERROR_STRINGS:
+            self.assertTrue(any(marker in error for marker in OUT_OF_MEMORY_MARKERS))
 
-        logs_input = {
-            "message": json.dumps(
-                {
-                    "time": "2024-10-04T00:36:35.800Z",
-                    "type": "platform.report",
-                    "record": {
-                        "requestId": "4d789d71-2f2c-4c66-a4b5-531a0223233d",
-                        "metrics": {
-                            "durationMs": 3470.65,
-                            "billedDurationMs": 3500,
-                            "memorySizeMB": 128,
-                            "maxMemoryUsedMB": 89,
-                        },
-                        "status": "success",
-                    },
-                }
+    def test_get_candidate_metric_parsers(self):
+        self.assertEqual(
+            get_candidate_metric_parsers(
+                "2020-03-05T16:30:36.113Z\tf08bb4c8\tINFO\tprocessing order"
             ),
+            [],
+        )
+        self.assertEqual(
+            get_candidate_metric_parsers(self.standard_json_report),
+            [parse_metrics_from_json_report_log, create_out_of_memory_enhanced_metric],
+        )
+        self.assertEqual(
+            get_candidate_metric_parsers(self.standard_report),
+            [parse_metrics_from_report_log, create_out_of_memory_enhanced_metric],
+        )
+        self.assertEqual(
+            get_candidate_metric_parsers("Task timed out after 3.00 seconds"),
+            [create_timeout_enhanced_metric],
+        )
+        self.assertEqual(
+            get_candidate_metric_parsers("java.lang.OutOfMemoryError"),
+            [create_out_of_memory_enhanced_metric],
+        )
+
+    @patch("caching.base_tags_cache.send_forwarder_internal_metrics")
+    @patch("caching.lambda_cache.send_forwarder_internal_metrics")
+    @patch.dict(os.environ, {"DD_FETCH_LAMBDA_TAGS": "true"})
+    def test_refresh_uses_stale_s3_cache_when_lock_not_acquired(self, mock1, mock2):
+        """When S3 cache is expired and the rebuild lock is held by another
+        invocation, _refresh must fall back to the non-empty stale cache
+        rather than leaving tags_by_id empty."""
+        reload(sys.modules["settings"])
+
+        stale_cache = {
+            "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us": [
+                "stage:usw2-prd",
+                "environment:usw2-prd",
+            ]
+        }
+        tags_cache = LambdaTagsCache("")
+        tags_cache.get_cache_from_s3 = MagicMock(return_value=(stale_cache, 1000))
+        tags_cache.acquire_s3_cache_lock = MagicMock(return_value=False)
+        tags_cache.build_tags_cache = MagicMock()
+        tags_cache.write_cache_to_s3 = MagicMock()
+
+        tags_cache._refresh()
+
+        tags_cache.build_tags_cache.assert_not_called()
+        tags_cache.write_cache_to_s3.assert_not_called()
+        assert tags_cache.tags_by_id == stale_cache
+        assert tags_cache.get(
+            "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us"
+        ) == ["stage:usw2-prd", "environment:usw2-prd"]
+
+
+# Timestamp of the logs, in milliseconds, and a time shortly after it
+LOG_TIMESTAMP = 1591714946151
+NOW = 1591715000
+REPORT_MESSAGE = "REPORT RequestId: fe1467d6-1458-4e20-8e40-9aaa4be7a0f4\tDuration: 3470.65 ms\tBilled Duration: 3500 ms\tMemory Size: 128 MB\tMax Memory Used: 89 MB\t\nXRAY TraceId: 1-5d8bba5a-dc2932496a65bab91d2d42d4\tSegmentId: 5ff79d2a06b82ad6\tSampled: true\t\n"
+
+
+@patch("telemetry.lambda_metric", create=True)
+@patch("telemetry.time", new=lambda: NOW)
+@patch("enhanced_lambda_metrics.DD_SUBMIT_ENHANCED_METRICS", True)
+class TestEnhancedMetricsTap(unittest.TestCase):
+    arn = "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us"
+
+    def setUp(self):
+        self.cache_layer = MagicMock()
+        self.cache_layer.get_lambda_tags_bundle.return_value.enriched_tags = [
+            "functionname:post-coupon-prod-us",
+            "team:coupons",
+        ]
+
+    def make_log(self, message, timestamp=LOG_TIMESTAMP, arn=None):
+        return {
+            "message": message,
             "aws": {
                 "awslogs": {
                     "logGroup": "/aws/lambda/post-coupon-prod-us",
@@ -234,119 +297,165 @@ class TestEnhancedLambdaMetrics(unittest.TestCase):
                     "arn:aws:lambda:us-east-1:172597598159:function:collect_logs_datadog_demo"
                 ),
             },
-            "lambda": {
-                "arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us"
-                )
-            },
-            "timestamp": 10000,
+            "lambda": {"arn": arn or self.arn},
+            "timestamp": timestamp,
         }
 
-        generated_metrics = generate_enhanced_lambda_metrics(logs_input, tags_cache)
-        verify_as_json(generated_metrics)
+    def make_report_log(self, duration, timestamp):
+        return self.make_log(
+            f"REPORT RequestId: fe1467d6-1458-4e20-8e40-9aaa4be7a0f4\tDuration: {duration} ms\t"
+            "Billed Duration: 3500 ms\tMemory Size: 128 MB\tMax Memory Used: 89 MB\t\n",
+            timestamp,
+        )
+
+    def make_cache_layer(self, tags_cache):
+        cache_layer = CacheLayer("")
+        cache_layer._lambda_cache = tags_cache
+        return cache_layer
+
+    def get_points(self, mock_lambda_metric, name):
+        """Returns the submitted values of a metric, {(timestamp, tags): [values]}"""
+        points = {}
+        for call in mock_lambda_metric.call_args_list:
+            if call.args[0] == name:
+                key = (call.kwargs["timestamp"], tuple(call.kwargs["tags"]))
+                points.setdefault(key, []).append(call.args[1])
+        return points
+
+    def get_submitted_metrics(self, mock_lambda_metric):
+        return [
+            {
+                "name": call.args[0],
+                "value": call.args[1],
+                "timestamp": call.kwargs["timestamp"],
+                "tags": call.kwargs["tags"],
+            }
+            for call in mock_lambda_metric.call_args_list
+        ]
+
+    def test_points_submitted_at_their_log_timestamp_on_flush(self, mock_lambda_metric):
+        tap = EnhancedMetricsTap(self.cache_layer)
+
+        # Log timestamps are in milliseconds
+        tap(self.make_report_log(1000, LOG_TIMESTAMP))
+        tap(self.make_report_log(2000, LOG_TIMESTAMP + 1000))
+        tap(self.make_report_log(3000, LOG_TIMESTAMP + 1000))
+        tap({"message": "not a lambda log"})
+        mock_lambda_metric.assert_not_called()
+        tap.flush()
+
+        self.cache_layer.get_lambda_tags_bundle.assert_called_with(self.arn)
+        tags = (
+            "memorysize:128",
+            "cold_start:false",
+            "functionname:post-coupon-prod-us",
+            "team:coupons",
+        )
+        seconds = LOG_TIMESTAMP // 1000
+        self.assertEqual(
+            self.get_points(mock_lambda_metric, "aws.lambda.enhanced.duration"),
+            {(seconds, tags): [1.0], (seconds + 1, tags): [2.0, 3.0]},
+        )
+        # One call per point: duration, billed duration, max memory used and
+        # estimated cost of each report
+        self.assertEqual(mock_lambda_metric.call_count, 12)
+
+        tap.flush()
+        self.assertEqual(mock_lambda_metric.call_count, 12)
+
+    def test_decoded_json_message_reused(self, mock_lambda_metric):
+        tap = EnhancedMetricsTap(self.cache_layer)
+        json_message = json.loads(TestEnhancedLambdaMetrics.standard_json_report)
+        log = self.make_log(TestEnhancedLambdaMetrics.standard_json_report)
+
+        with patch("enhanced_lambda_metrics.json.loads") as mock_loads:
+            tap(log, json_message)
+        tap.flush()
+
+        mock_loads.assert_not_called()
+        self.assertTrue(
+            self.get_points(mock_lambda_metric, "aws.lambda.enhanced.duration")
+        )
+
+    @patch("enhanced_lambda_metrics.parse_metrics_from_json_report_log")
+    def test_non_report_logs_skip_parsers(self, mock_json_parser, mock_lambda_metric):
+        tap = EnhancedMetricsTap(self.cache_layer)
 
-    def test_generate_enhanced_lambda_metrics(self):
+        tap(self.make_log('{"time": "2024-01-01", "type": "function", "record": "hi"}'))
+        tap.flush()
+
+        mock_json_parser.assert_not_called()
+        self.cache_layer.get_lambda_tags_bundle.assert_not_called()
+        mock_lambda_metric.assert_not_called()
+
+    def test_json_report_metrics(self, mock_lambda_metric):
         tags_cache = LambdaTagsCache("")
         tags_cache.get = MagicMock(return_value=[])
+        tap = EnhancedMetricsTap(self.make_cache_layer(tags_cache))
 
-        logs_input = {
-            "message": (
-                "REPORT RequestId: fe1467d6-1458-4e20-8e40-9aaa4be7a0f4\tDuration: 3470.65 ms\tBilled Duration: 3500 ms\tMemory Size: 128 MB\tMax Memory Used: 89 MB\t\nXRAY TraceId: 1-5d8bba5a-dc2932496a65bab91d2d42d4\tSegmentId: 5ff79d2a06b82ad6\tSampled: true\t\n"
-            ),
-            "aws": {
-                "awslogs": {
-                    "logGroup": "/aws/lambda/post-coupon-prod-us",
-                    "logStream": "2019/09/25/[$LATEST]d6c10ebbd9cb48dba94a7d9b874b49bb",
-                    "owner": "172597598159",
-                },
-                "function_version": "$LATEST",
-                "invoked_function_arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:collect_logs_datadog_demo"
-                ),
-            },
-            "lambda": {
-                "arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us"
+        tap(
+            self.make_log(
+                json.dumps(
+                    {
+                        "time": "2024-10-04T00:36:35.800Z",
+                        "type": "platform.report",
+                        "record": {
+                            "requestId": "4d789d71-2f2c-4c66-a4b5-531a0223233d",
+                            "metrics": {
+                                "durationMs": 3470.65,
+                                "billedDurationMs": 3500,
+                                "memorySizeMB": 128,
+                                "maxMemoryUsedMB": 89,
+                            },
+                            "status": "success",
+                        },
+                    }
                 )
-            },
-            "timestamp": 10000,
-        }
+            )
+        )
+        tap.flush()
 
-        generated_metrics = generate_enhanced_lambda_metrics(logs_input, tags_cache)
-        verify_as_json(generated_metrics)
+        verify_as_json(self.get_submitted_metrics(mock_lambda_metric))
 
-    def test_generate_enhanced_lambda_metrics_with_tags(
-        self,
-    ):
+    def test_report_metrics(self, mock_lambda_metric):
+        tags_cache = LambdaTagsCache("")
+        tags_cache.get = MagicMock(return_value=[])
+        tap = EnhancedMetricsTap(self.make_cache_layer(tags_cache))
+
+        tap(self.make_log(REPORT_MESSAGE))
+        tap.flush()
+
+        verify_as_json(self.get_submitted_metrics(mock_lambda_metric))
+
+    def test_report_metrics_with_tags(self, mock_lambda_metric):
         tags_cache = LambdaTagsCache("")
         tags_cache.get = MagicMock(
             return_value=["team:metrics", "monitor:datadog", "env:prod", "creator:swf"]
         )
+        tap = EnhancedMetricsTap(self.make_cache_layer(tags_cache))
 
-        logs_input = {
-            "message": (
-                "REPORT RequestId: fe1467d6-1458-4e20-8e40-9aaa4be7a0f4\tDuration: 3470.65 ms\tBilled Duration: 3500 ms\tMemory Size: 128 MB\tMax Memory Used: 89 MB\t\nXRAY TraceId: 1-5d8bba5a-dc2932496a65bab91d2d42d4\tSegmentId: 5ff79d2a06b82ad6\tSampled: true\t\n"
-            ),
-            "aws": {
-                "awslogs": {
-                    "logGroup": "/aws/lambda/post-coupon-prod-us",
-                    "logStream": "2019/09/25/[$LATEST]d6c10ebbd9cb48dba94a7d9b874b49bb",
-                    "owner": "172597598159",
-                },
-                "function_version": "$LATEST",
-                "invoked_function_arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:collect_logs_datadog_demo"
-                ),
-            },
-            "lambda": {
-                "arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us"
-                )
-            },
-            "timestamp": 10000,
-        }
+        tap(self.make_log(REPORT_MESSAGE))
+        tap.flush()
 
-        generated_metrics = generate_enhanced_lambda_metrics(logs_input, tags_cache)
-        verify_as_json(generated_metrics)
+        verify_as_json(self.get_submitted_metrics(mock_lambda_metric))
 
-    def test_generate_enhanced_lambda_metrics_once_with_missing_arn(self):
+    def test_tags_fetched_only_with_arn(self, mock_lambda_metric):
         tags_cache = LambdaTagsCache("")
         tags_cache.get = MagicMock(return_value=[])
+        tap = EnhancedMetricsTap(self.make_cache_layer(tags_cache))
+        log = self.make_log(REPORT_MESSAGE)
 
-        logs_input = {
-            "message": (
-                "REPORT RequestId: fe1467d6-1458-4e20-8e40-9aaa4be7a0f4\tDuration: 3470.65 ms\tBilled Duration: 3500 ms\tMemory Size: 128 MB\tMax Memory Used: 89 MB\t\nXRAY TraceId: 1-5d8bba5a-dc2932496a65bab91d2d42d4\tSegmentId: 5ff79d2a06b82ad6\tSampled: true\t\n"
-            ),
-            "aws": {
-                "awslogs": {
-                    "logGroup": "/aws/lambda/post-coupon-prod-us",
-                    "logStream": "2019/09/25/[$LATEST]d6c10ebbd9cb48dba94a7d9b874b49bb",
-                    "owner": "172597598159",
-                },
-                "function_version": "$LATEST",
-                "invoked_function_arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:collect_logs_datadog_demo"
-                ),
-            },
-            "lambda": {
-                "arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us"
-                )
-            },
-            "timestamp": 10000,
-        }
-
-        generate_enhanced_lambda_metrics(logs_input, tags_cache)
+        tap(log)
         tags_cache.get.assert_called_once()
         tags_cache.get.reset_mock()
-        del logs_input["lambda"]
-        generate_enhanced_lambda_metrics(logs_input, tags_cache)
+        del log["lambda"]
+        tap(log)
         tags_cache.get.assert_not_called()
 
     @patch("caching.base_tags_cache.send_forwarder_internal_metrics")
     @patch("caching.lambda_cache.send_forwarder_internal_metrics")
     @patch.dict(os.environ, {"DD_FETCH_LAMBDA_TAGS": "true"})
-    def test_generate_enhanced_lambda_metrics_refresh_s3_cache(self, mock1, mock2):
+    def test_s3_cache_refreshed(self, mock1, mock2, mock_lambda_metric):
         reload(sys.modules["settings"])
 
         tags_cache = LambdaTagsCache("")
@@ -355,65 +464,14 @@ class TestEnhancedLambdaMetrics(unittest.TestCase):
         tags_cache.release_s3_cache_lock = MagicMock()
         tags_cache.write_cache_to_s3 = MagicMock()
         tags_cache.build_tags_cache = MagicMock(return_value=(True, {}))
+        tap = EnhancedMetricsTap(self.make_cache_layer(tags_cache))
 
-        logs_input = {
-            "message": (
-                "REPORT RequestId: fe1467d6-1458-4e20-8e40-9aaa4be7a0f4\tDuration: 3470.65 ms\tBilled Duration: 3500 ms\tMemory Size: 128 MB\tMax Memory Used: 89 MB\t\nXRAY TraceId: 1-5d8bba5a-dc2932496a65bab91d2d42d4\tSegmentId: 5ff79d2a06b82ad6\tSampled: true\t\n"
-            ),
-            "aws": {
-                "awslogs": {
-                    "logGroup": "/aws/lambda/post-coupon-prod-us",
-                    "logStream": "2019/09/25/[$LATEST]d6c10ebbd9cb48dba94a7d9b874b49bb",
-                    "owner": "172597598159",
-                },
-                "function_version": "$LATEST",
-                "invoked_function_arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:collect_logs_datadog_demo"
-                ),
-            },
-            "lambda": {
-                "arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us"
-                )
-            },
-            "timestamp": 10000,
-        }
+        tap(self.make_log(REPORT_MESSAGE))
 
-        generate_enhanced_lambda_metrics(logs_input, tags_cache)
         tags_cache.get_cache_from_s3.assert_called_once()
         tags_cache.build_tags_cache.assert_called_once()
         tags_cache.write_cache_to_s3.assert_called_once()
 
-    @patch("caching.base_tags_cache.send_forwarder_internal_metrics")
-    @patch("caching.lambda_cache.send_forwarder_internal_metrics")
-    @patch.dict(os.environ, {"DD_FETCH_LAMBDA_TAGS": "true"})
-    def test_refresh_uses_stale_s3_cache_when_lock_not_acquired(self, mock1, mock2):
-        """When S3 cache is expired and the rebuild lock is held by another
-        invocation, _refresh must fall back to the non-empty stale cache
-        rather than leaving tags_by_id empty."""
-        reload(sys.modules["settings"])
-
-        stale_cache = {
-            "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us": [
-                "stage:usw2-prd",
-                "environment:usw2-prd",
-            ]
-        }
-        tags_cache = LambdaTagsCache("")
-        tags_cache.get_cache_from_s3 = MagicMock(return_value=(stale_cache, 1000))
-        tags_cache.acquire_s3_cache_lock = MagicMock(return_value=False)
-        tags_cache.build_tags_cache = MagicMock()
-        tags_cache.write_cache_to_s3 = MagicMock()
-
-        tags_cache._refresh()
-
-        tags_cache.build_tags_cache.assert_not_called()
-        tags_cache.write_cache_to_s3.assert_not_called()
-        assert tags_cache.tags_by_id == stale_cache
-        assert tags_cache.get(
-            "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us"
-        ) == ["stage:usw2-prd", "environment:usw2-prd"]
-
     @patch.dict(os.environ, {"DD_FETCH_LAMBDA_TAGS": "true"})
     @patch("caching.lambda_cache.LambdaTagsCache.release_s3_cache_lock")
     @patch("caching.lambda_cache.LambdaTagsCache.acquire_s3_cache_lock")
@@ -422,7 +480,7 @@ class TestEnhancedLambdaMetrics(unittest.TestCase):
     @patch("caching.lambda_cache.send_forwarder_internal_metrics")
     @patch("caching.base_tags_cache.send_forwarder_internal_metrics")
     @patch("caching.lambda_cache.LambdaTagsCache.get_cache_from_s3")
-    def test_generate_enhanced_lambda_metrics_client_error(
+    def test_tags_fetched_from_api_on_empty_cache(
         self,
         mock_get_s3_cache,
         mock_base_tags_cache_forward_metrics,
@@ -431,6 +489,7 @@ class TestEnhancedLambdaMetrics(unittest.TestCase):
         mock_get_resources_paginator,
         mock_acquire_lock,
         mock_release_lock,
+        mock_lambda_metric,
     ):
         reload(sys.modules["settings"])
 
@@ -442,34 +501,11 @@ class TestEnhancedLambdaMetrics(unittest.TestCase):
         paginator = mock.MagicMock()
         paginator.paginate.return_value = [{"ResourceTagMappingList": []}]
         mock_get_resources_paginator.return_value = paginator
-        tags_cache = LambdaTagsCache("")
+        tap = EnhancedMetricsTap(self.make_cache_layer(LambdaTagsCache("")))
 
-        logs_input = {
-            "message": (
-                "REPORT RequestId: fe1467d6-1458-4e20-8e40-9aaa4be7a0f4\tDuration: 3470.65 ms\tBilled Duration: 3500 ms\tMemory Size: 128 MB\tMax Memory Used: 89 MB\t\nXRAY TraceId: 1-5d8bba5a-dc2932496a65bab91d2d42d4\tSegmentId: 5ff79d2a06b82ad6\tSampled: true\t\n"
-            ),
-            "aws": {
-                "awslogs": {
-                    "logGroup": "/aws/lambda/post-coupon-prod-us",
-                    "logStream": "2019/09/25/[$LATEST]d6c10ebbd9cb48dba94a7d9b874b49bb",
-                    "owner": "172597598159",
-                },
-                "function_version": "$LATEST",
-                "invoked_function_arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:collect_logs_datadog_demo"
-                ),
-            },
-            "lambda": {
-                "arn": (
-                    "arn:aws:lambda:us-east-1:172597598159:function:post-coupon-prod-us"
-                )
-            },
-            "timestamp": 10000,
-        }
+        tap(self.make_log(REPORT_MESSAGE))
 
-        generate_enhanced_lambda_metrics(logs_input, tags_cache)
         mock_get_s3_cache.assert_called_once()
-        mock_get_s3_cache.reset_mock()
         mock_get_resources_paginator.assert_called_once()
         paginator.paginate.assert_called_once()
         assert mock_base_tags_cache_forward_metrics.call_count == 1
@@ -479,8 +515,12 @@ class TestEnhancedLambdaMetrics(unittest.TestCase):
     @patch("caching.base_tags_cache.send_forwarder_internal_metrics")
     @patch("caching.lambda_cache.LambdaTagsCache.get_cache_from_s3")
     @patch.dict(os.environ, {"DD_FETCH_LAMBDA_TAGS": "true"})
-    def test_generate_enhanced_lambda_metrics_timeout(
-        self, mock_get_s3_cache, mock_forward_metrics, mock_base_forward_metrics
+    def test_timeout_metric(
+        self,
+        mock_get_s3_cache,
+        mock_forward_metrics,
+        mock_base_forward_metrics,
+        mock_lambda_metric,
     ):
         reload(sys.modules["settings"])
 
@@ -495,34 +535,28 @@ class TestEnhancedLambdaMetrics(unittest.TestCase):
             },
             time(),
         )
-        tags_cache = LambdaTagsCache("")
+        tap = EnhancedMetricsTap(self.make_cache_layer(LambdaTagsCache("")))
 
-        logs_input = {
-            "message": (
-                "2020-06-09T15:02:26.150Z 7c9567b5-107b-4a6c-8798-0157ac21db52 Task timed out after 3.00 seconds\n\n"
-            ),
-            "aws": {
-                "awslogs": {
-                    "logGroup": "/aws/lambda/cloudwatch-event",
-                    "logStream": "2020/06/09/[$LATEST]b249865adaaf4fad80f95f8ad09725b8",
-                    "owner": "601427279990",
-                },
-                "function_version": "$LATEST",
-                "invoked_function_arn": "arn:aws:lambda:us-east-1:0:function:test",
-            },
-            "lambda": {"arn": "arn:aws:lambda:us-east-1:0:function:cloudwatch-event"},
-            "timestamp": 1591714946151,
-        }
+        tap(
+            self.make_log(
+                "2020-06-09T15:02:26.150Z 7c9567b5-107b-4a6c-8798-0157ac21db52 Task timed out after 3.00 seconds\n\n",
+                arn="arn:aws:lambda:us-east-1:0:function:cloudwatch-event",
+            )
+        )
+        tap.flush()
 
-        generated_metrics = generate_enhanced_lambda_metrics(logs_input, tags_cache)
-        verify_as_json(generated_metrics)
+        verify_as_json(self.get_submitted_metrics(mock_lambda_metric))
 
     @patch("caching.lambda_cache.send_forwarder_internal_metrics")
-    @patch("telemetry.send_forwarder_internal_metrics")
+    @patch("caching.base_tags_cache.send_forwarder_internal_metrics")
     @patch("caching.lambda_cache.LambdaTagsCache.get_cache_from_s3")
     @patch.dict(os.environ, {"DD_FETCH_LAMBDA_TAGS": "true"})
-    def test_generate_enhanced_lambda_metrics_out_of_memory(
-        self, mock_get_s3_cache, mock_forward_metrics, mock_base_forward_metrics
+    def test_out_of_memory_metric(
+        self,
+        mock_get_s3_cache,
+        mock_forward_metrics,
+        mock_base_forward_metrics,
+        mock_lambda_metric,
     ):
         reload(sys.modules["settings"])
 
@@ -537,27 +571,17 @@ class TestEnhancedLambdaMetrics(unittest.TestCase):
             },
             time(),
         )
-        tags_cache = LambdaTagsCache("")
+        tap = EnhancedMetricsTap(self.make_cache_layer(LambdaTagsCache("")))
 
-        logs_input = {
-            "message": (
-                "2020-06-09T15:02:26.150Z 7c9567b5-107b-4a6c-8798-0157ac21db52 FATAL ERROR: CALL_AND_RETRY_LAST Allocation failed - JavaScript heap out of memory\n\n"
-            ),
-            "aws": {
-                "awslogs": {
-                    "logGroup": "/aws/lambda/cloudwatch-event",
-                    "logStream": "2020/06/09/[$LATEST]b249865adaaf4fad80f95f8ad09725b8",
-                    "owner": "601427279990",
-                },
-                "function_version": "$LATEST",
-                "invoked_function_arn": "arn:aws:lambda:us-east-1:0:function:test",
-            },
-            "lambda": {"arn": "arn:aws:lambda:us-east-1:0:function:cloudwatch-event"},
-            "timestamp": 1591714946151,
-        }
+        tap(
+            self.make_log(
+                "2020-06-09T15:02:26.150Z 7c9567b5-107b-4a6c-8798-0157ac21db52 FATAL ERROR: CALL_AND_RETRY_LAST Allocation failed - JavaScript heap out of memory\n\n",
+                arn="arn:aws:lambda:us-east-1:0:function:cloudwatch-event",
+            )
+        )
+        tap.flush()
 
-        generated_metrics = generate_enhanced_lambda_metrics(logs_input, tags_cache)
-        verify_as_json(generated_metrics)
+        verify_as_json(self.get_submitted_metrics(mock_lambda_metric))
 
 
 if __name__ == "__main__":
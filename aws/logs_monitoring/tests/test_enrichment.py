@@ -8,6 +8,7 @@ from unittest.mock import MagicMock, patch
 from approvaltests.approvals import verify_as_json
 
 from caching.cache_layer import CacheLayer
+from settings import DD_TAGS_CACHE_TTL_SECONDS
 from steps.enrichment import (
     add_metadata_to_lambda_log,
     extract_ddtags_from_message,
@@ -299,6 +300,78 @@ class TestLambdaMetadataEnrichment(unittest.TestCase):
         add_metadata_to_lambda_log(event, cache_layer)
         verify_as_json(event)
 
+    def test_lambda_tags_computed_once_per_arn(self):
+        cache_layer = CacheLayer("")
+        cache_layer._lambda_cache.get = MagicMock(
+            return_value=["service:customtags_service", "env:prod"]
+        )
+        arn = "arn:aws:lambda:us-east-1:123456789012:function:my-function"
+        events = [
+            {"lambda": {"arn": arn}, "ddtags": "env:none"},
+            {"lambda": {"arn": arn}, "service": "my_service"},
+            {"lambda": {"arn": arn}},
+        ]
+        for event in events:
+            add_metadata_to_lambda_log(event, cache_layer)
+
+        cache_layer._lambda_cache.get.assert_called_once_with(arn)
+        self.assertEqual(
+            events[0]["ddtags"],
+            "aws_account:123456789012,env:prod,functionname:my-function,"
+            "region:us-east-1,service:customtags_service",
+        )
+        self.assertEqual(events[0]["service"], "customtags_service")
+        self.assertEqual(
+            events[1]["ddtags"],
+            "aws_account:123456789012,env:prod,functionname:my-function,"
+            "region:us-east-1",
+        )
+        self.assertEqual(events[1]["service"], "my_service")
+        self.assertEqual(events[2]["ddtags"], events[0]["ddtags"])
+
+    def test_lambda_tags_recomputed_after_cache_refresh(self):
+        cache_layer = CacheLayer("")
+        lambda_cache = cache_layer._lambda_cache
+        lambda_cache.needs_refresh = MagicMock(return_value=False)
+        lambda_cache.get = MagicMock(return_value=["team:a"])
+        arn = "arn:aws:lambda:us-east-1:123456789012:function:my-function"
+        other_arn = "arn:aws:lambda:us-east-1:123456789012:function:other-function"
+
+        first = cache_layer.get_lambda_tags_bundle(arn)
+        other = cache_layer.get_lambda_tags_bundle(other_arn)
+        self.assertIs(cache_layer.get_lambda_tags_bundle(arn), first)
+
+        def refresh(key):
+            lambda_cache.last_tags_fetch_time += DD_TAGS_CACHE_TTL_SECONDS
+            lambda_cache.needs_refresh.return_value = False
+            return ["team:b"]
+
+        lambda_cache.needs_refresh.return_value = True
+        lambda_cache.get.side_effect = refresh
+        second = cache_layer.get_lambda_tags_bundle(arn)
+        self.assertIsNot(second, first)
+        self.assertIn("team:b", second.enriched_tags)
+        # The bundles built from the previous tags are dropped too
+        self.assertIsNot(cache_layer.get_lambda_tags_bundle(other_arn), other)
+        self.assertEqual(lambda_cache.get.call_count, 4)
+
+    @patch("caching.cache_layer.LAMBDA_TAGS_BUNDLES_MAX_SIZE", 2)
+    def test_lambda_tags_bundles_bounded(self):
+        cache_layer = CacheLayer("")
+        cache_layer._lambda_cache.get = MagicMock(return_value=[])
+        arns = [
+            f"arn:aws:lambda:us-east-1:123456789012:function:function-{i}"
+            for i in range(3)
+        ]
+
+        for arn in arns[:2]:
+            cache_layer.get_lambda_tags_bundle(arn)
+        # The least recently used bundle is evicted
+        cache_layer.get_lambda_tags_bundle(arns[0])
+        cache_layer.get_lambda_tags_bundle(arns[2])
+
+        self.assertEqual(list(cache_layer._lambda_tags_bundles), [arns[0], arns[2]])
+
 
 if __name__ == "__main__":
     unittest.main()
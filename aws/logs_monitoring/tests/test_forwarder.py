@@ -0,0 +1,319 @@
+import json
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.modules["trace_forwarder.connection"] = MagicMock()
+sys.modules["requests"] = MagicMock()
+sys.modules["requests_futures.sessions"] = MagicMock()
+
+from forwarder import Forwarder
+from logs.circuit_breaker import CircuitBreaker
+from logs.helpers import add_retry_tag
+from retry.disk_storage import DiskStorage
+from retry.enums import RetryPrefix
+from retry.write_behind_storage import WriteBehindStorage
+
+
+@patch("forwarder.send_event_metric")
+@patch("forwarder.DatadogHTTPClient")
+class TestForwarderLogsClient(unittest.TestCase):
+    @patch("forwarder.DD_API_KEY", "api-key")
+    def test_logs_client_configured(self, mock_http_client, mock_send_metric):
+        forwarder = Forwarder.__new__(Forwarder)
+        forwarder._scrubber = MagicMock()
+        forwarder._matcher = MagicMock()
+        forwarder._batcher = MagicMock()
+        forwarder._batcher.batch.return_value = []
+        forwarder._intake_breaker = MagicMock()
+
+        forwarder._forward_logs(['{"message": "hello"}'])
+
+        args = mock_http_client.call_args.args
+        self.assertEqual(args[4], "api-key")
+        self.assertIs(args[5], forwarder._scrubber)
+
+
+class TestForwarderRetry(unittest.TestCase):
+    def setUp(self):
+        self.forwarder = Forwarder.__new__(Forwarder)
+        self.forwarder.storage = MagicMock()
+        self.forwarder._intake_breaker = CircuitBreaker(5, 30)
+        self.forwarder._forward_logs = MagicMock()
+        self.forwarder._forward_metrics = MagicMock()
+        self.forwarder._forward_traces = MagicMock()
+
+    def test_retry_routes_stored_data_in_order(self):
+        self.forwarder.storage.iter_all_data.return_value = iter(
+            [
+                (RetryPrefix.METRICS, "m1", ["metric"]),
+                (RetryPrefix.TRACES, "t1", None),
+                (RetryPrefix.LOGS, "l1", ["log"]),
+            ]
+        )
+
+        self.forwarder.retry()
+
+        self.forwarder.storage.iter_all_data.assert_called_once_with(
+            (RetryPrefix.METRICS, RetryPrefix.TRACES, RetryPrefix.LOGS),
+            deadline=None,
+        )
+        self.forwarder._forward_metrics.assert_called_once_with(["metric"], key="m1")
+        self.forwarder._forward_traces.assert_not_called()
+        self.forwarder._forward_logs.assert_called_once_with(["log"], key="l1")
+        self.forwarder.storage.flush.assert_called_once_with()
+
+    @patch("forwarder.monotonic")
+    def test_retry_stops_at_deadline(self, mock_monotonic):
+        mock_monotonic.side_effect = [0, 100]
+        self.forwarder.storage.iter_all_data.return_value = iter(
+            [(RetryPrefix.LOGS, "k1", ["log"]), (RetryPrefix.LOGS, "k2", ["log"])]
+        )
+
+        self.forwarder.retry(deadline=50)
+
+        self.forwarder._forward_logs.assert_called_once_with(["log"], key="k1")
+        self.forwarder.storage.flush.assert_called_once_with()
+
+    def test_logs_retry_skipped_when_intake_circuit_open(self):
+        self.forwarder._intake_breaker = MagicMock()
+        self.forwarder._intake_breaker.is_open.return_value = True
+        self.forwarder.storage.iter_all_data.return_value = iter(
+            [
+                (RetryPrefix.METRICS, "m1", ["metric"]),
+                (RetryPrefix.TRACES, "t1", ["trace"]),
+            ]
+        )
+
+        self.forwarder.retry()
+
+        self.forwarder.storage.iter_all_data.assert_called_once_with(
+            (RetryPrefix.METRICS, RetryPrefix.TRACES), deadline=None
+        )
+        self.forwarder._forward_metrics.assert_called_once_with(["metric"], key="m1")
+        self.forwarder._forward_traces.assert_called_once_with(["trace"], key="t1")
+        self.forwarder._forward_logs.assert_not_called()
+
+    @patch("forwarder.DD_RETRY_MAX_PAYLOADS_PER_INVOCATION", 2)
+    def test_retry_stops_at_max_payloads(self):
+        self.forwarder.storage.iter_all_data.return_value = iter(
+            [(RetryPrefix.LOGS, f"k{i}", ["log"]) for i in range(5)]
+        )
+
+        self.forwarder.retry()
+
+        self.assertEqual(self.forwarder._forward_logs.call_count, 2)
+
+    @patch("forwarder.send_event_metric")
+    def test_retry_reports_payloads_per_kind(self, mock_send_metric):
+        self.forwarder.storage.iter_all_data.return_value = iter(
+            [
+                (RetryPrefix.METRICS, "m1", ["metric"]),
+                (RetryPrefix.LOGS, "l1", ["log"]),
+                (RetryPrefix.LOGS, "l2", ["log"]),
+            ]
+        )
+
+        self.forwarder.retry()
+
+        mock_send_metric.assert_any_call("metrics_retry_payloads", 1)
+        mock_send_metric.assert_any_call("logs_retry_payloads", 2)
+        self.assertEqual(mock_send_metric.call_count, 2)
+
+    @patch("forwarder.send_event_metric")
+    @patch("forwarder.perf_counter", side_effect=[0, 4, 4, 4.5, 4.5, 5])
+    def test_retry_rates_timed_per_kind(self, mock_perf_counter, mock_send_metric):
+        self.forwarder.storage.iter_all_data.return_value = iter(
+            [
+                (RetryPrefix.METRICS, "m1", ["metric"]),
+                (RetryPrefix.LOGS, "l1", ["log"]),
+                (RetryPrefix.LOGS, "l2", ["log"]),
+            ]
+        )
+
+        with patch("forwarder.logger") as mock_logger:
+            self.forwarder.retry()
+
+        mock_logger.info.assert_any_call("Retried 1 metrics payloads in 4.0s (0.2/s)")
+        mock_logger.info.assert_any_call("Retried 2 logs payloads in 1.0s (2.0/s)")
+
+
+@patch("forwarder.send_event_metric")
+@patch("forwarder.DatadogHTTPClient")
+class TestForwarderRetryAcknowledgement(unittest.TestCase):
+    def setUp(self):
+        self.forwarder = Forwarder.__new__(Forwarder)
+        self.forwarder.storage = MagicMock()
+        self.forwarder._intake_breaker = CircuitBreaker(5, 30)
+        self.forwarder._scrubber = MagicMock()
+        self.forwarder._matcher = MagicMock()
+        self.forwarder._matcher.match.return_value = True
+        self.forwarder._batcher = MagicMock()
+        self.forwarder._batcher.batch.return_value = [["batch1"], ["batch2"]]
+        self.client = MagicMock()
+        self.client.__enter__.return_value = self.client
+
+    def test_retried_logs_deleted_once_all_batches_sent(
+        self, mock_http_client, mock_send_metric
+    ):
+        mock_http_client.return_value = self.client
+
+        self.forwarder._forward_logs(['{"message": "hello"}'], key="key")
+
+        self.forwarder.storage.store_data.assert_not_called()
+        self.forwarder.storage.delete_data.assert_called_once_with("key")
+
+    def test_retried_logs_failed_batches_stored_again(
+        self, mock_http_client, mock_send_metric
+    ):
+        self.client.send.side_effect = [None, Exception("send failed")]
+        mock_http_client.return_value = self.client
+
+        self.forwarder._forward_logs(['{"message": "hello"}'], key="key")
+
+        self.forwarder.storage.store_data.assert_called_once_with(
+            RetryPrefix.LOGS, ["batch2"]
+        )
+        self.forwarder.storage.delete_data.assert_called_once_with("key")
+
+    def test_retried_logs_kept_when_failed_batches_not_stored(
+        self, mock_http_client, mock_send_metric
+    ):
+        self.client.send.side_effect = [Exception("send failed"), None]
+        mock_http_client.return_value = self.client
+        self.forwarder.storage.store_data.return_value = False
+
+        self.forwarder._forward_logs(['{"message": "hello"}'], key="key")
+
+        self.forwarder.storage.delete_data.assert_not_called()
+
+    @patch("forwarder.send_log_metrics")
+    def test_retried_metrics_failed_metrics_stored_again(
+        self, mock_send_log_metrics, mock_http_client, mock_send_metric
+    ):
+        mock_send_log_metrics.return_value = [{"m": "b"}]
+
+        self.forwarder._forward_metrics([{"m": "a"}, {"m": "b"}], key="key")
+
+        self.forwarder.storage.store_data.assert_called_once_with(
+            RetryPrefix.METRICS, [{"m": "b"}]
+        )
+        self.forwarder.storage.delete_data.assert_called_once_with("key")
+
+
+class TestForwardTraces(unittest.TestCase):
+    def setUp(self):
+        self.forwarder = Forwarder.__new__(Forwarder)
+        self.forwarder.storage = MagicMock()
+        self.forwarder.trace_connection = MagicMock()
+        self.traces = [{"message": "x" * 40, "tags": f"trace:{i}"} for i in range(5)]
+
+    @patch("forwarder.send_event_metric")
+    @patch("forwarder.DD_TRACE_CHUNK_BYTES", 160)
+    def test_traces_sent_in_chunks(self, mock_send_metric):
+        self.forwarder._forward_traces(self.traces)
+
+        sent = [
+            json.loads(call.args[0])
+            for call in self.forwarder.trace_connection.send_traces.call_args_list
+        ]
+        self.assertEqual(len(sent), 3)
+        self.assertEqual(sorted(sum(sent, []), key=lambda t: t["tags"]), self.traces)
+        mock_send_metric.assert_called_once_with("traces_forwarded", 5)
+
+    @patch("forwarder.send_event_metric")
+    @patch("forwarder.DD_STORE_FAILED_EVENTS", True)
+    @patch("forwarder.DD_TRACE_CHUNK_BYTES", 160)
+    def test_only_failed_chunks_stored(self, mock_send_metric):
+        def send_traces(serialized):
+            if b"trace:0" in serialized:
+                raise Exception("intake down")
+
+        self.forwarder.trace_connection.send_traces.side_effect = send_traces
+
+        self.forwarder._forward_traces(self.traces)
+
+        self.forwarder.storage.store_data.assert_called_once_with(
+            RetryPrefix.TRACES, self.traces[:2]
+        )
+        mock_send_metric.assert_called_once_with("traces_forwarded", 3)
+
+    def test_traces_handed_over_as_bytes(self):
+        self.forwarder._forward_traces(self.traces[:1])
+
+        [call] = self.forwarder.trace_connection.send_traces.call_args_list
+        self.assertIsInstance(call.args[0], bytes)
+        self.assertEqual(json.loads(call.args[0]), self.traces[:1])
+
+    @patch("forwarder.DD_TRACE_CHUNK_BYTES", 10)
+    def test_large_payload_sent_alone(self):
+        self.forwarder._forward_traces(self.traces[:2])
+
+        self.assertEqual(self.forwarder.trace_connection.send_traces.call_count, 2)
+
+
+class TestForward(unittest.TestCase):
+    @patch("forwarder.DD_FORWARD_LOG", True)
+    def test_traces_sent_while_logs_forwarded(self):
+        forwarder = Forwarder.__new__(Forwarder)
+        forwarder.storage = MagicMock()
+        traces_started = threading.Event()
+        logs_forwarded = threading.Event()
+
+        def forward_traces(traces):
+            traces_started.set()
+            # Only returns once logs were forwarded concurrently
+            self.assertTrue(logs_forwarded.wait(timeout=5))
+
+        def forward_logs(logs):
+            self.assertTrue(traces_started.wait(timeout=5))
+            logs_forwarded.set()
+
+        forwarder._forward_traces = MagicMock(side_effect=forward_traces)
+        forwarder._forward_logs = MagicMock(side_effect=forward_logs)
+        forwarder._forward_metrics = MagicMock()
+
+        forwarder.forward(["log"], ["metric"], ["trace"])
+
+        forwarder._forward_traces.assert_called_once_with(["trace"])
+        forwarder._forward_metrics.assert_called_once_with(["metric"])
+
+    @patch("forwarder.DD_FORWARD_LOG", True)
+    def test_failed_data_uploaded_before_forward_returns(self):
+        remote = MagicMock()
+        remote.store_data.side_effect = lambda prefix, data: time.sleep(0.1) or True
+        forwarder = Forwarder.__new__(Forwarder)
+        forwarder._forward_metrics = MagicMock()
+        forwarder._forward_traces = MagicMock()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            local = DiskStorage("test_function_prefix", path=temp_dir)
+            forwarder.storage = WriteBehindStorage(local, remote)
+            # Logs failing to be sent, without any retry in the invocation
+            forwarder._forward_logs = MagicMock(
+                side_effect=lambda logs: forwarder.storage.store_data(
+                    RetryPrefix.LOGS, logs
+                )
+            )
+
+            forwarder.forward(["log"], [], [])
+
+            remote.store_data.assert_called_once_with(RetryPrefix.LOGS, ["log"])
+            # Uploaded, so deleted from disk
+            self.assertEqual(local.get_data(RetryPrefix.LOGS), {})
+
+
+class TestAddRetryTag(unittest.TestCase):
+    def test_retry_tag_added_once(self):
+        log = add_retry_tag('{"ddtags": "env:prod"}')
+        self.assertEqual(log["ddtags"], "env:prod,retry:true")
+
+        log = add_retry_tag(json.dumps(log))
+        self.assertEqual(log["ddtags"], "env:prod,retry:true")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from instrumentation import StageTimings
+
+
+class TestStageTimings(unittest.TestCase):
+    def test_disabled_timings_leave_code_unchanged(self):
+        timings = StageTimings(enabled=False)
+
+        def serialize(log):
+            return log
+
+        items = iter([1, 2])
+
+        self.assertIs(timings.stage("parse"), timings.stage("enrich"))
+        self.assertIs(timings.wrap("serialization", serialize), serialize)
+        self.assertIs(timings.wrap_iter("batching", items), items)
+        with timings.stage("parse"):
+            timings.count("parse", events=1)
+        with patch("instrumentation.logger") as mock_logger:
+            timings.report()
+        mock_logger.info.assert_not_called()
+
+    @patch("instrumentation.perf_counter", side_effect=[0.0, 0.5, 1.0, 1.25])
+    def test_stage_time_events_and_bytes(self, mock_perf_counter):
+        timings = StageTimings(enabled=True)
+
+        for _ in range(2):
+            with timings.stage("post"):
+                timings.count("post", events=10, size=100)
+
+        self.assertEqual(timings._stages, {"post": [0.75, 20, 200]})
+
+    @patch("instrumentation.perf_counter", side_effect=[0.0, 0.25, 1.0, 1.5])
+    def test_wrapped_function_timed_per_call(self, mock_perf_counter):
+        timings = StageTimings(enabled=True)
+        match = timings.wrap("matching", lambda log: log == "keep")
+
+        self.assertEqual([match("keep"), match("drop")], [True, False])
+        self.assertEqual(timings._stages, {"matching": [0.75, 2, 0]})
+
+    @patch("instrumentation.perf_counter", side_effect=[0.0, 1.0, 2.0, 2.5, 3.0, 3.25])
+    def test_wrapped_iterable_timed_per_item(self, mock_perf_counter):
+        timings = StageTimings(enabled=True)
+
+        batches = list(timings.wrap_iter("batching", iter([["a"], ["b"]])))
+
+        self.assertEqual(batches, [["a"], ["b"]])
+        # The last call, returning no item, is timed but not counted
+        self.assertEqual(timings._stages, {"batching": [1.75, 2, 0]})
+
+    def test_collect_returns_and_resets_stages(self):
+        timings = StageTimings(enabled=True)
+        timings.count("post", events=2, size=10)
+
+        self.assertEqual(timings.collect(), {"post": (0, 2, 10)})
+        self.assertEqual(timings.collect(), {})
+
+    @patch("instrumentation.send_event_metric")
+    def test_report_summarizes_and_resets(self, mock_send_event_metric):
+        timings = StageTimings(enabled=True)
+        timings._record("parse", 0.002, 5, 0)
+        timings._record("compression", 0.001, 5, 2048)
+
+        with patch("instrumentation.logger") as mock_logger:
+            timings.report()
+
+        [summary] = mock_logger.info.call_args.args
+        self.assertEqual(
+            json.loads(summary.split(": ", 1)[1]),
+            {
+                "parse": {"ms": 2.0, "events": 5},
+                "compression": {"ms": 1.0, "events": 5, "bytes": 2048},
+            },
+        )
+        mock_send_event_metric.assert_any_call(
+            "stage_duration_ms", 2.0, ["stage:parse"]
+        )
+        mock_send_event_metric.assert_any_call(
+            "stage_bytes", 2048, ["stage:compression"]
+        )
+        self.assertEqual(mock_send_event_metric.call_count, 5)
+        self.assertEqual(timings._stages, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -46,28 +46,28 @@ class Context:
 
 
 class TestInvokeAdditionalTargetLambdas(unittest.TestCase):
-    @patch("lambda_function.boto3")
-    def test_additional_lambda(self, boto3):
+    @patch("lambda_function.get_client")
+    def test_additional_lambda(self, get_client):
         self.assertEqual(invoke_additional_target_lambdas({"ironmaiden": "foo"}), None)
-        boto3.client.assert_called_with("lambda")
+        get_client.assert_called_with("lambda")
         lambda_payload = json.dumps({"ironmaiden": "foo"})
 
-        self.assertEqual(boto3.client().invoke.call_count, 2)
-        boto3.client().invoke.assert_called_with(
+        self.assertEqual(get_client().invoke.call_count, 2)
+        get_client().invoke.assert_called_with(
             FunctionName="megadeth", InvocationType="Event", Payload=lambda_payload
         )
 
-    @patch("lambda_function.boto3")
-    def test_lambda_invocation_exception(self, boto3):
-        boto3.client.return_value.invoke.side_effect = ClientError(
+    @patch("lambda_function.get_client")
+    def test_lambda_invocation_exception(self, get_client):
+        get_client.return_value.invoke.side_effect = ClientError(
             {"Error": {"Code": "403", "Message": "Unauthorized"}}, "Invoke"
         )
         self.assertEqual(invoke_additional_target_lambdas({"ironmaiden": "foo"}), None)
-        boto3.client.assert_called_with("lambda")
+        get_client.assert_called_with("lambda")
         lambda_payload = json.dumps({"ironmaiden": "foo"})
 
-        self.assertEqual(boto3.client().invoke.call_count, 2)
-        boto3.client().invoke.assert_called_with(
+        self.assertEqual(get_client().invoke.call_count, 2)
+        get_client().invoke.assert_called_with(
             FunctionName="megadeth", InvocationType="Event", Payload=lambda_payload
         )
 
@@ -4,9 +4,12 @@ import unittest
 import unittest.mock
 from importlib import reload
 
+from logs.circuit_breaker import CircuitBreaker
 from logs.datadog_batcher import DatadogBatcher
+from logs.datadog_client import DatadogClient
 from logs.datadog_matcher import DatadogMatcher
 from logs.datadog_scrubber import DatadogScrubber
+from logs.exceptions import CircuitOpenException, RetriableException
 
 
 class TestScrubLogs(unittest.TestCase):
@@ -151,5 +154,127 @@ def filter_logs(matcher, logs):
     return filtered
 
 
+@unittest.mock.patch("logs.circuit_breaker.send_forwarder_internal_metrics")
+@unittest.mock.patch("logs.circuit_breaker.time.monotonic")
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self, mock_monotonic, mock_metrics):
+        mock_monotonic.return_value = 0
+        breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=30)
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+
+        self.assertFalse(breaker.allow_request())
+        self.assertTrue(breaker.is_open())
+        mock_metrics.assert_called_once_with("intake_circuit_open")
+
+    def test_success_resets_failures(self, mock_monotonic, mock_metrics):
+        mock_monotonic.return_value = 0
+        breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=30)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_probe(self, mock_monotonic, mock_metrics):
+        mock_monotonic.return_value = 0
+        breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=30)
+        breaker.record_failure()
+
+        mock_monotonic.return_value = 31
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(breaker.allow_request())
+        # A single probe at a time
+        self.assertFalse(breaker.allow_request())
+
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+
+        mock_monotonic.return_value = 62
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_retry_after_honoured(self, mock_monotonic, mock_metrics):
+        mock_monotonic.return_value = 0
+        breaker = CircuitBreaker(failure_threshold=5, cooldown_seconds=30)
+
+        breaker.record_failure(retry_after=10)
+
+        self.assertFalse(breaker.allow_request())
+        mock_monotonic.return_value = 10
+        self.assertTrue(breaker.allow_request())
+
+
+@unittest.mock.patch("logs.datadog_client.time.sleep")
+class TestDatadogClient(unittest.TestCase):
+    def test_retries_with_backoff_up_to_max_attempts(self, mock_sleep):
+        http_client = unittest.mock.MagicMock()
+        http_client.send.side_effect = RetriableException("503")
+
+        with self.assertRaises(RetriableException):
+            DatadogClient(http_client, max_attempts=3).send(["log"])
+
+        self.assertEqual(http_client.send.call_count, 3)
+        self.assertEqual([call.args[0] for call in mock_sleep.call_args_list], [1, 2])
+
+    def test_honours_retry_after(self, mock_sleep):
+        http_client = unittest.mock.MagicMock()
+        http_client.send.side_effect = [RetriableException("429", retry_after=5), None]
+
+        DatadogClient(http_client).send(["log"])
+
+        mock_sleep.assert_called_once_with(5)
+
+    def test_fails_fast_when_retry_after_too_long(self, mock_sleep):
+        http_client = unittest.mock.MagicMock()
+        http_client.send.side_effect = RetriableException("429", retry_after=120)
+
+        with self.assertRaises(RetriableException):
+            DatadogClient(http_client, max_backoff=30).send(["log"])
+
+        mock_sleep.assert_not_called()
+        http_client.send.assert_called_once()
+
+    @unittest.mock.patch("logs.circuit_breaker.send_forwarder_internal_metrics")
+    def test_fails_fast_when_circuit_open(self, mock_metrics, mock_sleep):
+        http_client = unittest.mock.MagicMock()
+        http_client.send.side_effect = RetriableException("503")
+        breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=30)
+        client = DatadogClient(http_client, breaker, max_attempts=3)
+
+        with self.assertRaises(CircuitOpenException):
+            client.send(["batch1"])
+        with self.assertRaises(CircuitOpenException):
+            client.send(["batch2"])
+
+        self.assertEqual(http_client.send.call_count, 2)
+
+    @unittest.mock.patch("logs.circuit_breaker.send_forwarder_internal_metrics")
+    @unittest.mock.patch("logs.circuit_breaker.time.monotonic")
+    def test_non_retriable_probe_closes_circuit(
+        self, mock_monotonic, mock_metrics, mock_sleep
+    ):
+        mock_monotonic.return_value = 0
+        http_client = unittest.mock.MagicMock()
+        breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=30)
+        breaker.record_failure()
+        client = DatadogClient(http_client, breaker)
+
+        mock_monotonic.return_value = 31
+        http_client.send.side_effect = Exception("400 bad request")
+        with self.assertRaises(Exception):
+            client.send(["probe"])
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        http_client.send.side_effect = None
+        client.send(["batch"])
+        self.assertEqual(http_client.send.call_count, 2)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -5,7 +5,7 @@ from unittest.mock import MagicMock, patch
 from settings import DD_CUSTOM_TAGS, DD_SOURCE
 from steps.common import get_service_from_tags_and_remove_duplicates, parse_event_source
 from steps.enums import AwsEventSource, AwsEventType
-from steps.parsing import parse, parse_event_type
+from steps.parsing import kinesis_awslogs_handler, parse, parse_event_type
 
 
 class Context:
@@ -383,6 +383,27 @@ class TestSQSEventParsing(unittest.TestCase):
         self.assertEqual(len(result), 0)
 
 
+class TestKinesisParsing(unittest.TestCase):
+    @patch("steps.parsing.DD_TAGS_CACHE_PREFETCH_MAX_WORKERS", 2)
+    @patch("steps.parsing.AwsLogsHandler")
+    def test_records_extracted_lazily_by_window(self, mock_handler_cls):
+        mock_handler = mock_handler_cls.return_value
+        mock_handler.extract_logs.side_effect = lambda record: record["awslogs"]
+        mock_handler.handle.side_effect = lambda record, logs: [logs["data"]]
+        event = {"Records": [{"kinesis": {"data": str(i)}} for i in range(3)]}
+
+        events = kinesis_awslogs_handler(event, Context(), MagicMock())
+        mock_handler.extract_logs.assert_not_called()
+
+        self.assertEqual(next(events), "0")
+        self.assertEqual(mock_handler.extract_logs.call_count, 2)
+        self.assertEqual(list(events), ["1", "2"])
+        self.assertEqual(
+            [call.args[0] for call in mock_handler.prefetch_tags.call_args_list],
+            [[{"data": "0"}, {"data": "1"}], [{"data": "2"}]],
+        )
+
+
 class TestEventBridgeS3Parsing(unittest.TestCase):
     @patch("steps.parsing.S3EventHandler")
     def test_parse_normalizes_eventbridge_s3_event_before_s3_handler(
@@ -1,5 +1,7 @@
+import gzip
 import json
 import unittest
+from itertools import chain, repeat
 from unittest.mock import MagicMock, patch
 
 from botocore.exceptions import ClientError
@@ -10,10 +12,9 @@ from retry.storage import S3Storage
 class TestS3Storage(unittest.TestCase):
     def setUp(self):
         self.mock_s3 = MagicMock()
-        with patch("retry.storage.boto3") as mock_boto3:
-            mock_boto3.client.return_value = self.mock_s3
-            with patch("retry.storage.DD_S3_BUCKET_NAME", "test-bucket"):
-                self.storage = S3Storage("test_function_prefix")
+        with patch("retry.storage.DD_S3_BUCKET_NAME", "test-bucket"):
+            self.storage = S3Storage("test_function_prefix")
+        self.storage.s3_client = self.mock_s3
 
     def test_store_data_puts_object(self):
         self.storage.store_data("logs", [{"message": "hello"}])
@@ -21,8 +22,29 @@ class TestS3Storage(unittest.TestCase):
         call_kwargs = self.mock_s3.put_object.call_args[1]
         self.assertEqual(call_kwargs["Bucket"], "test-bucket")
         self.assertIn("failed_events/test_function_prefix/logs/", call_kwargs["Key"])
+        self.assertEqual(call_kwargs["ContentEncoding"], "gzip")
         self.assertEqual(
-            json.loads(call_kwargs["Body"].decode("UTF-8")), [{"message": "hello"}]
+            json.loads(gzip.decompress(call_kwargs["Body"]).decode("UTF-8")),
+            [{"message": "hello"}],
+        )
+
+    def test_get_data_reads_compressed_and_legacy_objects(self):
+        self.mock_s3.list_objects_v2.return_value = {
+            "Contents": [{"Key": "compressed"}, {"Key": "legacy"}]
+        }
+        bodies = {
+            "compressed": self.storage._serialize([{"message": "new"}]),
+            "legacy": json.dumps([{"message": "old"}]).encode("UTF-8"),
+        }
+        self.mock_s3.get_object.side_effect = lambda Bucket, Key: {
+            "Body": MagicMock(read=MagicMock(return_value=bodies[Key]))
+        }
+
+        result = self.storage.get_data("logs")
+
+        self.assertEqual(
+            result,
+            {"compressed": [{"message": "new"}], "legacy": [{"message": "old"}]},
         )
 
     def test_store_data_handles_client_error(self):
@@ -30,7 +52,7 @@ class TestS3Storage(unittest.TestCase):
             {"Error": {"Code": "500", "Message": "Error"}}, "PutObject"
         )
         # Should not raise
-        self.storage.store_data("logs", [{"message": "hello"}])
+        self.assertFalse(self.storage.store_data("logs", [{"message": "hello"}]))
 
     def test_get_data_returns_data_for_keys(self):
         self.mock_s3.list_objects_v2.return_value = {
@@ -58,6 +80,90 @@ class TestS3Storage(unittest.TestCase):
         result = self.storage.get_data("logs")
         self.assertEqual(result, {})
 
+    def test_get_data_pages_through_all_keys(self):
+        self.mock_s3.list_objects_v2.side_effect = [
+            {
+                "Contents": [{"Key": f"k{i}"} for i in range(1000)],
+                "IsTruncated": True,
+                "NextContinuationToken": "token",
+            },
+            {"Contents": [{"Key": "k1000"}], "IsTruncated": False},
+        ]
+        self.mock_s3.get_object.side_effect = lambda Bucket, Key: {
+            "Body": MagicMock(read=MagicMock(return_value=json.dumps(Key).encode()))
+        }
+
+        result = self.storage.get_data("logs")
+
+        self.assertEqual(len(result), 1001)
+        self.assertEqual(result["k1000"], "k1000")
+        self.assertEqual(
+            self.mock_s3.list_objects_v2.call_args_list[1][1]["ContinuationToken"],
+            "token",
+        )
+
+    @patch("retry.storage.monotonic")
+    def test_iter_data_stops_fetching_at_deadline(self, mock_monotonic):
+        # the listing reads the clock before the first page
+        mock_monotonic.side_effect = [0, 0, 0, 100, 100]
+        self.mock_s3.list_objects_v2.return_value = {
+            "Contents": [{"Key": "k1"}, {"Key": "k2"}, {"Key": "k3"}]
+        }
+        body_mock = MagicMock()
+        body_mock.read.return_value = b"[]"
+        self.mock_s3.get_object.return_value = {"Body": body_mock}
+
+        result = list(self.storage.iter_data("logs", deadline=50))
+
+        self.assertEqual(sorted(result), [("k1", []), ("k2", [])])
+        self.assertEqual(self.mock_s3.get_object.call_count, 2)
+
+    def test_iter_all_data_lists_each_prefix_in_order(self):
+        self.mock_s3.list_objects_v2.side_effect = lambda Bucket, Prefix: {
+            "Contents": [{"Key": f"{Prefix}1"}]
+        }
+        body_mock = MagicMock()
+        body_mock.read.return_value = b"[]"
+        self.mock_s3.get_object.return_value = {"Body": body_mock}
+
+        with patch("retry.storage.DD_S3_RETRY_MAX_WORKERS", 1):
+            result = list(self.storage.iter_all_data(["metrics", "logs"]))
+
+        self.assertEqual(
+            [c.kwargs["Prefix"] for c in self.mock_s3.list_objects_v2.call_args_list],
+            [
+                "failed_events/test_function_prefix/metrics/",
+                "failed_events/test_function_prefix/logs/",
+            ],
+        )
+        self.assertEqual(
+            result,
+            [
+                ("metrics", "failed_events/test_function_prefix/metrics/1", []),
+                ("logs", "failed_events/test_function_prefix/logs/1", []),
+            ],
+        )
+
+    @patch("retry.storage.monotonic")
+    def test_iter_all_data_stops_listing_at_deadline(self, mock_monotonic):
+        mock_monotonic.side_effect = chain([0, 0, 0], repeat(100))
+        self.mock_s3.list_objects_v2.side_effect = [
+            {
+                "Contents": [{"Key": "k1"}, {"Key": "k2"}],
+                "IsTruncated": True,
+                "NextContinuationToken": "token",
+            },
+            {"Contents": [{"Key": "k3"}], "IsTruncated": False},
+        ]
+        body_mock = MagicMock()
+        body_mock.read.return_value = b"[]"
+        self.mock_s3.get_object.return_value = {"Body": body_mock}
+
+        result = list(self.storage.iter_all_data(["logs", "metrics"], deadline=50))
+
+        self.assertEqual(sorted(result), [("logs", "k1", []), ("logs", "k2", [])])
+        self.mock_s3.list_objects_v2.assert_called_once()
+
     def test_get_data_handles_fetch_error(self):
         self.mock_s3.list_objects_v2.return_value = {
             "Contents": [{"Key": "failed_events/test_function_prefix/logs/123"}]
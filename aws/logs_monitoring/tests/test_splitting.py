@@ -1,10 +1,31 @@
+import json
 import unittest
+from unittest.mock import MagicMock
+
 from steps.splitting import (
     extract_metric,
     is_trace,
+    split,
 )
 
 
+class TestSplit(unittest.TestCase):
+    def test_log_tap_called_with_each_log(self):
+        text_log = {"message": "REPORT RequestId: 1", "ddtags": ""}
+        json_log = {"message": '{"type": "platform.report"}', "ddtags": ""}
+        metric = {"message": json.dumps({"e": 0, "v": 1, "m": "foo", "t": []})}
+        metric["ddtags"] = "env:test"
+        log_tap = MagicMock()
+
+        _, logs, _ = split([text_log, metric, json_log], log_tap=log_tap)
+
+        self.assertEqual(logs, [text_log, json_log])
+        self.assertEqual(
+            [call.args for call in log_tap.call_args_list],
+            [(text_log, None), (json_log, {"type": "platform.report"})],
+        )
+
+
 class TestExtractMetric(unittest.TestCase):
     def test_empty_parsed(self):
         self.assertEqual(extract_metric({}, {}), None)
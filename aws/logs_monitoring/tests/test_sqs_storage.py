@@ -1,4 +1,6 @@
+import base64
 import json
+import os
 import unittest
 from unittest.mock import MagicMock, patch
 
@@ -6,28 +8,35 @@ from botocore.exceptions import ClientError
 
 from retry.sqs_storage import SQSStorage, SQS_MAX_CHUNK_BYTES
 
+QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/123456789012/my-queue"
+
 
 class TestSQSStorage(unittest.TestCase):
     def setUp(self):
         self.mock_sqs = MagicMock()
-        with patch("retry.sqs_storage.boto3") as mock_boto3:
-            mock_boto3.client.return_value = self.mock_sqs
-            with patch(
-                "retry.sqs_storage.DD_SQS_QUEUE_URL",
-                "https://sqs.us-east-1.amazonaws.com/123456789012/my-queue",
-            ):
-                self.storage = SQSStorage("test_function_prefix")
+        with patch(
+            "retry.sqs_storage.DD_SQS_QUEUE_URL",
+            "https://sqs.us-east-1.amazonaws.com/123456789012/my-queue",
+        ):
+            self.storage = SQSStorage("test_function_prefix")
+        self.storage.sqs_client = self.mock_sqs
+
+    def _sent_entries(self):
+        return [
+            entry
+            for call in self.mock_sqs.send_message_batch.call_args_list
+            for entry in call[1]["Entries"]
+        ]
 
     def test_store_data_sends_message_with_attributes(self):
         data = [{"message": "hello"}]
         self.storage.store_data("logs", data)
 
-        self.mock_sqs.send_message.assert_called_once()
-        call_kwargs = self.mock_sqs.send_message.call_args[1]
+        self.mock_sqs.send_message_batch.assert_called_once()
         self.assertEqual(
-            call_kwargs["QueueUrl"],
-            "https://sqs.us-east-1.amazonaws.com/123456789012/my-queue",
+            self.mock_sqs.send_message_batch.call_args[1]["QueueUrl"], QUEUE_URL
         )
+        [call_kwargs] = self._sent_entries()
         self.assertEqual(
             call_kwargs["MessageAttributes"]["retry_prefix"]["StringValue"], "logs"
         )
@@ -35,22 +44,116 @@ class TestSQSStorage(unittest.TestCase):
             call_kwargs["MessageAttributes"]["function_prefix"]["StringValue"],
             "test_function_prefix",
         )
-        self.assertEqual(json.loads(call_kwargs["MessageBody"]), data)
+        self.assertEqual(
+            call_kwargs["MessageAttributes"]["content_encoding"]["StringValue"],
+            "gzip+base64",
+        )
+        self.assertEqual(
+            self.storage._deserialize(call_kwargs["MessageBody"], "gzip+base64"), data
+        )
 
     def test_store_data_chunks_large_data(self):
-        # Create two items that each fit individually but together exceed 240KB
-        large_item = {"message": "x" * (SQS_MAX_CHUNK_BYTES - 50)}
-        small_item = {"message": "y" * 100}
-        data = [large_item, small_item]
+        # Create two barely compressible items that each fit individually
+        # but together exceed 240KB once compressed
+        item_size = SQS_MAX_CHUNK_BYTES * 2 // 3
+        data = [
+            {"message": base64.b64encode(os.urandom(item_size)).decode()[:item_size]}
+            for _ in range(2)
+        ]
 
         self.storage.store_data("logs", data)
 
         # Should send 2 messages (items can't fit in one chunk)
-        self.assertEqual(self.mock_sqs.send_message.call_count, 2)
+        entries = self._sent_entries()
+        self.assertEqual(len(entries), 2)
+        for entry in entries:
+            self.assertLessEqual(len(entry["MessageBody"]), SQS_MAX_CHUNK_BYTES)
+        # The two messages do not fit in a single batch either
+        self.assertEqual(self.mock_sqs.send_message_batch.call_count, 2)
+
+    def test_store_data_chunks_on_compressed_size(self):
+        # About 10 times the chunk size uncompressed, but compresses well
+        data = [{"message": f"log line {i} " + "x" * 1000} for i in range(2500)]
+
+        self.storage.store_data("logs", data)
+
+        self.assertEqual(len(self._sent_entries()), 1)
+
+    def test_store_data_sends_messages_in_batches_of_10(self):
+        self.storage._serialize_chunks = MagicMock(
+            return_value=[([i], f"body{i}") for i in range(25)]
+        )
+        self.storage.store_data("logs", list(range(25)))
+
+        entries = self._sent_entries()
+        self.assertEqual(len(entries), 25)
+        self.assertEqual(len({entry["Id"] for entry in entries}), 25)
+        self.assertEqual(
+            sorted(
+                len(call[1]["Entries"])
+                for call in self.mock_sqs.send_message_batch.call_args_list
+            ),
+            [5, 10, 10],
+        )
+
+    def test_store_data_retries_failed_entries(self):
+        self.mock_sqs.send_message_batch.side_effect = [
+            {"Failed": [{"Id": "1", "SenderFault": False, "Code": "InternalError"}]},
+            {},
+        ]
+        self.storage._serialize_chunks = MagicMock(
+            return_value=[([i], f"body{i}") for i in range(3)]
+        )
+        self.storage.store_data("logs", list(range(3)))
+
+        calls = self.mock_sqs.send_message_batch.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([entry["Id"] for entry in calls[1][1]["Entries"]], ["1"])
+
+    def test_store_data_does_not_retry_sender_faults(self):
+        self.mock_sqs.send_message_batch.return_value = {
+            "Failed": [{"Id": "0", "SenderFault": True, "Code": "InvalidMessage"}]
+        }
+        self.storage.store_data("logs", [{"message": "hello"}])
+
+        self.mock_sqs.send_message_batch.assert_called_once()
+
+    def test_get_data_reads_compressed_and_legacy_messages(self):
+        self.mock_sqs.receive_message.side_effect = [
+            {
+                "Messages": [
+                    {
+                        "ReceiptHandle": "compressed",
+                        "Body": self.storage._serialize([{"message": "new"}]),
+                        "MessageAttributes": {
+                            "retry_prefix": {"StringValue": "logs"},
+                            "function_prefix": {"StringValue": "test_function_prefix"},
+                            "content_encoding": {"StringValue": "gzip+base64"},
+                        },
+                    },
+                    {
+                        "ReceiptHandle": "legacy",
+                        "Body": json.dumps([{"message": "old"}]),
+                        "MessageAttributes": {
+                            "retry_prefix": {"StringValue": "logs"},
+                            "function_prefix": {"StringValue": "test_function_prefix"},
+                        },
+                    },
+                ]
+            },
+            {"Messages": []},
+        ]
+
+        result = self.storage.get_data("logs")
+
+        self.assertEqual(
+            result,
+            {"compressed": [{"message": "new"}], "legacy": [{"message": "old"}]},
+        )
 
     def test_store_data_handles_client_error(self):
-        self.mock_sqs.send_message.side_effect = ClientError(
-            {"Error": {"Code": "500", "Message": "Error"}}, "SendMessage"
+        self.mock_sqs.send_message_batch.side_effect = ClientError(
+            {"Error": {"Code": "500", "Message": "Error"}}, "SendMessageBatch"
         )
         # Should not raise
         self.storage.store_data("logs", [{"message": "hello"}])
@@ -94,10 +197,87 @@ class TestSQSStorage(unittest.TestCase):
 
         result = self.storage.get_data("logs")
         self.assertEqual(result, {})
-        self.mock_sqs.change_message_visibility.assert_called_once_with(
-            QueueUrl="https://sqs.us-east-1.amazonaws.com/123456789012/my-queue",
-            ReceiptHandle="handle_other",
-            VisibilityTimeout=0,
+        self.mock_sqs.change_message_visibility_batch.assert_called_once_with(
+            QueueUrl=QUEUE_URL,
+            Entries=[
+                {"Id": "0", "ReceiptHandle": "handle_other", "VisibilityTimeout": 0}
+            ],
+        )
+
+    def _message(self, receipt_handle, retry_prefix):
+        return {
+            "ReceiptHandle": receipt_handle,
+            "Body": json.dumps([receipt_handle]),
+            "MessageAttributes": {
+                "retry_prefix": {"StringValue": retry_prefix},
+                "function_prefix": {"StringValue": "test_function_prefix"},
+            },
+        }
+
+    def test_get_data_releases_other_prefixes_when_received(self):
+        self.mock_sqs.receive_message.side_effect = [
+            {
+                "Messages": [
+                    self._message("log1", "logs"),
+                    self._message("metric1", "metrics"),
+                    self._message("trace1", "traces"),
+                ]
+            },
+            {"Messages": []},
+        ]
+
+        self.assertEqual(self.storage.get_data("logs"), {"log1": ["log1"]})
+
+        self.mock_sqs.change_message_visibility_batch.assert_called_once_with(
+            QueueUrl=QUEUE_URL,
+            Entries=[
+                {"Id": "0", "ReceiptHandle": "metric1", "VisibilityTimeout": 0},
+                {"Id": "1", "ReceiptHandle": "trace1", "VisibilityTimeout": 0},
+            ],
+        )
+
+    def test_iter_all_data_yields_prefixes_in_order_from_one_pass(self):
+        self.mock_sqs.receive_message.side_effect = [
+            {
+                "Messages": [
+                    self._message("log1", "logs"),
+                    self._message("metric1", "metrics"),
+                    self._message("trace1", "traces"),
+                ]
+            },
+            {"Messages": []},
+        ]
+
+        iterator = self.storage.iter_all_data(["metrics", "logs", "traces"])
+        self.assertEqual(next(iterator), ("metrics", "metric1", ["metric1"]))
+        self.assertEqual(next(iterator), ("logs", "log1", ["log1"]))
+        iterator.close()
+        self.assertEqual(self.mock_sqs.receive_message.call_count, 2)
+
+        # The message which was not yielded is released on flush
+        self.storage.flush()
+        self.mock_sqs.change_message_visibility_batch.assert_called_once_with(
+            QueueUrl=QUEUE_URL,
+            Entries=[{"Id": "0", "ReceiptHandle": "trace1", "VisibilityTimeout": 0}],
+        )
+
+    def test_iter_all_data_releases_other_functions_when_received(self):
+        other_function = self._message("other1", "logs")
+        other_function["MessageAttributes"]["function_prefix"][
+            "StringValue"
+        ] = "other_function"
+        self.mock_sqs.receive_message.side_effect = [
+            {"Messages": [other_function, self._message("log1", "logs")]},
+            {"Messages": []},
+        ]
+
+        iterator = self.storage.iter_all_data(["logs"])
+        self.assertEqual(next(iterator), ("logs", "log1", ["log1"]))
+
+        # Released before any message is retried
+        self.mock_sqs.change_message_visibility_batch.assert_called_once_with(
+            QueueUrl=QUEUE_URL,
+            Entries=[{"Id": "0", "ReceiptHandle": "other1", "VisibilityTimeout": 0}],
         )
 
     def test_get_data_handles_empty_queue(self):
@@ -136,21 +316,49 @@ class TestSQSStorage(unittest.TestCase):
 
         result = self.storage.get_data("logs")
         self.assertEqual(result, {})
+        # Deleted, instead of being received again forever
+        self.mock_sqs.delete_message_batch.assert_called_once_with(
+            QueueUrl=QUEUE_URL, Entries=[{"Id": "0", "ReceiptHandle": "handle1"}]
+        )
 
-    def test_delete_data_calls_delete_message(self):
+    def test_delete_data_deletes_on_flush(self):
+        self.storage.delete_data("receipt_handle_123")
         self.storage.delete_data("receipt_handle_123")
-        self.mock_sqs.delete_message.assert_called_once_with(
-            QueueUrl="https://sqs.us-east-1.amazonaws.com/123456789012/my-queue",
-            ReceiptHandle="receipt_handle_123",
+        self.mock_sqs.delete_message_batch.assert_not_called()
+
+        self.storage.flush()
+        self.mock_sqs.delete_message_batch.assert_called_once_with(
+            QueueUrl=QUEUE_URL,
+            Entries=[{"Id": "0", "ReceiptHandle": "receipt_handle_123"}],
         )
 
+    def test_delete_data_sends_full_batches(self):
+        for i in range(12):
+            self.storage.delete_data(f"handle_{i}")
+
+        self.mock_sqs.delete_message_batch.assert_called_once()
+        self.assertEqual(
+            len(self.mock_sqs.delete_message_batch.call_args[1]["Entries"]), 10
+        )
+
+        self.storage.flush()
+        self.assertEqual(self.mock_sqs.delete_message_batch.call_count, 2)
+        self.assertEqual(
+            len(self.mock_sqs.delete_message_batch.call_args[1]["Entries"]), 2
+        )
+
+    def test_flush_without_pending_deletes(self):
+        self.storage.flush()
+        self.mock_sqs.delete_message_batch.assert_not_called()
+
     def test_delete_data_is_idempotent(self):
-        self.mock_sqs.delete_message.side_effect = ClientError(
+        self.mock_sqs.delete_message_batch.side_effect = ClientError(
             {"Error": {"Code": "ReceiptHandleIsInvalid", "Message": "Error"}},
-            "DeleteMessage",
+            "DeleteMessageBatch",
         )
         # Should not raise
         self.storage.delete_data("already_deleted_handle")
+        self.storage.flush()
 
     def test_chunk_data_single_small_list(self):
         data = [{"a": 1}, {"b": 2}]
@@ -1,35 +1,43 @@
+import tempfile
 import unittest
 from unittest.mock import patch
 
+from retry.disk_storage import DiskStorage
 from retry.storage import S3Storage
 from retry.sqs_storage import SQSStorage
+from retry.write_behind_storage import WriteBehindStorage
 
 
 class TestCreateStorage(unittest.TestCase):
-    @patch("retry.sqs_storage.boto3")
+    @patch("retry.sqs_storage.get_client")
     @patch("retry.DD_SQS_QUEUE_URL", "https://sqs.us-east-1.amazonaws.com/123/queue")
     @patch(
         "retry.sqs_storage.DD_SQS_QUEUE_URL",
         "https://sqs.us-east-1.amazonaws.com/123/queue",
     )
-    def test_sqs_backend_when_queue_url_set(self, mock_boto3):
+    def test_sqs_backend_when_queue_url_set(self, mock_get_client):
         from retry import create_storage
 
         storage = create_storage("func_prefix")
         self.assertIsInstance(storage, SQSStorage)
+        # The client is only created once the queue is used
+        mock_get_client.assert_not_called()
+        storage.sqs_client
+        mock_get_client.assert_called_once_with("sqs")
 
-    @patch("retry.storage.boto3")
+    @patch("retry.storage.get_client")
     @patch("retry.DD_SQS_QUEUE_URL", None)
     @patch("retry.storage.DD_S3_BUCKET_NAME", "my-bucket")
-    def test_s3_backend_when_no_queue_url(self, mock_boto3):
+    def test_s3_backend_when_no_queue_url(self, mock_get_client):
         from retry import create_storage
 
         storage = create_storage("func_prefix")
         self.assertIsInstance(storage, S3Storage)
+        mock_get_client.assert_not_called()
 
-    @patch("retry.storage.boto3")
+    @patch("retry.storage.get_client")
     @patch("retry.DD_SQS_QUEUE_URL", None)
-    def test_falls_back_to_s3_when_no_backend_configured(self, mock_boto3):
+    def test_falls_back_to_s3_when_no_backend_configured(self, mock_get_client):
         """When no SQS queue is configured, always fall back to S3Storage.
 
         This preserves backward compatibility: S3Storage with an empty bucket
@@ -40,19 +48,47 @@ class TestCreateStorage(unittest.TestCase):
         storage = create_storage("func_prefix")
         self.assertIsInstance(storage, S3Storage)
 
-    @patch("retry.sqs_storage.boto3")
+    @patch("retry.sqs_storage.get_client")
     @patch("retry.DD_SQS_QUEUE_URL", "https://sqs.us-east-1.amazonaws.com/123/queue")
     @patch(
         "retry.sqs_storage.DD_SQS_QUEUE_URL",
         "https://sqs.us-east-1.amazonaws.com/123/queue",
     )
-    def test_sqs_takes_priority_over_s3(self, mock_boto3):
+    def test_sqs_takes_priority_over_s3(self, mock_get_client):
         """SQS is selected even when S3 bucket is not set."""
         from retry import create_storage
 
         storage = create_storage("func_prefix")
         self.assertIsInstance(storage, SQSStorage)
 
+    @patch("retry.storage.get_client")
+    @patch("retry.DD_SQS_QUEUE_URL", None)
+    @patch("retry.DD_RETRY_DISK_WRITE_BEHIND", True)
+    def test_write_behind_when_disk_path_set(self, mock_get_client):
+        from retry import create_storage
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with patch("retry.DD_RETRY_DISK_PATH", temp_dir), patch(
+                "retry.disk_storage.DD_RETRY_DISK_PATH", temp_dir
+            ):
+                storage = create_storage("func_prefix")
+
+        self.assertIsInstance(storage, WriteBehindStorage)
+        self.assertIsInstance(storage.local, DiskStorage)
+        self.assertIsInstance(storage.remote, S3Storage)
+
+    @patch("retry.DD_RETRY_DISK_WRITE_BEHIND", False)
+    def test_disk_only_when_write_behind_disabled(self):
+        from retry import create_storage
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with patch("retry.DD_RETRY_DISK_PATH", temp_dir), patch(
+                "retry.disk_storage.DD_RETRY_DISK_PATH", temp_dir
+            ):
+                storage = create_storage("func_prefix")
+
+        self.assertIsInstance(storage, DiskStorage)
+
 
 if __name__ == "__main__":
     unittest.main()
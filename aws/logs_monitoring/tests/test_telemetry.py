@@ -0,0 +1,186 @@
+import unittest
+from time import time
+from unittest.mock import call, patch
+
+from telemetry import (
+    TelemetryRegistry,
+    flush_forwarder_telemetry,
+    send_forwarder_internal_metrics,
+    send_log_metrics,
+)
+
+# A recent timestamp, in seconds
+RECENT = int(time()) - 60
+
+
+def get_points(mock_lambda_metric):
+    """Returns the submitted values, {(name, tags, timestamp): [values]}"""
+    points = {}
+    for metric_call in mock_lambda_metric.call_args_list:
+        key = (
+            metric_call.args[0],
+            tuple(metric_call.kwargs["tags"]),
+            metric_call.kwargs["timestamp"],
+        )
+        points.setdefault(key, []).append(metric_call.args[1])
+    return points
+
+
+@patch("telemetry.DD_SUBMIT_ENHANCED_METRICS", True)
+@patch("telemetry.lambda_metric", create=True)
+class TestSendLogMetrics(unittest.TestCase):
+    def test_each_metric_submitted_at_its_timestamp(self, mock_lambda_metric):
+        metrics = [
+            {"m": "requests", "v": 1, "e": RECENT + 1, "t": ["env:prod"]},
+            {"m": "requests", "v": 2, "e": RECENT + 9, "t": ["env:prod"]},
+            {"m": "requests", "v": 3, "e": RECENT + 11.5, "t": ["env:prod"]},
+            {"m": "latency", "v": 0.5, "e": RECENT + 3, "t": None},
+        ]
+
+        self.assertEqual(send_log_metrics(metrics), [])
+
+        self.assertEqual(mock_lambda_metric.call_count, 4)
+        self.assertEqual(
+            mock_lambda_metric.call_args_list,
+            [
+                call("requests", 1.0, timestamp=RECENT + 1, tags=["env:prod"]),
+                call("requests", 2.0, timestamp=RECENT + 9, tags=["env:prod"]),
+                call("requests", 3.0, timestamp=RECENT + 11.5, tags=["env:prod"]),
+                call("latency", 0.5, timestamp=RECENT + 3, tags=[]),
+            ],
+        )
+
+    def test_only_unsent_metrics_returned(self, mock_lambda_metric):
+        metrics = [{"m": "requests", "v": i, "e": RECENT, "t": []} for i in range(3)]
+        mock_lambda_metric.side_effect = [None, Exception("closed"), None]
+
+        failed_metrics = send_log_metrics(metrics)
+
+        self.assertEqual(mock_lambda_metric.call_count, 3)
+        self.assertEqual(failed_metrics, metrics[1:2])
+
+    def test_points_older_than_4_hours_dropped(self, mock_lambda_metric):
+        old = {"m": "requests", "v": 1, "e": RECENT - 5 * 60 * 60, "t": []}
+
+        self.assertEqual(send_log_metrics([old]), [])
+        mock_lambda_metric.assert_not_called()
+
+    def test_invalid_metric_returned(self, mock_lambda_metric):
+        invalid = {"m": "requests", "v": "many", "e": RECENT, "t": []}
+
+        self.assertEqual(send_log_metrics([invalid]), [invalid])
+        mock_lambda_metric.assert_not_called()
+
+
+@patch("telemetry.DD_FORWARDER_TELEMETRY_TAGS", ["forwardername:test"])
+@patch("telemetry.lambda_metric", create=True)
+class TestTelemetryRegistry(unittest.TestCase):
+    def get_distributions(self, mock_lambda_metric):
+        """Returns the submitted values, {(name, tags): [values]}"""
+        distributions = {}
+        for (name, tags, _), values in get_points(mock_lambda_metric).items():
+            distributions.setdefault((name, tags), []).extend(values)
+        return distributions
+
+    def test_metrics_aggregated_until_flush(self, mock_lambda_metric):
+        registry = TelemetryRegistry()
+        for _ in range(3):
+            registry.increment("loggroup_local_cache_hit")
+        registry.increment("loggroup_local_cache_hit", ["prefix:lambda"])
+        registry.gauge("retry_payloads", 5)
+        registry.gauge("retry_payloads", 2)
+        registry.distribution("incoming_events", 10)
+        registry.distribution("incoming_events", 20)
+        mock_lambda_metric.assert_not_called()
+
+        self.assertEqual(registry.flush(), 4)
+
+        self.assertEqual(
+            self.get_distributions(mock_lambda_metric),
+            {
+                (
+                    "aws.dd_forwarder.loggroup_local_cache_hit",
+                    ("forwardername:test",),
+                ): [3.0],
+                (
+                    "aws.dd_forwarder.loggroup_local_cache_hit",
+                    ("forwardername:test", "prefix:lambda"),
+                ): [1.0],
+                ("aws.dd_forwarder.retry_payloads", ("forwardername:test",)): [2.0],
+                ("aws.dd_forwarder.incoming_events", ("forwardername:test",)): [
+                    10.0,
+                    20.0,
+                ],
+            },
+        )
+
+    def test_one_call_per_counter_and_gauge(self, mock_lambda_metric):
+        registry = TelemetryRegistry()
+        for _ in range(100):
+            registry.increment("loggroup_local_cache_hit")
+            registry.gauge("retry_payloads", 5)
+        registry.increment("logs_forwarded", value=250)
+
+        registry.flush()
+
+        self.assertEqual(mock_lambda_metric.call_count, 3)
+
+    def test_invalid_values_dropped_when_recorded(self, mock_lambda_metric):
+        registry = TelemetryRegistry()
+        with self.assertLogs(level="ERROR"):
+            registry.increment("logs_forwarded", value="many")
+            registry.gauge("retry_payloads", None)
+            registry.distribution("incoming_events", [1, 2])
+        registry.distribution("incoming_events", 10)
+
+        self.assertEqual(registry.flush(), 1)
+        mock_lambda_metric.assert_called_once()
+
+    def test_flush_does_not_raise_when_submission_fails(self, mock_lambda_metric):
+        mock_lambda_metric.side_effect = Exception("closed")
+        registry = TelemetryRegistry()
+        registry.increment("logs_forwarded")
+        registry.gauge("retry_payloads", 5)
+
+        with self.assertLogs(level="ERROR"):
+            registry.flush()
+
+        self.assertEqual(mock_lambda_metric.call_count, 2)
+
+    def test_flush_resets_the_registry(self, mock_lambda_metric):
+        registry = TelemetryRegistry()
+        registry.increment("s3_cache_expired")
+        registry.flush()
+
+        self.assertEqual(registry.flush(), 0)
+        mock_lambda_metric.assert_called_once()
+
+    @patch("telemetry.monotonic", side_effect=[1.0, 1.25])
+    def test_timer_records_milliseconds(self, mock_monotonic, mock_lambda_metric):
+        registry = TelemetryRegistry()
+        with registry.timer("forward_duration", ["stage:forward"]):
+            pass
+        registry.flush()
+
+        self.assertEqual(
+            self.get_distributions(mock_lambda_metric),
+            {
+                (
+                    "aws.dd_forwarder.forward_duration",
+                    ("forwardername:test", "stage:forward"),
+                ): [250.0]
+            },
+        )
+
+    @patch("telemetry.DD_SUBMIT_ENHANCED_METRICS", False)
+    @patch("telemetry.telemetry_registry")
+    def test_noop_without_the_layer(self, mock_registry, mock_lambda_metric):
+        send_forwarder_internal_metrics("loggroup_local_cache_hit")
+        flush_forwarder_telemetry()
+
+        mock_registry.increment.assert_not_called()
+        mock_registry.flush.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
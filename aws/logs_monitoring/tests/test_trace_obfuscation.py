@@ -0,0 +1,140 @@
+import unittest
+
+from trace_forwarder.obfuscation import (
+    NON_PARSABLE_SQL_RESOURCE,
+    obfuscate_json,
+    obfuscate_memcached,
+    obfuscate_redis,
+    obfuscate_span,
+    obfuscate_sql,
+    obfuscate_url,
+    quantize_redis,
+)
+
+
+def make_span(span_type, resource="", meta=None):
+    return {"type": span_type, "resource": resource, "span_id": 1, "meta": meta or {}}
+
+
+class TestObfuscateSQL(unittest.TestCase):
+    def test_literals_replaced(self):
+        self.assertEqual(
+            obfuscate_sql(
+                "SELECT * FROM users WHERE id = 42 AND name = 'O''Brien' "
+                "AND active = TRUE AND deleted_at IS NULL"
+            ),
+            "SELECT * FROM users WHERE id = ? AND name = ? AND active = ? "
+            "AND deleted_at IS ?",
+        )
+
+    def test_placeholders_replaced_and_identifiers_kept(self):
+        self.assertEqual(
+            obfuscate_sql('SELECT u.id, "Name" FROM t u WHERE a = $1 AND b = :b'),
+            'SELECT u.id, "Name" FROM t u WHERE a = ? AND b = ?',
+        )
+
+    def test_comments_removed(self):
+        self.assertEqual(
+            obfuscate_sql("SELECT /* secret */ a FROM t -- trailing\nWHERE b = 1"),
+            "SELECT a FROM t WHERE b = ?",
+        )
+
+    def test_lists_collapsed(self):
+        self.assertEqual(
+            obfuscate_sql("DELETE FROM t WHERE id IN (1, 2, 3)"),
+            "DELETE FROM t WHERE id IN ( ? )",
+        )
+        self.assertEqual(
+            obfuscate_sql("INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y')"),
+            "INSERT INTO t ( a, b ) VALUES ( ? )",
+        )
+
+    def test_non_parsable_query(self):
+        span = make_span("sql", "SELECT * FROM t WHERE name = 'unterminated")
+
+        obfuscate_span(span)
+
+        self.assertEqual(span["resource"], NON_PARSABLE_SQL_RESOURCE)
+        self.assertEqual(span["meta"]["sql.query"], NON_PARSABLE_SQL_RESOURCE)
+
+    def test_sql_span_obfuscated(self):
+        span = make_span(
+            "cassandra",
+            "SELECT * FROM t WHERE k = 'v'",
+            {"sql.query": "SELECT * FROM t WHERE k = 'v'"},
+        )
+
+        obfuscate_span(span)
+
+        self.assertEqual(span["resource"], "SELECT * FROM t WHERE k = ?")
+        self.assertEqual(span["meta"]["sql.query"], "SELECT * FROM t WHERE k = ?")
+
+
+class TestObfuscateRedis(unittest.TestCase):
+    def test_resource_quantized(self):
+        self.assertEqual(
+            quantize_redis("SET key value\nclient list"), "SET CLIENT LIST"
+        )
+        self.assertEqual(
+            quantize_redis("GET a\nGET b\nGET c\nGET d"), "GET GET GET ..."
+        )
+        self.assertEqual(quantize_redis("GET a\nSE..."), "GET ...")
+
+    def test_values_replaced_keys_kept(self):
+        self.assertEqual(
+            obfuscate_redis('SET key "a secret" EX 10\nAUTH password\nHSET h f v'),
+            "SET key ? EX 10\nAUTH ?\nHSET h f ?",
+        )
+        self.assertEqual(obfuscate_redis("MSET a 1 b 2"), "MSET a ? b ?")
+        self.assertEqual(obfuscate_redis("SADD set m1 m2"), "SADD set ?")
+        self.assertEqual(obfuscate_redis("GET key"), "GET key")
+
+    def test_redis_span_obfuscated(self):
+        span = make_span("redis", "SET key value", {"redis.raw_command": "SET key v"})
+
+        obfuscate_span(span)
+
+        self.assertEqual(span["resource"], "SET")
+        self.assertEqual(span["meta"]["redis.raw_command"], "SET key ?")
+
+
+class TestObfuscateOther(unittest.TestCase):
+    def test_memcached_value_removed(self):
+        self.assertEqual(
+            obfuscate_memcached("set key 0 0 6\r\nsecret\r\n"), "set key 0 0 6"
+        )
+
+    def test_url_query_and_digits_removed(self):
+        self.assertEqual(
+            obfuscate_url("https://example.com/users/42/orders?token=abc#top"),
+            "https://example.com/users/?/orders?#top",
+        )
+        self.assertEqual(
+            obfuscate_url("https://example.com/health"), "https://example.com/health"
+        )
+
+    def test_json_values_replaced(self):
+        self.assertEqual(
+            obfuscate_json('{"index": {}}\n{"user": "jane", "ids": [1, 2]}'),
+            '{"index":{}}\n{"user":"?","ids":["?","?"]}',
+        )
+        self.assertEqual(obfuscate_json("{invalid"), "?")
+
+    def test_span_tags_obfuscated_by_type(self):
+        http_span = make_span(
+            "web", meta={"http.url": "https://a.com/x?q=1", "error.stack": "trace"}
+        )
+        mongo_span = make_span("mongodb", meta={"mongodb.query": '{"_id": 1}'})
+        other_span = make_span("custom", "SELECT 'kept'")
+
+        for span in (http_span, mongo_span, other_span):
+            obfuscate_span(span)
+
+        self.assertEqual(http_span["meta"]["http.url"], "https://a.com/x?")
+        self.assertEqual(http_span["meta"]["error.stack"], "?")
+        self.assertEqual(mongo_span["meta"]["mongodb.query"], '{"_id":"?"}')
+        self.assertEqual(other_span["resource"], "SELECT 'kept'")
+
+
+if __name__ == "__main__":
+    unittest.main()
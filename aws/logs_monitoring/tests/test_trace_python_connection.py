@@ -0,0 +1,405 @@
+import glob
+import gzip
+import json
+import os
+import re
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+from trace_forwarder import create_trace_connection
+from trace_forwarder.pb.trace_payload_pb2 import TracePayload
+from trace_forwarder.python_connection import (
+    PythonTraceConnection,
+    add_tags_to_trace_payloads,
+    decode_apm_id,
+    encode_trace_payload,
+    process_trace,
+)
+
+TRACE_FORWARDER_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trace_forwarder"
+)
+GO_TESTDATA_DIR = os.path.join(TRACE_FORWARDER_DIR, "internal", "apm", "testdata")
+GO_LIBRARY_PATH = os.path.join(TRACE_FORWARDER_DIR, "bin", "trace-intake.so")
+GO_STRING = r'"((?:[^"\\]|\\.)*)"'
+GO_MAP_ENTRY_PATTERN = re.compile(
+    rf"^\(string\) \(len=\d+\) {GO_STRING}: \((\w+)\) (?:\(len=\d+\) )?(.*?),?$"
+)
+GO_FIELD_PATTERN = re.compile(r"^(\w+): \((\w+)\) (?:\(len=\d+\) )?(.*?),?$")
+GO_MAP_FIELD_PATTERN = re.compile(r"^(\w+): \(map\[string\]\w+\) (<nil>|.*\{),?$")
+
+
+def make_trace_message(spans):
+    return json.dumps({"traces": [spans]})
+
+
+LAMBDA_SPAN = {
+    "trace_id": "5f5a2bd1c9a2b07a",
+    "span_id": "1",
+    "parent_id": "0",
+    "name": "aws.lambda",
+    "service": "aws.lambda",
+    "resource": "handler",
+    "start": 1000,
+    "duration": 500,
+    "meta": {"env": "staging"},
+    "metrics": {"_sampling_priority_v1": 1},
+}
+
+CHILD_SPAN = {
+    "trace_id": "5f5a2bd1c9a2b07a",
+    "span_id": "2",
+    "parent_id": "1",
+    "name": "http.request",
+    "service": "aws.lambda-http-client",
+    "resource": "GET",
+    "start": 1100,
+    "duration": 200,
+    "type": "http",
+}
+
+
+def parse_go_value(value_type, value):
+    if value_type == "string":
+        return json.loads(value)
+    if value_type.startswith("float"):
+        return float(value)
+    return int(value)
+
+
+def parse_go_snapshot_spans(path):
+    """Returns {span ID: span fields} of a go-spew dump of trace payloads"""
+    spans = {}
+    span = None
+    map_field = None
+    with open(path) as snapshot_file:
+        for line in snapshot_file:
+            line = line.strip()
+            if line == "(*pb.Span)({":
+                span = {}
+            elif span is None:
+                continue
+            elif line in ("})", "}),"):
+                spans[span["SpanID"]] = span
+                span = None
+            elif map_field is not None:
+                if line in ("}", "},"):
+                    map_field = None
+                    continue
+                key, value_type, value = GO_MAP_ENTRY_PATTERN.match(line).groups()
+                span[map_field][json.loads(f'"{key}"')] = parse_go_value(
+                    value_type, value
+                )
+            elif match := GO_MAP_FIELD_PATTERN.match(line):
+                name, value = match.groups()
+                span[name] = {}
+                map_field = None if value == "<nil>" else name
+            else:
+                name, value_type, value = GO_FIELD_PATTERN.match(line).groups()
+                span[name] = parse_go_value(value_type, value)
+    return spans
+
+
+class TraceIntakeRecorder(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.server.payloads.append(TracePayload.FromString(body))
+        self.send_response(202)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestProcessTrace(unittest.TestCase):
+    def test_spans_grouped_by_trace_with_lambda_origin(self):
+        [payload] = process_trace(make_trace_message([LAMBDA_SPAN, CHILD_SPAN]), "")
+
+        self.assertEqual(payload["env"], "staging")
+        [trace] = payload["traces"]
+        self.assertEqual(trace["trace_id"], 0x5F5A2BD1C9A2B07A)
+        self.assertEqual(trace["start_time"], 1000)
+        self.assertEqual(trace["end_time"], 1500)
+        root, child = trace["spans"]
+        self.assertEqual(root["meta"]["_dd.origin"], "lambda")
+        self.assertEqual(root["meta"]["_dd.compute_stats"], "1")
+        self.assertEqual(root["metrics"]["_top_level"], 1.0)
+        # Parented to a span of another service
+        self.assertEqual(child["metrics"]["_top_level"], 1.0)
+
+    def test_xray_parented_spans_removed_and_children_reparented(self):
+        xray_root = dict(
+            LAMBDA_SPAN,
+            span_id="1",
+            parent_id="9",
+            meta={"_dd.parent_source": "xray"},
+        )
+        [payload] = process_trace(make_trace_message([xray_root, CHILD_SPAN]), "")
+
+        [span] = payload["traces"][0]["spans"]
+        self.assertEqual(span["span_id"], 2)
+        self.assertEqual(span["parent_id"], 9)
+
+    def test_tags_applied_and_lambda_service_remapped(self):
+        inferred_span = dict(
+            CHILD_SPAN,
+            span_id="3",
+            service="api-gateway",
+            meta={"_inferred_span.tag_source": "self"},
+        )
+        [payload] = process_trace(
+            make_trace_message([LAMBDA_SPAN, CHILD_SPAN, inferred_span]),
+            "service:checkout,env:prod,team:payments,invalid",
+        )
+
+        self.assertEqual(payload["env"], "prod")
+        root, child, inferred = payload["traces"][0]["spans"]
+        self.assertEqual(root["service"], "checkout")
+        self.assertEqual(child["service"], "checkout-http-client")
+        self.assertEqual(root["meta"]["team"], "payments")
+        self.assertEqual(inferred["service"], "api-gateway")
+        self.assertNotIn("team", inferred["meta"])
+
+    def test_empty_trace_list(self):
+        self.assertEqual(process_trace(json.dumps({"traces": [[]]}), ""), [])
+
+    def test_decode_apm_id(self):
+        self.assertEqual(decode_apm_id("ff"), 255)
+        self.assertEqual(decode_apm_id("1" + "0" * 16), 0)
+        self.assertEqual(decode_apm_id("not-hex"), 0)
+
+
+class TestEncodeTracePayload(unittest.TestCase):
+    def test_trace_payload_encoding(self):
+        [payload] = process_trace(make_trace_message([LAMBDA_SPAN, CHILD_SPAN]), "")
+
+        message = TracePayload.FromString(
+            encode_trace_payload(payload["env"], payload["traces"])
+        )
+
+        self.assertEqual(message.hostName, "")
+        self.assertEqual(message.env, "staging")
+        [api_trace] = message.traces
+        self.assertEqual(api_trace.traceID, 0x5F5A2BD1C9A2B07A)
+        self.assertEqual(api_trace.startTime, 1000)
+        self.assertEqual(api_trace.endTime, 1500)
+
+        span, child = api_trace.spans
+        self.assertEqual(span.service, "aws.lambda")
+        self.assertEqual(span.name, "aws.lambda")
+        self.assertEqual(span.resource, "handler")
+        self.assertEqual(span.traceID, 0x5F5A2BD1C9A2B07A)
+        self.assertEqual(span.spanID, 1)
+        self.assertEqual(span.parentID, 0)
+        self.assertEqual(span.start, 1000)
+        self.assertEqual(span.duration, 500)
+        self.assertEqual(span.error, 0)
+        self.assertEqual(
+            dict(span.meta),
+            {"env": "staging", "_dd.origin": "lambda", "_dd.compute_stats": "1"},
+        )
+        self.assertEqual(
+            dict(span.metrics), {"_sampling_priority_v1": 1.0, "_top_level": 1.0}
+        )
+        self.assertEqual(child.parentID, 1)
+        self.assertEqual(child.type, "http")
+
+    def test_sql_resource_obfuscated(self):
+        sql_span = dict(
+            CHILD_SPAN,
+            span_id="3",
+            type="sql",
+            resource="SELECT * FROM users WHERE email = 'jane@example.com'",
+        )
+        [payload] = process_trace(make_trace_message([LAMBDA_SPAN, sql_span]), "")
+
+        message = TracePayload.FromString(
+            encode_trace_payload(payload["env"], payload["traces"])
+        )
+
+        span = message.traces[0].spans[1]
+        self.assertEqual(span.resource, "SELECT * FROM users WHERE email = ?")
+        self.assertEqual(span.meta["sql.query"], "SELECT * FROM users WHERE email = ?")
+
+
+class TestGoParity(unittest.TestCase):
+    """The Python client processes spans like the Go trace-intake library"""
+
+    def test_processed_spans_match_go_snapshots(self):
+        for path in sorted(glob.glob(os.path.join(GO_TESTDATA_DIR, "*.json"))):
+            with self.subTest(os.path.basename(path)), open(path) as testdata_file:
+                testdata = json.load(testdata_file)
+                go_spans = parse_go_snapshot_spans(f"{path}~snapshot")
+
+                payloads = process_trace(
+                    json.dumps(testdata["trace"]), testdata["tags"]
+                )
+                # The snapshots were taken with the tags applied twice
+                add_tags_to_trace_payloads(payloads, testdata["tags"])
+
+                spans = [
+                    span
+                    for payload in payloads
+                    for trace in payload["traces"]
+                    for span in trace["spans"]
+                ]
+                self.assertEqual(len(spans), len(go_spans))
+                for span in spans:
+                    go_span = go_spans[span["span_id"]]
+                    self.assertEqual(
+                        (span["service"], span["name"], span["resource"]),
+                        (go_span["Service"], go_span["Name"], go_span["Resource"]),
+                    )
+                    self.assertEqual(span["parent_id"], go_span["ParentID"])
+                    self.assertEqual(span["type"], go_span["Type"])
+                    self.assertEqual(span["meta"], go_span["Meta"])
+                    # Sublayer metrics are only computed by the Go library
+                    self.assertEqual(
+                        span["metrics"] or {},
+                        {
+                            key: value
+                            for key, value in go_span["Metrics"].items()
+                            if not key.startswith("_sublayers.")
+                        },
+                    )
+
+    @unittest.skipUnless(
+        os.path.exists(GO_LIBRARY_PATH), "trace-intake.so not built, run make"
+    )
+    def test_obfuscation_matches_go_library(self):
+        from trace_forwarder.connection import TraceConnection
+
+        spans = [LAMBDA_SPAN]
+        for index, (span_type, resource, meta) in enumerate(
+            [
+                ("sql", "SELECT * FROM t WHERE id = 42 AND name = 'O''Brien'", {}),
+                ("sql", "UPDATE t SET a = NULL WHERE id IN (1, 2, 3) -- note", {}),
+                ("sql", "INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y')", {}),
+                ("cassandra", "SELECT /* c */ a FROM t WHERE b = $1", {}),
+                (
+                    "redis",
+                    "SET key value\nCLIENT LIST",
+                    {
+                        "redis.raw_command": 'SET key "a secret" EX 10\n'
+                        "AUTH password\nHSET h f v\nMSET a 1 b 2\nSADD s m1 m2"
+                    },
+                ),
+                ("redis", "GET a\nGET b\nGET c\nGET d", {}),
+                (
+                    "http",
+                    "GET",
+                    {"http.url": "https://a.com/users/42/orders?token=abc#top"},
+                ),
+                ("web", "GET", {"http.url": "https://a.com/health"}),
+            ]
+        ):
+            spans.append(
+                dict(
+                    CHILD_SPAN,
+                    span_id=format(index + 2, "x"),
+                    type=span_type,
+                    resource=resource,
+                    meta=meta,
+                )
+            )
+        serialized = json.dumps(
+            [{"message": make_trace_message(spans), "tags": ""}]
+        ).encode("UTF-8")
+
+        spans_by_client = {}
+        for name, connection_class in (
+            ("go", TraceConnection),
+            ("python", PythonTraceConnection),
+        ):
+            intake = ThreadingHTTPServer(("127.0.0.1", 0), TraceIntakeRecorder)
+            intake.payloads = []
+            threading.Thread(target=intake.serve_forever, daemon=True).start()
+            try:
+                connection_class(
+                    f"http://127.0.0.1:{intake.server_port}", "key", False
+                ).send_traces(serialized)
+            finally:
+                intake.shutdown()
+                intake.server_close()
+            spans_by_client[name] = {
+                span.spanID: (span.resource, dict(span.meta))
+                for payload in intake.payloads
+                for trace in payload.traces
+                for span in trace.spans
+            }
+
+        self.assertEqual(spans_by_client["python"], spans_by_client["go"])
+
+
+class TestPythonTraceConnection(unittest.TestCase):
+    def setUp(self):
+        self.connection = PythonTraceConnection("https://trace.intake", "key", False)
+        self.connection._session = MagicMock()
+        self.connection._session.post.return_value.status_code = 202
+        self.serialized = json.dumps(
+            [
+                {"message": make_trace_message([LAMBDA_SPAN]), "tags": ""},
+                {"message": make_trace_message([LAMBDA_SPAN]), "tags": "env:prod"},
+            ]
+        ).encode("UTF-8")
+
+    @patch("trace_forwarder.python_connection.DD_USE_COMPRESSION", True)
+    def test_one_gzipped_request_per_env(self):
+        self.connection.send_traces(self.serialized)
+
+        self.assertEqual(self.connection._session.post.call_count, 2)
+        envs = []
+        for call in self.connection._session.post.call_args_list:
+            self.assertEqual(call.args[0], "https://trace.intake/api/v0.2/traces")
+            message = TracePayload.FromString(gzip.decompress(call.kwargs["data"]))
+            envs.append(message.env)
+        self.assertEqual(sorted(envs), ["prod", "staging"])
+
+    @patch("trace_forwarder.python_connection.time.sleep")
+    def test_failed_request_retried(self, mock_sleep):
+        failure = MagicMock(status_code=503)
+        success = MagicMock(status_code=200)
+        self.connection._session.post.side_effect = [
+            ConnectionError("reset"),
+            failure,
+            success,
+            success,
+        ]
+
+        self.connection.send_traces(self.serialized)
+
+        self.assertEqual(self.connection._session.post.call_count, 4)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch("trace_forwarder.python_connection.time.sleep")
+    def test_exception_raised_when_attempts_exhausted(self, mock_sleep):
+        self.connection._session.post.return_value.status_code = 500
+
+        with self.assertRaises(Exception):
+            self.connection.send_traces(self.serialized)
+
+        # Both envs attempted, three times each
+        self.assertEqual(self.connection._session.post.call_count, 6)
+
+    def test_nothing_sent_without_traces(self):
+        self.connection.send_traces(
+            json.dumps([{"message": json.dumps({"traces": []}), "tags": ""}])
+        )
+
+        self.connection._session.post.assert_not_called()
+
+
+class TestCreateTraceConnection(unittest.TestCase):
+    @patch("trace_forwarder.DD_TRACE_CONNECTION", "python")
+    def test_python_connection_selected(self):
+        connection = create_trace_connection("https://trace.intake", "key", False)
+
+        self.assertIsInstance(connection, PythonTraceConnection)
+
+
+if __name__ == "__main__":
+    unittest.main()
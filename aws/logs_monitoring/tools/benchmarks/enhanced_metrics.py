@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Unless explicitly stated otherwise all files in this repository are licensed
+# under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2021 Datadog, Inc.
+
+"""
+Benchmark the classification of Lambda logs for enhanced metrics.
+
+Runs the logs through EnhancedMetricsTap, whose parse_enhanced_metrics only
+runs the parsers a log may match, and through the same tap trying all the
+parsers on every log, so both sides look up the function tags and keep the
+points the same way. Points are never flushed, so the Lambda layer is not
+needed. The corpus is made of
+CloudWatch Logs subscription events (JSON with logEvents) or plain text files
+with one log per line, by default the Lambda logs of tests/events.
+
+    python tools/benchmarks/enhanced_metrics.py [corpus files...]
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import timeit
+
+LOGS_MONITORING_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
+)
+sys.path.insert(0, LOGS_MONITORING_DIR)
+
+import enhanced_lambda_metrics  # noqa: E402
+from caching.lambda_cache import LambdaTagsBundle  # noqa: E402
+from enhanced_lambda_metrics import (  # noqa: E402
+    EnhancedMetricsTap,
+    create_out_of_memory_enhanced_metric,
+    create_timeout_enhanced_metric,
+    parse_metrics_from_json_report_log,
+    parse_metrics_from_report_log,
+)
+
+DEFAULT_CORPUS = os.path.join(
+    LOGS_MONITORING_DIR, "tests", "events", "cloudwatch_*.json"
+)
+FUNCTION_ARN = "arn:aws:lambda:us-east-1:123456789012:function:benchmark"
+
+
+class StaticCacheLayer(object):
+    """Returns the same tags bundle for every function, like a warm cache"""
+
+    def __init__(self):
+        self._bundle = LambdaTagsBundle(FUNCTION_ARN, ["team:benchmark"])
+
+    def get_lambda_tags_bundle(self, lambda_arn):
+        return self._bundle
+
+
+def load_messages(paths):
+    messages = []
+    for path in paths:
+        with open(path) as corpus_file:
+            content = corpus_file.read()
+        try:
+            messages.extend(
+                event["message"] for event in json.loads(content)["logEvents"]
+            )
+        except (ValueError, KeyError, TypeError):
+            messages.extend(line for line in content.splitlines() if line)
+    return messages
+
+
+def parse_with_all_parsers(message, json_message=None):
+    """The classification before the parsers were prefiltered"""
+    return (
+        parse_metrics_from_json_report_log(message)
+        or parse_metrics_from_report_log(message)
+        or create_timeout_enhanced_metric(message)
+        or create_out_of_memory_enhanced_metric(message)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("corpus", nargs="*", help="corpus files")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    messages = load_messages(args.corpus or sorted(glob.glob(DEFAULT_CORPUS)))
+    if not messages:
+        sys.exit("No log in the corpus")
+    # Recent timestamps, as in a live invocation
+    timestamp = int(time.time() * 1000)
+    logs = [
+        {"message": message, "lambda": {"arn": FUNCTION_ARN}, "timestamp": timestamp}
+        for message in messages
+    ]
+    cache_layer = StaticCacheLayer()
+    # The tap only generates metrics when they can be submitted
+    enhanced_lambda_metrics.DD_SUBMIT_ENHANCED_METRICS = True
+
+    def run_tap():
+        tap = EnhancedMetricsTap(cache_layer)
+        for log in logs:
+            tap(log)
+
+    prefiltered_parse = enhanced_lambda_metrics.parse_enhanced_metrics
+    print(f"{len(logs)} logs, best of {args.repeat} runs of {args.number} passes")
+    for name, parse in (
+        ("all parsers", parse_with_all_parsers),
+        ("prefiltered", prefiltered_parse),
+    ):
+        enhanced_lambda_metrics.parse_enhanced_metrics = parse
+        best = min(timeit.repeat(run_tap, repeat=args.repeat, number=args.number))
+        per_log = best / args.number / len(logs) * 1e6
+        print(f"{name:>12}: {per_log:.2f} us/log")
+    enhanced_lambda_metrics.parse_enhanced_metrics = prefiltered_parse
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# Unless explicitly stated otherwise all files in this repository are licensed
+# under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2021 Datadog, Inc.
+
+"""
+Synthetic events for the forwarder benchmarks.
+
+Each scenario builds an invocation event made of `count` logs of about
+`message_bytes` bytes each, with the S3 objects it refers to. Generation is
+seeded, so the same arguments always give the same events.
+"""
+
+import base64
+import gzip
+import json
+import random
+import string
+from collections import namedtuple
+
+ACCOUNT_ID = "123456789012"
+REGION = "us-east-1"
+BUCKET = "benchmark-logs"
+
+# event: the invocation event
+# objects: {(bucket, key): body} of the S3 objects referred to by the event
+# logs: the number of logs in the event
+# payload_bytes: the uncompressed size of the logs
+# env: environment variables the scenario needs, e.g. a multiline pattern
+Scenario = namedtuple("Scenario", ["event", "objects", "logs", "payload_bytes", "env"])
+
+
+def _words(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def _app_message(rng, index, message_bytes):
+    """A mix of plain text, JSON and Lambda platform logs"""
+    kind = index % 10
+    if kind == 0:
+        return (
+            f"REPORT RequestId: {rng.getrandbits(64):016x}\tDuration: {rng.uniform(1, 900):.2f} ms\t"
+            f"Billed Duration: {rng.randint(1, 900)} ms\tMemory Size: 128 MB\t"
+            f"Max Memory Used: {rng.randint(40, 128)} MB\t"
+        )
+    if kind < 5:
+        return json.dumps(
+            {
+                "level": rng.choice(["INFO", "WARN", "ERROR"]),
+                "request_id": f"{rng.getrandbits(64):016x}",
+                "user": {"id": rng.randint(1, 10**6), "email": "user@example.com"},
+                "msg": _words(rng, max(0, message_bytes - 120)),
+            }
+        )
+    return (
+        f"2024-01-01T00:00:{index % 60:02d}Z INFO "
+        f"{_words(rng, max(0, message_bytes - 25))}"
+    )
+
+
+def _awslogs_data(rng, count, message_bytes, first_index=0):
+    messages = [_app_message(rng, first_index + i, message_bytes) for i in range(count)]
+    body = {
+        "messageType": "DATA_MESSAGE",
+        "owner": ACCOUNT_ID,
+        "logGroup": "/aws/lambda/benchmark",
+        "logStream": "2024/01/01/[$LATEST]0123456789abcdef0123456789abcdef",
+        "subscriptionFilters": ["benchmark"],
+        "logEvents": [
+            {
+                "id": str(first_index + i),
+                "timestamp": 1704067200000 + first_index + i,
+                "message": message,
+            }
+            for i, message in enumerate(messages)
+        ],
+    }
+    data = base64.b64encode(gzip.compress(json.dumps(body).encode())).decode()
+    return data, sum(len(message) for message in messages)
+
+
+def cloudwatch(rng, count, message_bytes):
+    data, payload_bytes = _awslogs_data(rng, count, message_bytes)
+    return Scenario({"awslogs": {"data": data}}, {}, count, payload_bytes, {})
+
+
+def kinesis(rng, count, message_bytes):
+    records = []
+    payload_bytes = 0
+    # CloudWatch subscriptions put batches of logs in each record
+    per_record = max(1, count // 10)
+    for first_index in range(0, count, per_record):
+        data, record_bytes = _awslogs_data(
+            rng, min(per_record, count - first_index), message_bytes, first_index
+        )
+        records.append({"kinesis": {"data": data}, "eventSource": "aws:kinesis"})
+        payload_bytes += record_bytes
+    return Scenario({"Records": records}, {}, count, payload_bytes, {})
+
+
+def _s3_event(key):
+    return {
+        "Records": [
+            {
+                "eventSource": "aws:s3",
+                "awsRegion": REGION,
+                "s3": {"bucket": {"name": BUCKET}, "object": {"key": key}},
+            }
+        ]
+    }
+
+
+def _s3_scenario(key, body, logs, env=None):
+    data = gzip.compress(body) if key.endswith(".gz") else body
+    return Scenario(_s3_event(key), {(BUCKET, key): data}, logs, len(body), env or {})
+
+
+def _text_lines(rng, count, message_bytes):
+    return "\n".join(
+        f"2024-01-01T00:00:{i % 60:02d}Z INFO {_words(rng, max(0, message_bytes - 25))}"
+        for i in range(count)
+    ).encode()
+
+
+def s3_plain(rng, count, message_bytes):
+    return _s3_scenario(
+        "app/2024/01/01/app.log", _text_lines(rng, count, message_bytes), count
+    )
+
+
+def s3_gzip(rng, count, message_bytes):
+    return _s3_scenario(
+        "app/2024/01/01/app.log.gz", _text_lines(rng, count, message_bytes), count
+    )
+
+
+def s3_multiline(rng, count, message_bytes):
+    entries = []
+    for i in range(count):
+        stack = "\n".join(
+            f'  File "/var/task/app.py", line {rng.randint(1, 500)}, in handler'
+            for _ in range(3)
+        )
+        entries.append(
+            f"2024-01-01 00:00:{i % 60:02d} ERROR "
+            f"{_words(rng, max(0, message_bytes - 230))}\nTraceback:\n{stack}"
+        )
+    return _s3_scenario(
+        "app/2024/01/01/errors.log",
+        "\n".join(entries).encode(),
+        count,
+        {"DD_MULTILINE_LOG_REGEX_PATTERN": r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}"},
+    )
+
+
+def s3_cloudtrail(rng, count, message_bytes):
+    records = [
+        {
+            "eventVersion": "1.08",
+            "eventTime": "2024-01-01T00:00:00Z",
+            "eventSource": "s3.amazonaws.com",
+            "eventName": rng.choice(["GetObject", "PutObject", "AssumeRole"]),
+            "awsRegion": REGION,
+            "sourceIPAddress": f"10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+            "userIdentity": {
+                "type": "AssumedRole",
+                "arn": f"arn:aws:sts::{ACCOUNT_ID}:assumed-role/benchmark/i-0123456789abcdef0",
+            },
+            "requestParameters": {"key": _words(rng, max(0, message_bytes - 350))},
+        }
+        for _ in range(count)
+    ]
+    key = (
+        f"AWSLogs/{ACCOUNT_ID}/CloudTrail/{REGION}/2024/01/01/"
+        f"{ACCOUNT_ID}_CloudTrail_{REGION}_20240101T0000Z_abcdefgh.json.gz"
+    )
+    return _s3_scenario(key, json.dumps({"Records": records}).encode(), count)
+
+
+def s3_vpc_flow(rng, count, message_bytes):
+    lines = [
+        "version account-id interface-id srcaddr dstaddr srcport dstport protocol "
+        "packets bytes start end action log-status"
+    ]
+    for _ in range(count):
+        lines.append(
+            f"2 {ACCOUNT_ID} eni-{rng.getrandbits(32):08x} "
+            f"10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)} "
+            f"10.1.{rng.randint(0, 255)}.{rng.randint(0, 255)} "
+            f"{rng.randint(1024, 65535)} 443 6 {rng.randint(1, 100)} "
+            f"{rng.randint(40, 100000)} 1704067200 1704067260 ACCEPT OK"
+        )
+    key = (
+        f"AWSLogs/{ACCOUNT_ID}/vpcflowlogs/{REGION}/2024/01/01/"
+        f"{ACCOUNT_ID}_vpcflowlogs_{REGION}_fl-0123_20240101T0000Z_abcd.log.gz"
+    )
+    return _s3_scenario(key, "\n".join(lines).encode(), count)
+
+
+def s3_waf(rng, count, message_bytes):
+    lines = []
+    for _ in range(count):
+        lines.append(
+            json.dumps(
+                {
+                    "timestamp": 1704067200000,
+                    "action": rng.choice(["ALLOW", "BLOCK"]),
+                    "httpRequest": {
+                        "clientIp": f"10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+                        "uri": "/" + _words(rng, max(0, message_bytes - 450)),
+                        "headers": [
+                            {"name": "Host", "value": "example.com"},
+                            {"name": "User-Agent", "value": "benchmark"},
+                            {"name": "Accept", "value": "*/*"},
+                        ],
+                    },
+                    "ruleGroupList": [
+                        {
+                            "ruleGroupId": "AWS#AWSManagedRulesCommonRuleSet",
+                            "terminatingRule": None,
+                            "nonTerminatingMatchingRules": [
+                                {"ruleId": "SizeRestrictions_BODY", "action": "COUNT"}
+                            ],
+                        }
+                    ],
+                    "nonTerminatingMatchingRules": [],
+                    "rateBasedRuleList": [],
+                }
+            )
+        )
+    key = "aws-waf-logs-benchmark/2024/01/01/00/aws-waf-logs-benchmark-1.log.gz"
+    return _s3_scenario(key, "\n".join(lines).encode(), count)
+
+
+def sqs(rng, count, message_bytes):
+    """S3 notifications delivered through SQS, ten objects per invocation"""
+    records = []
+    objects = {}
+    payload_bytes = 0
+    per_object = max(1, count // 10)
+    for first_index in range(0, count, per_object):
+        key = f"app/2024/01/01/app-{first_index}.log"
+        body = _text_lines(rng, min(per_object, count - first_index), message_bytes)
+        objects[(BUCKET, key)] = body
+        payload_bytes += len(body)
+        records.append(
+            {
+                "messageId": str(first_index),
+                "eventSource": "aws:sqs",
+                "body": json.dumps(_s3_event(key)),
+            }
+        )
+    return Scenario({"Records": records}, objects, count, payload_bytes, {})
+
+
+def sns(rng, count, message_bytes):
+    records = [
+        {
+            "EventSource": "aws:sns",
+            "Sns": {
+                "Type": "Notification",
+                "TopicArn": f"arn:aws:sns:{REGION}:{ACCOUNT_ID}:benchmark",
+                "Message": _app_message(rng, i, message_bytes),
+            },
+        }
+        for i in range(count)
+    ]
+    payload_bytes = sum(len(record["Sns"]["Message"]) for record in records)
+    return Scenario({"Records": records}, {}, count, payload_bytes, {})
+
+
+def securityhub(rng, count, message_bytes):
+    findings = [
+        {
+            "SchemaVersion": "2018-10-08",
+            "Id": f"arn:aws:securityhub:{REGION}:{ACCOUNT_ID}:finding/{i}",
+            "AwsAccountId": ACCOUNT_ID,
+            "Severity": {"Label": rng.choice(["LOW", "MEDIUM", "HIGH"])},
+            "Title": "Security group allows ingress from 0.0.0.0/0",
+            "Description": _words(rng, max(0, message_bytes - 400)),
+            "Resources": [
+                {"Type": "AwsEc2SecurityGroup", "Id": f"sg-{rng.getrandbits(32):08x}"},
+                {"Type": "AwsAccount", "Id": f"AWS::::Account:{ACCOUNT_ID}"},
+            ],
+        }
+        for i in range(count)
+    ]
+    event = {
+        "version": "0",
+        "source": "aws.securityhub",
+        "detail-type": "Security Hub Findings - Imported",
+        "account": ACCOUNT_ID,
+        "region": REGION,
+        "detail": {"findings": findings},
+    }
+    return Scenario(event, {}, count, len(json.dumps(findings)), {})
+
+
+SCENARIOS = {
+    "cloudwatch": cloudwatch,
+    "kinesis": kinesis,
+    "s3_plain": s3_plain,
+    "s3_gzip": s3_gzip,
+    "s3_multiline": s3_multiline,
+    "s3_cloudtrail": s3_cloudtrail,
+    "s3_vpc_flow": s3_vpc_flow,
+    "s3_waf": s3_waf,
+    "sqs": sqs,
+    "sns": sns,
+    "securityhub": securityhub,
+}
+
+
+def build_scenario(name, count, message_bytes, seed=0):
+    return SCENARIOS[name](random.Random(seed), count, message_bytes)
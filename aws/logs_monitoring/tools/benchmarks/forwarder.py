@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# Unless explicitly stated otherwise all files in this repository are licensed
+# under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2021 Datadog, Inc.
+
+"""
+Benchmark the forwarder end to end on synthetic events.
+
+Each scenario of events.py is run through datadog_forwarder in its own
+process, with S3 served from memory and the intake emulator of intake.py
+standing in for the logs, metrics and trace intakes. Throughput is measured
+with the stage timings off, then the per-stage breakdown in a second run with
+them on. The cold start is measured too: the import of lambda_function, which
+initializes the forwarder, and the first invocation. Results can be saved as a
+baseline, and later runs compared to it.
+
+The intake can be made slow or failing, to load test the backoff, the circuit
+breaker and, with --store-failed-events, the retry storage, kept on disk.
+
+    python tools/benchmarks/forwarder.py [scenarios...] [--events 1000]
+        [--message-bytes 200] [--save-baseline base.json] [--compare base.json]
+        [--latency exponential:50] [--status-rates 503=0.05] [--store-failed-events]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from urllib.request import urlopen
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LOGS_MONITORING_DIR = os.path.abspath(
+    os.path.join(BENCHMARKS_DIR, os.pardir, os.pardir)
+)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from events import SCENARIOS, build_scenario  # noqa: E402
+from intake import LoadTestIntake, add_fault_arguments  # noqa: E402
+
+FUNCTION_ARN = "arn:aws:lambda:us-east-1:123456789012:function:forwarder-benchmark"
+
+
+class LocalS3Client(object):
+    """Serves the objects of a scenario instead of S3"""
+
+    def __init__(self, objects):
+        self._objects = objects
+
+    def get_object(self, Bucket, Key):
+        return {"Body": BytesIO(self._objects[(Bucket, Key)])}
+
+
+class Context(object):
+    function_name = "forwarder-benchmark"
+    invoked_function_arn = FUNCTION_ARN
+    function_version = "$LATEST"
+    memory_limit_in_mb = "1024"
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+def forwarder_environment(intake_url, stage_timings, scenario_env, retry_path=None):
+    env = dict(os.environ)
+    env.update(
+        {
+            "DD_API_KEY": "0" * 32,
+            "DD_API_URL": intake_url,
+            "DD_URL": "127.0.0.1",
+            "DD_PORT": intake_url.rsplit(":", 1)[1],
+            "DD_NO_SSL": "true",
+            "DD_TRACE_INTAKE_URL": intake_url,
+            "DD_TRACE_CONNECTION": "python",
+            "DD_FETCH_LAMBDA_TAGS": "false",
+            "DD_FETCH_LOG_GROUP_TAGS": "false",
+            "DD_FETCH_S3_TAGS": "false",
+            "DD_STORE_FAILED_EVENTS": "false",
+            "DD_STAGE_TIMINGS": "true" if stage_timings else "false",
+            "DD_LOG_LEVEL": "WARNING",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_REGION": "us-east-1",
+        }
+    )
+    if retry_path:
+        env.update(
+            {
+                "DD_STORE_FAILED_EVENTS": "true",
+                "DD_RETRY_DISK_PATH": retry_path,
+                "DD_RETRY_DISK_WRITE_BEHIND": "false",
+            }
+        )
+    env.update(scenario_env)
+    return env
+
+
+def run_scenario(args):
+    """Run a scenario in this process, and print its results as JSON"""
+    scenario = build_scenario(
+        args.run_scenario, args.events, args.message_bytes, args.seed
+    )
+    sys.path.insert(0, LOGS_MONITORING_DIR)
+    start = time.perf_counter()
+    import lambda_function
+
+    init_seconds = time.perf_counter() - start
+    init_modules = sorted(
+        module for module in ("boto3", "requests_futures") if module in sys.modules
+    )
+    import steps.handlers.s3_handler
+    import steps.parsing
+    from instrumentation import stage_timings
+    from retry.enums import RetryPrefix
+    from settings import DD_API_URL, DD_STORE_FAILED_EVENTS
+
+    s3_client = LocalS3Client(scenario.objects)
+    steps.handlers.s3_handler.create_s3_client = lambda: s3_client
+    steps.parsing.create_s3_client = lambda: s3_client
+
+    # The stages reported at the end of each invocation are summed up
+    stages = {}
+
+    def record_stages():
+        for name, values in stage_timings.collect().items():
+            stages[name] = [
+                total + value
+                for total, value in zip(stages.get(name, (0, 0, 0)), values)
+            ]
+
+    stage_timings.report = record_stages
+
+    serialized_event = json.dumps(scenario.event)
+    context = Context()
+    # The first invocation initializes the forwarder and caches, like a cold start
+    cold_event = json.loads(serialized_event)
+    start = time.perf_counter()
+    lambda_function.datadog_forwarder(cold_event, context)
+    cold_invocation_seconds = time.perf_counter() - start
+    stages.clear()
+    urlopen(f"{DD_API_URL}/counters?reset=true").read()
+
+    best = None
+    for _ in range(args.repeat):
+        # The handlers may modify the events
+        invocation_events = [
+            json.loads(serialized_event) for _ in range(args.iterations)
+        ]
+        start = time.perf_counter()
+        for event in invocation_events:
+            lambda_function.datadog_forwarder(event, context)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    invocations = args.iterations * args.repeat
+    stages_per_invocation = {
+        name: {
+            "ms": seconds * 1000 / invocations,
+            "events": events / invocations,
+            "bytes": size / invocations,
+        }
+        for name, (seconds, events, size) in stages.items()
+    }
+    stored_payloads = 0
+    if DD_STORE_FAILED_EVENTS:
+        stored_payloads = sum(
+            1
+            for _ in lambda_function.forwarder.storage.iter_all_data(list(RetryPrefix))
+        )
+    print(
+        json.dumps(
+            {
+                "logs": scenario.logs,
+                "events_per_second": scenario.logs * args.iterations / best,
+                "mb_per_second": scenario.payload_bytes * args.iterations / best / 1e6,
+                "ms_per_invocation": best * 1000 / args.iterations,
+                "init_ms": init_seconds * 1000,
+                "cold_invocation_ms": cold_invocation_seconds * 1000,
+                # Heavy modules which should only be imported when needed
+                "init_modules": init_modules,
+                # Kilobytes on Linux
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / 1024,
+                "stages": stages_per_invocation,
+                "stored_payloads": stored_payloads,
+            }
+        )
+    )
+
+
+def run_in_subprocess(args, name, intake_url, stage_timings):
+    scenario_env = build_scenario(name, 1, args.message_bytes, args.seed).env
+    with tempfile.TemporaryDirectory() as retry_path:
+        env = forwarder_environment(
+            intake_url,
+            stage_timings,
+            scenario_env,
+            retry_path if args.store_failed_events else None,
+        )
+        return _run_in_subprocess(args, name, env, stage_timings)
+
+
+def _run_in_subprocess(args, name, env, stage_timings):
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--run-scenario",
+        name,
+        "--events",
+        str(args.events),
+        "--message-bytes",
+        str(args.message_bytes),
+        "--iterations",
+        str(args.iterations if not stage_timings else 1),
+        "--repeat",
+        str(args.repeat if not stage_timings else 1),
+        "--seed",
+        str(args.seed),
+    ]
+    output = subprocess.run(
+        command,
+        env=env,
+        cwd=LOGS_MONITORING_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_results(results):
+    print(
+        f"{'scenario':<14} {'logs/s':>10} {'MB/s':>8} {'ms/inv':>9} {'init ms':>8} "
+        f"{'cold ms':>8} {'RSS MB':>8}  slowest stages (ms/invocation)"
+    )
+    for name, result in results.items():
+        stages = sorted(
+            result["stages"].items(), key=lambda item: item[1]["ms"], reverse=True
+        )
+        breakdown = ", ".join(
+            f"{stage} {value['ms']:.2f}" for stage, value in stages[:5]
+        )
+        print(
+            f"{name:<14} {result['events_per_second']:>10.0f} {result['mb_per_second']:>8.2f} "
+            f"{result['ms_per_invocation']:>9.2f} {result['init_ms']:>8.1f} "
+            f"{result['cold_invocation_ms']:>8.1f} {result['peak_rss_mb']:>8.1f}  {breakdown}"
+        )
+    init_modules = sorted(
+        {module for result in results.values() for module in result["init_modules"]}
+    )
+    if init_modules:
+        print(f"Imported during init: {', '.join(init_modules)}")
+
+
+def print_intake_counters(results):
+    print(
+        f"\n{'scenario':<14} {'requests':>9} {'accepted':>9} {'errors':>7} "
+        f"{'resets':>7} {'logs recv':>10} {'stored':>7}"
+    )
+    for name, result in results.items():
+        counters = result["intake"]
+        accepted = counters.get("status_202", 0)
+        errors = sum(
+            value
+            for counter, value in counters.items()
+            if counter.startswith("status_") and counter != "status_202"
+        )
+        print(
+            f"{name:<14} {counters.get('requests', 0):>9} {accepted:>9} {errors:>7} "
+            f"{counters.get('resets', 0):>7} {counters.get('events', 0):>10} "
+            f"{result['stored_payloads']:>7}"
+        )
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Print the change of each scenario from the baseline, returns whether one regressed"""
+    regressed = False
+    print(f"\nCompared to the baseline (regression threshold {threshold:.0f}%):")
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<14} not in the baseline")
+            continue
+        change = (result["events_per_second"] / base["events_per_second"] - 1) * 100
+        rss_change = result["peak_rss_mb"] - base["peak_rss_mb"]
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        init = ""
+        # Baselines saved before the cold start was measured have no init time
+        if "init_ms" in base:
+            init_change = (result["init_ms"] / base["init_ms"] - 1) * 100
+            init = f"  init {init_change:+6.1f}%"
+            if init_change > threshold:
+                flag = "  REGRESSION"
+                regressed = True
+        print(
+            f"{name:<14} logs/s {change:+6.1f}%  RSS {rss_change:+6.1f} MB{init}{flag}"
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("scenarios", nargs="*", help="default: all")
+    parser.add_argument("--events", type=int, default=1000, help="logs per invocation")
+    parser.add_argument("--message-bytes", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=5, help="invocations per run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs, the best is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE", help="baseline to compare to")
+    parser.add_argument(
+        "--threshold", type=float, default=10, help="regression threshold, in %%"
+    )
+    parser.add_argument(
+        "--store-failed-events",
+        action="store_true",
+        help="store the data failing to be sent, on disk",
+    )
+    add_fault_arguments(parser)
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        run_scenario(args)
+        return
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(
+            f"unknown scenarios {', '.join(sorted(unknown))}, "
+            f"choose from {', '.join(SCENARIOS)}"
+        )
+
+    intake = LoadTestIntake(
+        latency=args.latency,
+        status_rates=args.status_rates,
+        reset_rate=args.reset_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    ).start()
+
+    results = {}
+    try:
+        for name in args.scenarios or SCENARIOS:
+            result = run_in_subprocess(args, name, intake.url, stage_timings=False)
+            # The requests of the measured invocations
+            result["intake"] = intake.counters.snapshot(reset=True)
+            result["stages"] = run_in_subprocess(
+                args, name, intake.url, stage_timings=True
+            )["stages"]
+            results[name] = result
+    except subprocess.CalledProcessError as e:
+        sys.exit(f"Scenario failed:\n{e.stderr}")
+    finally:
+        intake.stop()
+
+    print_results(results)
+    print_intake_counters(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(
+                {
+                    "config": {
+                        "events": args.events,
+                        "message_bytes": args.message_bytes,
+                        "seed": args.seed,
+                        "python": sys.version.split()[0],
+                    },
+                    "results": results,
+                },
+                baseline_file,
+                indent=2,
+            )
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare_to_baseline(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
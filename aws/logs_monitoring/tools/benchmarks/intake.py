@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# Unless explicitly stated otherwise all files in this repository are licensed
+# under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2021 Datadog, Inc.
+
+"""
+A local stand-in for the Datadog intakes, for load tests.
+
+Unlike the integration tests recorder, requests are handled concurrently, one
+thread per connection, and nothing is kept but counters. Payloads are decoded
+(gzip or deflate) and the events of JSON arrays counted. Slow or failing
+intakes are emulated by injecting latency, error statuses and connection
+resets. GET /counters returns the counters, ?reset=true resets them.
+
+    python tools/benchmarks/intake.py --port 8080 --latency exponential:50
+        --status-rates 429=0.05,503=0.01 --reset-rate 0.01
+"""
+
+import argparse
+import gzip
+import json
+import random
+import socket
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from itertools import count
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def parse_latency(spec):
+    """Returns a function drawing a latency in seconds from a spec in milliseconds
+
+    "50" is a fixed latency, "uniform:10:200" uniform between 10 and 200,
+    "exponential:50" exponential of mean 50, and "lognormal:50:0.5"
+    log-normal of median 50 and shape 0.5, which has a long tail.
+    """
+    kind, _, parameters = spec.partition(":")
+    try:
+        if not parameters:
+            latency = float(kind) / 1000
+            return lambda rng: latency
+        values = [float(value) for value in parameters.split(":")]
+        if kind == "uniform":
+            low, high = values
+            return lambda rng: rng.uniform(low, high) / 1000
+        if kind == "exponential":
+            (mean,) = values
+            return lambda rng: rng.expovariate(1 / mean) / 1000 if mean else 0
+        if kind == "lognormal":
+            median, sigma = values
+            return lambda rng: median * rng.lognormvariate(0, sigma) / 1000
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency {spec}")
+
+
+def parse_status_rates(spec):
+    """Returns [(status, rate)] from "429=0.05,503=0.01" """
+    status_rates = []
+    for status_rate in filter(None, spec.split(",")):
+        status, _, rate = status_rate.partition("=")
+        status_rates.append((int(status), float(rate)))
+    if sum(rate for _, rate in status_rates) > 1:
+        raise ValueError(f"Status rates add up to more than 1: {spec}")
+    return status_rates
+
+
+class IntakeCounters(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def add(self, **counts):
+        with self._lock:
+            self._counters.update(counts)
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            counters = dict(self._counters)
+            if reset:
+                self._counters.clear()
+        return counters
+
+
+class IntakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/counters":
+            reset = parse_qs(url.query).get("reset") == ["true"]
+            self._respond(200, self.server.counters.snapshot(reset))
+        else:
+            # API key validation
+            self._respond(200, {"valid": True})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server
+        rng = server.rng()
+
+        if rng.random() < server.reset_rate:
+            server.counters.add(requests=1, resets=1, wire_bytes=len(body))
+            # Abort the connection with a RST rather than a FIN
+            self.connection.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+            )
+            self.close_connection = True
+            return
+
+        latency = server.latency(rng)
+        if latency > 0:
+            time.sleep(latency)
+
+        status = 202
+        draw = rng.random()
+        for error_status, rate in server.status_rates:
+            if draw < rate:
+                status = error_status
+                break
+            draw -= rate
+
+        counts = {
+            "requests": 1,
+            f"status_{status}": 1,
+            "wire_bytes": len(body),
+            "latency_ms": round(latency * 1000),
+        }
+        if status == 202:
+            counts.update(self._count_payload(body))
+        server.counters.add(**counts)
+
+        headers = {}
+        if status == 429 and server.retry_after is not None:
+            headers["Retry-After"] = str(server.retry_after)
+        self._respond(status, {}, headers)
+
+    def _count_payload(self, body):
+        encoding = self.headers.get("Content-Encoding", "identity")
+        try:
+            if encoding == "gzip":
+                body = gzip.decompress(body)
+            elif encoding == "deflate":
+                body = zlib.decompress(body)
+        except (OSError, zlib.error):
+            return {"decode_errors": 1}
+
+        counts = {"decoded_bytes": len(body)}
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                return dict(counts, decode_errors=1)
+            if isinstance(payload, list):
+                counts["events"] = len(payload)
+        return counts
+
+    def _respond(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LoadTestIntake(ThreadingHTTPServer):
+    """The intake, serving from a background thread once started"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency="0",
+        status_rates="",
+        reset_rate=0.0,
+        retry_after=None,
+        seed=None,
+    ):
+        super().__init__((host, port), IntakeHandler)
+        self.latency = parse_latency(latency)
+        self.status_rates = parse_status_rates(status_rates)
+        self.reset_rate = reset_rate
+        self.retry_after = retry_after
+        self.counters = IntakeCounters()
+        self._seeds = None if seed is None else count(seed)
+        self._rngs = threading.local()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def rng(self):
+        """A random generator per handler thread"""
+        rng = getattr(self._rngs, "rng", None)
+        if rng is None:
+            rng = self._rngs.rng = random.Random(
+                None if self._seeds is None else next(self._seeds)
+            )
+        return rng
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def add_fault_arguments(parser):
+    parser.add_argument(
+        "--latency",
+        default="0",
+        help='intake latency in ms: "50", "uniform:10:200", "exponential:50" or "lognormal:50:0.5"',
+    )
+    parser.add_argument(
+        "--status-rates",
+        default="",
+        help='rates of error responses, e.g. "429=0.05,503=0.01"',
+    )
+    parser.add_argument(
+        "--reset-rate", type=float, default=0.0, help="rate of connection resets"
+    )
+    parser.add_argument(
+        "--retry-after", type=float, help="Retry-After of the 429 responses, in seconds"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--seed", type=int)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    intake = LoadTestIntake(
+        args.host,
+        args.port,
+        args.latency,
+        args.status_rates,
+        args.reset_rate,
+        args.retry_after,
+        args.seed,
+    )
+    print(f"Intake listening on {intake.url}", flush=True)
+    try:
+        intake.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        intake.server_close()
+        print(json.dumps(intake.counters.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# Unless explicitly stated otherwise all files in this repository are licensed
+# under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2021 Datadog, Inc.
+
+"""
+Benchmark the Go and pure-Python trace intake clients against each other.
+
+The same synthetic trace payloads, with SQL, Redis and HTTP spans to
+obfuscate, are sent by both clients to the intake emulator of intake.py. The
+Go client needs trace_forwarder/bin/trace-intake.so, built with make in
+trace_forwarder, it is skipped otherwise.
+
+    python tools/benchmarks/traces.py [--payloads 20] [--traces 10] [--spans 20]
+        [--iterations 5] [--repeat 3] [--latency exponential:50]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LOGS_MONITORING_DIR = os.path.abspath(
+    os.path.join(BENCHMARKS_DIR, os.pardir, os.pardir)
+)
+GO_LIBRARY_PATH = os.path.join(
+    LOGS_MONITORING_DIR, "trace_forwarder", "bin", "trace-intake.so"
+)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from intake import LoadTestIntake, add_fault_arguments  # noqa: E402
+
+CHILD_SPANS = [
+    ("postgres", "postgres.query", "sql", "SELECT * FROM orders WHERE id = {}"),
+    ("redis", "redis.command", "redis", "GET session:{}"),
+    ("http-client", "http.request", "http", "GET /users/{}"),
+]
+
+
+def make_span(trace_id, index, span_id, parent_id, service, name, span_type, resource):
+    return {
+        "trace_id": trace_id,
+        "span_id": format(span_id, "x"),
+        "parent_id": format(parent_id, "x"),
+        "service": service,
+        "name": name,
+        "type": span_type,
+        "resource": resource,
+        "start": 1700000000000000000 + index * 1000,
+        "duration": 500000,
+        "meta": {"env": "benchmark", "http.url": f"https://api.example.com{resource}"},
+        "metrics": {"_sampling_priority_v1": 1},
+    }
+
+
+def build_payloads(rng, payloads, traces, spans):
+    """Returns serialized trace payloads, as built by the forwarder"""
+    raw_trace_payloads = []
+    for _ in range(payloads):
+        trace_list = []
+        for _ in range(traces):
+            trace_id = format(rng.getrandbits(64), "x")
+            root_id = rng.getrandbits(63)
+            trace = [
+                make_span(
+                    trace_id,
+                    0,
+                    root_id,
+                    0,
+                    "aws.lambda",
+                    "aws.lambda",
+                    "web",
+                    "handler",
+                )
+            ]
+            for index in range(spans - 1):
+                service, name, span_type, resource = CHILD_SPANS[
+                    index % len(CHILD_SPANS)
+                ]
+                trace.append(
+                    make_span(
+                        trace_id,
+                        index + 1,
+                        root_id + index + 1,
+                        root_id,
+                        service,
+                        name,
+                        span_type,
+                        resource.format(rng.randrange(10**6)),
+                    )
+                )
+            trace_list.append(trace)
+        raw_trace_payloads.append(
+            {
+                "message": json.dumps({"traces": trace_list}),
+                "tags": "service:benchmark,env:benchmark,team:serverless",
+            }
+        )
+    return json.dumps(raw_trace_payloads).encode("UTF-8")
+
+
+def benchmark(connection, serialized, intake, args):
+    """Returns the best time of the runs, and the intake counters of one run"""
+    best = None
+    for _ in range(args.repeat):
+        intake.counters.snapshot(reset=True)
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            connection.send_traces(serialized)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+        counters = intake.counters.snapshot()
+    return best, counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--payloads", type=int, default=20, help="trace payloads")
+    parser.add_argument("--traces", type=int, default=10, help="traces per payload")
+    parser.add_argument("--spans", type=int, default=20, help="spans per trace")
+    parser.add_argument("--iterations", type=int, default=5, help="sends per run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs, the best is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    intake = LoadTestIntake(
+        latency=args.latency,
+        status_rates=args.status_rates,
+        reset_rate=args.reset_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    ).start()
+    os.environ.setdefault("DD_API_KEY", "0" * 32)
+    os.environ.setdefault("DD_LOG_LEVEL", "WARNING")
+    sys.path.insert(0, LOGS_MONITORING_DIR)
+    from trace_forwarder.python_connection import PythonTraceConnection
+
+    connections = {"python": PythonTraceConnection(intake.url, "0" * 32, False)}
+    if os.path.exists(GO_LIBRARY_PATH):
+        from trace_forwarder.connection import TraceConnection
+
+        connections["go"] = TraceConnection(intake.url, "0" * 32, False)
+    else:
+        print(f"go: skipped, {GO_LIBRARY_PATH} not built")
+
+    serialized = build_payloads(
+        random.Random(args.seed), args.payloads, args.traces, args.spans
+    )
+    spans = args.payloads * args.traces * args.spans * args.iterations
+    print(
+        f"{args.payloads} payloads of {args.traces} traces of {args.spans} spans, "
+        f"{len(serialized) / 1e6:.2f} MB, best of {args.repeat} runs of "
+        f"{args.iterations} sends"
+    )
+    print(
+        f"{'client':<8} {'spans/s':>10} {'ms/send':>9} {'requests':>9} {'wire B/span':>12}"
+    )
+    try:
+        for name, connection in connections.items():
+            elapsed, counters = benchmark(connection, serialized, intake, args)
+            print(
+                f"{name:<8} {spans / elapsed:>10.0f} "
+                f"{elapsed / args.iterations * 1000:>9.2f} "
+                f"{counters.get('requests', 0):>9} "
+                f"{counters.get('wire_bytes', 0) / spans:>12.1f}"
+            )
+    finally:
+        intake.stop()
+
+
+if __name__ == "__main__":
+    main()
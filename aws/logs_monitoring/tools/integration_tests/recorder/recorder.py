@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 from http.server import BaseHTTPRequestHandler, HTTPServer
+import gzip
 import json
 import os
 import zlib
@@ -42,6 +43,8 @@ class RecorderHandler(BaseHTTPRequestHandler):
                     except:
                         pass
                 elif self.headers["Content-Type"] == "application/x-protobuf":
+                    if self.headers["Content-Encoding"] == "gzip":
+                        contents = gzip.decompress(contents)
                     # Assume that protobuf calls contain trace payloads
                     message = TracePayloadProtobuf.TracePayload()
                     message.ParseFromString(contents)
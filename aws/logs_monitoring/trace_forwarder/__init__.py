@@ -2,3 +2,19 @@
 # under the Apache License Version 2.0.
 # This product includes software developed at Datadog (https://www.datadoghq.com/).
 # Copyright 2021 Datadog, Inc.
+from settings import DD_TRACE_CONNECTION
+
+
+def create_trace_connection(root_url, api_key, insecure_skip_verify):
+    """Select the trace intake client based on DD_TRACE_CONNECTION.
+
+    The Go library is only loaded when it is used.
+    """
+    if DD_TRACE_CONNECTION == "python":
+        from trace_forwarder.python_connection import PythonTraceConnection
+
+        return PythonTraceConnection(root_url, api_key, insecure_skip_verify)
+
+    from trace_forwarder.connection import TraceConnection
+
+    return TraceConnection(root_url, api_key, insecure_skip_verify)
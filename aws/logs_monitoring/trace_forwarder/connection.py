@@ -11,6 +11,7 @@ class GO_STRING(Structure):
 
 
 def make_go_string(str):
+    # c_char_p points at the buffer of a bytes object, only str needs a copy
     if not type(str) is bytes:
         str = str.encode("utf-8")
     return GO_STRING(str, len(str))
@@ -20,6 +21,8 @@ class TraceConnection:
     def __init__(self, root_url, api_key, insecure_skip_verify):
         dir = os.path.dirname(os.path.realpath(__file__))
         self.lib = cdll.LoadLibrary("{}/bin/trace-intake.so".format(dir))
+        self.lib.ForwardTraces.argtypes = [GO_STRING]
+        self.lib.ForwardTraces.restype = c_int
         self.lib.Configure(
             make_go_string(root_url),
             make_go_string(api_key),
@@ -27,6 +30,10 @@ class TraceConnection:
         )
 
     def send_traces(self, serialized_trace_paylods):
+        """Send serialized trace payloads, preferably bytes to avoid a copy.
+
+        The GIL is released during the call, so other threads keep running.
+        """
         had_error = (
             self.lib.ForwardTraces(make_go_string(serialized_trace_paylods)) != 0
         )
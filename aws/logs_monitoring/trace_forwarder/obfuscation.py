@@ -0,0 +1,345 @@
+# Unless explicitly stated otherwise all files in this repository are licensed
+# under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2021 Datadog, Inc.
+
+"""
+Span obfuscation of the pure-Python trace intake client.
+
+Ports the rules of the datadog-agent obfuscator, with the configuration of
+the Go trace-intake library (cmd/trace/main.go): literals are replaced with
+"?" in SQL queries, Redis commands and Elasticsearch and MongoDB queries,
+memcached values are dropped, query strings and path segments with digits are
+removed from URLs, and stack traces are removed.
+"""
+
+import json
+import logging
+import os
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger()
+logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
+
+NON_PARSABLE_SQL_RESOURCE = "Non-parsable SQL query"
+SQL_QUERY_KEY = "sql.query"
+REDIS_RAW_COMMAND_KEY = "redis.raw_command"
+MEMCACHED_COMMAND_KEY = "memcached.command"
+HTTP_URL_KEY = "http.url"
+ERROR_STACK_KEY = "error.stack"
+ELASTICSEARCH_BODY_KEY = "elasticsearch.body"
+MONGODB_QUERY_KEY = "mongodb.query"
+
+REDIS_MAX_COMMANDS = 3
+REDIS_TRUNCATION_MARK = "..."
+# Commands whose first argument is a subcommand, e.g. "CLIENT LIST"
+REDIS_COMPOUND_COMMANDS = {"CLIENT", "CLUSTER", "COMMAND", "CONFIG", "DEBUG", "SCRIPT"}
+# Commands whose value is their 2nd argument, e.g. "SET key value", or 3rd,
+# e.g. "HSET key field value", and commands whose arguments after the key are
+# all values, e.g. "SADD key member..."
+REDIS_SECOND_VALUE_COMMANDS = {
+    "APPEND",
+    "GETSET",
+    "LPUSHX",
+    "GEORADIUSBYMEMBER",
+    "RPUSHX",
+    "SET",
+    "SETNX",
+    "SISMEMBER",
+    "ZRANK",
+    "ZREVRANK",
+    "ZSCORE",
+}
+REDIS_THIRD_VALUE_COMMANDS = {
+    "HSET",
+    "HSETNX",
+    "LREM",
+    "LSET",
+    "SETBIT",
+    "SETEX",
+    "PSETEX",
+    "SETRANGE",
+    "ZINCRBY",
+    "SMOVE",
+    "RESTORE",
+}
+REDIS_VALUES_COMMANDS = {
+    "GEOHASH",
+    "GEOPOS",
+    "GEODIST",
+    "LPUSH",
+    "RPUSH",
+    "SREM",
+    "ZREM",
+    "SADD",
+}
+REDIS_ARG_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"?|\'(?:[^\'\\]|\\.)*\'?|\S+')
+
+SQL_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<space>\s+)
+    | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    | (?P<string>'(?:[^'\\]|\\.|'')*'|[nN]'(?:[^'\\]|\\.|'')*')
+    | (?P<identifier>"(?:[^"]|"")*"|`[^`]*`|\[[A-Za-z_][^\]]*\]
+        |[A-Za-z_][\w$]*(?:\.(?:[A-Za-z_*][\w$]*|"(?:[^"]|"")*"|`[^`]*`))*)
+    | (?P<unterminated>['`"])
+    | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    | (?P<variable>@@?[\w.$]+|\$\d+|:\w+|%\(\w+\)s|%s|\?)
+    | (?P<operator><=>|<>|!=|<=|>=|:=|::|\|\||&&|<<|>>|[-+*/%=<>!~^&|,;().{}\[\]])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+SQL_LITERAL_KEYWORDS = {"NULL", "TRUE", "FALSE"}
+SQL_FILTERED = "?"
+
+
+class SQLObfuscationError(Exception):
+    pass
+
+
+def obfuscate_span(span):
+    """Obfuscate the resource and tags of a span according to its type"""
+    span_type = span["type"]
+    if span_type in ("sql", "cassandra"):
+        _obfuscate_sql_span(span)
+    elif span_type == "redis":
+        span["resource"] = quantize_redis(span["resource"])
+        _obfuscate_meta(span, REDIS_RAW_COMMAND_KEY, obfuscate_redis)
+    elif span_type == "memcached":
+        _obfuscate_meta(span, MEMCACHED_COMMAND_KEY, obfuscate_memcached)
+    elif span_type in ("web", "http"):
+        _obfuscate_meta(span, HTTP_URL_KEY, obfuscate_url)
+    elif span_type == "elasticsearch":
+        _obfuscate_meta(span, ELASTICSEARCH_BODY_KEY, obfuscate_json)
+    elif span_type == "mongodb":
+        _obfuscate_meta(span, MONGODB_QUERY_KEY, obfuscate_json)
+
+    if span["meta"].get(ERROR_STACK_KEY):
+        span["meta"][ERROR_STACK_KEY] = "?"
+
+
+def _obfuscate_meta(span, key, obfuscate):
+    value = span["meta"].get(key)
+    if value:
+        span["meta"][key] = obfuscate(value)
+
+
+def _obfuscate_sql_span(span):
+    if not span["resource"]:
+        return
+    try:
+        query = obfuscate_sql(span["resource"])
+    except SQLObfuscationError as e:
+        logger.debug(f"Error parsing SQL query of span {span['span_id']}: {e}")
+        span["meta"].setdefault(SQL_QUERY_KEY, NON_PARSABLE_SQL_RESOURCE)
+        span["resource"] = NON_PARSABLE_SQL_RESOURCE
+        return
+    span["resource"] = query
+    span["meta"][SQL_QUERY_KEY] = query
+
+
+def obfuscate_sql(query):
+    """Returns the query with its literals replaced with "?" and comments removed.
+
+    Tokens are separated by single spaces, and lists of literals collapsed
+    into one: "IN (1, 2, 3)" becomes "IN ( ? )" and "VALUES (1, 'a'), (2, 'b')"
+    becomes "VALUES ( ? )".
+    """
+    tokens = []
+    position = 0
+    while position < len(query):
+        match = SQL_TOKEN_PATTERN.match(query, position)
+        if match is None:
+            raise SQLObfuscationError(f"unexpected character at {position}")
+        position = match.end()
+        kind = match.lastgroup
+        if kind in ("space", "comment"):
+            continue
+        if kind == "unterminated":
+            raise SQLObfuscationError(f"unterminated quote at {match.start()}")
+
+        token = match.group()
+        if kind in ("string", "number", "variable") or (
+            kind == "identifier" and token.upper() in SQL_LITERAL_KEYWORDS
+        ):
+            token = SQL_FILTERED
+        _append_sql_token(tokens, token)
+
+    if not tokens:
+        raise SQLObfuscationError("empty query")
+    return _join_sql_tokens(tokens)
+
+
+def _append_sql_token(tokens, token):
+    # "( ? , ?" is collapsed into "( ?"
+    if token == SQL_FILTERED and tokens[-2:] == ["?", ","] and _in_group(tokens):
+        tokens.pop()
+        return
+    # "( ? ) , ( ?" is collapsed into "( ?", closed by the next ")"
+    if token == SQL_FILTERED and tokens[-5:] == ["(", "?", ")", ",", "("]:
+        del tokens[-3:]
+        return
+    tokens.append(token)
+
+
+def _in_group(tokens):
+    depth = 0
+    for token in reversed(tokens):
+        if token == ")":
+            depth += 1
+        elif token == "(":
+            if depth == 0:
+                return True
+            depth -= 1
+    return False
+
+
+def _join_sql_tokens(tokens):
+    parts = [tokens[0]]
+    for token in tokens[1:]:
+        if token not in (",", ";"):
+            parts.append(" ")
+        parts.append(token)
+    return "".join(parts)
+
+
+def quantize_redis(query):
+    """Returns the names of the (up to 3) commands of a Redis query"""
+    commands = []
+    truncated = False
+    for line in query.split("\n"):
+        if len(commands) == REDIS_MAX_COMMANDS:
+            break
+        args = line.split()
+        if not args:
+            continue
+        if args[0].endswith(REDIS_TRUNCATION_MARK):
+            truncated = True
+            continue
+        command = args[0].upper()
+        if command in REDIS_COMPOUND_COMMANDS and len(args) > 1:
+            if args[1].endswith(REDIS_TRUNCATION_MARK):
+                truncated = True
+                continue
+            command += " " + args[1].upper()
+        commands.append(command)
+        truncated = False
+
+    if len(commands) == REDIS_MAX_COMMANDS or truncated:
+        commands.append(REDIS_TRUNCATION_MARK)
+    return " ".join(commands)
+
+
+def obfuscate_redis(raw_command):
+    """Returns the Redis commands with the values of their arguments replaced with "?".
+
+    Keys are kept, so that commands stay recognizable.
+    """
+    return "\n".join(
+        _obfuscate_redis_command(REDIS_ARG_PATTERN.findall(line))
+        for line in raw_command.split("\n")
+    )
+
+
+def _obfuscate_redis_command(args):
+    if len(args) < 2:
+        return " ".join(args)
+    name, args = args[0], args[1:]
+    command = name.upper()
+
+    if command == "AUTH":
+        args = ["?"]
+    elif command in REDIS_SECOND_VALUE_COMMANDS:
+        _obfuscate_redis_arg(args, 1)
+    elif command in REDIS_THIRD_VALUE_COMMANDS:
+        _obfuscate_redis_arg(args, 2)
+    elif command == "LINSERT":
+        _obfuscate_redis_arg(args, 3)
+    elif command in REDIS_VALUES_COMMANDS:
+        args = args[:1] + ["?"] if len(args) > 1 else args
+    elif command == "GEOADD":
+        _obfuscate_redis_args_step(args, 1, 3)
+    elif command == "HMSET":
+        _obfuscate_redis_args_step(args, 1, 2)
+    elif command in ("MSET", "MSETNX"):
+        _obfuscate_redis_args_step(args, 0, 2)
+    elif command == "CONFIG":
+        if args[0].upper() == "SET":
+            _obfuscate_redis_arg(args, 2)
+    elif command == "BITFIELD":
+        set_index = None
+        for index, arg in enumerate(args):
+            if arg.upper() == "SET":
+                set_index = index
+            elif set_index is not None and index - set_index == 3:
+                args[index] = "?"
+                break
+    elif command == "ZADD":
+        for index, arg in enumerate(args[1:], 1):
+            if arg.upper() not in ("NX", "XX", "CH", "INCR"):
+                _obfuscate_redis_args_step(args, index, 2)
+                break
+    return " ".join([name] + args)
+
+
+def _obfuscate_redis_arg(args, index):
+    if index < len(args):
+        args[index] = "?"
+
+
+def _obfuscate_redis_args_step(args, start, step):
+    """Obfuscate every step-th argument, from start"""
+    for index in range(start + step - 1, len(args), step):
+        args[index] = "?"
+
+
+def obfuscate_memcached(command):
+    """Returns the memcached command without the value of storage commands"""
+    return command.strip().split("\r", 1)[0]
+
+
+def obfuscate_url(url):
+    """Returns the URL without its query string, and "?" for the path segments with digits"""
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return "?"
+    path = "/".join(
+        "?" if any(character.isdigit() for character in segment) else segment
+        for segment in parts.path.split("/")
+    )
+    obfuscated = urlunsplit((parts.scheme, parts.netloc, path, "", parts.fragment))
+    if parts.query:
+        # Like Go's url.URL with ForceQuery, the "?" marks the removed query
+        obfuscated, separator, fragment = obfuscated.partition("#")
+        obfuscated += "?" + separator + fragment
+    return obfuscated
+
+
+def obfuscate_json(value):
+    """Returns the JSON documents, e.g. of a bulk request, with their values replaced with "?" """
+    decoder = json.JSONDecoder()
+    documents = []
+    position = 0
+    try:
+        while True:
+            while position < len(value) and value[position].isspace():
+                position += 1
+            if position == len(value):
+                break
+            document, position = decoder.raw_decode(value, position)
+            documents.append(
+                json.dumps(_obfuscate_json_values(document), separators=(",", ":"))
+            )
+    except ValueError:
+        return "?"
+    return "\n".join(documents)
+
+
+def _obfuscate_json_values(document):
+    if isinstance(document, dict):
+        return {key: _obfuscate_json_values(value) for key, value in document.items()}
+    if isinstance(document, list):
+        return [_obfuscate_json_values(value) for value in document]
+    return "?"
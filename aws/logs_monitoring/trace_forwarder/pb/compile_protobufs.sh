@@ -0,0 +1,14 @@
+#!/bin/bash
+
+# Compile .py files from .proto files
+# You must run this after updating a .proto file
+
+# Requires protoc 33.5, whose gencode matches the protobuf==6.33.5 runtime
+# pinned in requirements.txt: https://github.com/protocolbuffers/protobuf/releases/tag/v33.5
+
+protoc *.proto --python_out=.
+
+# protoc imports the dependencies as top-level modules, import them from this
+# package instead
+sed -i.bak -E 's/^import ([a-z_]+_pb2) as/from . import \1 as/' *_pb2.py
+rm -f *_pb2.py.bak
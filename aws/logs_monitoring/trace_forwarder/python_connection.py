@@ -0,0 +1,306 @@
+# Unless explicitly stated otherwise all files in this repository are licensed
+# under the Apache License Version 2.0.
+# This product includes software developed at Datadog (https://www.datadoghq.com/).
+# Copyright 2021 Datadog, Inc.
+
+
+import gzip
+import json
+import logging
+import os
+import time
+
+import requests
+
+from settings import (
+    DD_COMPRESSION_LEVEL,
+    DD_FORWARDER_VERSION,
+    DD_TRACE_MAX_WORKERS,
+    DD_USE_COMPRESSION,
+)
+from trace_forwarder.obfuscation import obfuscate_span
+from trace_forwarder.pb.trace_payload_pb2 import TracePayload
+
+logger = logging.getLogger()
+logger.setLevel(logging.getLevelName(os.environ.get("DD_LOG_LEVEL", "INFO").upper()))
+
+TRACE_INTAKE_PATH = "/api/v0.2/traces"
+TRACE_INTAKE_TIMEOUT_SECONDS = 5
+TRACE_INTAKE_MAX_ATTEMPTS = 3
+TRACE_INTAKE_RETRY_INTERVAL_SECONDS = 1
+
+ORIGIN_METADATA_KEY = "_dd.origin"
+COMPUTE_STATS_KEY = "_dd.compute_stats"
+PARENT_SOURCE_METADATA_KEY = "_dd.parent_source"
+INFERRED_SPAN_TAG_SOURCE_KEY = "_inferred_span.tag_source"
+TOP_LEVEL_KEY = "_top_level"
+SOURCE_XRAY = "xray"
+ENV_METADATA_KEY = "env"
+
+
+class PythonTraceConnection:
+    """
+    Sends traces to the trace intake without the Go trace-intake library.
+
+    Takes the same serialized payloads as TraceConnection, and processes them
+    the same way: spans are tagged, obfuscated, grouped by trace and env, then
+    encoded to protobuf and sent over pooled keep-alive connections. Unlike
+    the Go library, sublayer metrics are not computed.
+    """
+
+    def __init__(self, root_url, api_key, insecure_skip_verify):
+        self._url = root_url + TRACE_INTAKE_PATH
+        self._session = requests.Session()
+        # One pooled connection per concurrent trace chunk
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=DD_TRACE_MAX_WORKERS)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.verify = not insecure_skip_verify
+        self._session.headers.update(
+            {
+                "Content-Type": "application/x-protobuf",
+                "Content-Encoding": "gzip" if DD_USE_COMPRESSION else "identity",
+                "DD-Api-Key": api_key,
+                "User-Agent": f"aws-dd-forwarder/{DD_FORWARDER_VERSION}",
+            }
+        )
+
+    def send_traces(self, serialized_trace_paylods):
+        trace_payloads = []
+        for raw_trace_payload in json.loads(serialized_trace_paylods):
+            trace_payloads.extend(
+                process_trace(raw_trace_payload["message"], raw_trace_payload["tags"])
+            )
+
+        if not trace_payloads:
+            logger.debug("No traces to forward")
+            return
+
+        had_error = False
+        for env, traces in aggregate_trace_payloads_by_env(trace_payloads).items():
+            if not self._send(encode_trace_payload(env, traces)):
+                had_error = True
+
+        if had_error:
+            raise Exception("Failed to send to trace intake")
+
+    def _send(self, body):
+        if DD_USE_COMPRESSION:
+            body = gzip.compress(body, min(max(DD_COMPRESSION_LEVEL, 0), 9))
+
+        for attempt in range(1, TRACE_INTAKE_MAX_ATTEMPTS + 1):
+            try:
+                response = self._session.post(
+                    self._url, data=body, timeout=TRACE_INTAKE_TIMEOUT_SECONDS
+                )
+                if response.status_code // 100 == 2:
+                    return True
+                error = f"{self._url} responded with {response.status_code}"
+            except Exception as e:
+                error = e
+
+            logger.warning(f"Failed to send traces, attempt {attempt}: {error}")
+            if attempt < TRACE_INTAKE_MAX_ATTEMPTS:
+                time.sleep(TRACE_INTAKE_RETRY_INTERVAL_SECONDS)
+        return False
+
+
+def process_trace(message, tags):
+    """Parse a serialized trace list, apply the Lambda function tags and obfuscate it"""
+    trace_payloads = parse_trace(message)
+    add_tags_to_trace_payloads(trace_payloads, tags)
+    for trace_payload in trace_payloads:
+        for trace in trace_payload["traces"]:
+            for span in trace["spans"]:
+                obfuscate_span(span)
+    return trace_payloads
+
+
+def parse_trace(content):
+    """
+    Returns the trace payloads, {"env": env, "traces": traces}, of a trace list.
+
+    Root spans parented to X-Ray are placeholders for the X-Ray parent span,
+    they are dropped and their children reparented.
+    """
+    trace_payloads = []
+    removed_spans = {}
+
+    for trace in json.loads(content).get("traces") or []:
+        api_traces = {}
+        env = "none"
+
+        for raw_span in trace:
+            span = _convert_span(raw_span)
+            meta = span["meta"]
+            # Lets the backend make sampling decisions and compute stats
+            meta[ORIGIN_METADATA_KEY] = "lambda"
+            meta[COMPUTE_STATS_KEY] = "1"
+            env = meta.get(ENV_METADATA_KEY, env)
+
+            if meta.get(PARENT_SOURCE_METADATA_KEY) == SOURCE_XRAY:
+                removed_spans[span["span_id"]] = span
+                continue
+
+            removed_parent = removed_spans.get(span["parent_id"])
+            if removed_parent is not None:
+                span["parent_id"] = removed_parent["parent_id"]
+
+            api_trace = api_traces.get(span["trace_id"])
+            if api_trace is None:
+                api_trace = api_traces[span["trace_id"]] = {
+                    "trace_id": span["trace_id"],
+                    "spans": [],
+                    "start_time": 0,
+                    "end_time": 0,
+                }
+            _add_to_api_trace(api_trace, span)
+
+        # We dont want to include trace payloads with empty traces
+        if not api_traces:
+            continue
+
+        for api_trace in api_traces.values():
+            _compute_top_level(api_trace["spans"])
+        trace_payloads.append({"env": env, "traces": list(api_traces.values())})
+
+    return trace_payloads
+
+
+def add_tags_to_trace_payloads(trace_payloads, tags):
+    """Apply a single string of tags, eg 'a:b,c:d', to each span of the payloads"""
+    tag_map = {}
+    service = ""
+    env = ""
+    for tag in tags.split(","):
+        key, separator, value = tag.partition(":")
+        if not separator:
+            continue
+        if key.lower() == "service":
+            service = value
+        elif key.lower() == "env":
+            env = value
+        else:
+            tag_map[key] = value
+
+    service_lookup = _build_service_lookup(trace_payloads, service) if service else {}
+
+    for trace_payload in trace_payloads:
+        if env and env != "none":
+            trace_payload["env"] = env
+        for trace in trace_payload["traces"]:
+            for span in trace["spans"]:
+                meta = span["meta"]
+                # Inferred spans not belonging to the Lambda function keep their tags
+                if meta.get(INFERRED_SPAN_TAG_SOURCE_KEY) == "self":
+                    continue
+                if service_lookup.get(span["service"]):
+                    span["service"] = service_lookup[span["service"]]
+                meta.update(tag_map)
+                if service_lookup.get(span["service"]) and meta.get("service"):
+                    meta["service"] = service_lookup[span["service"]]
+
+
+def aggregate_trace_payloads_by_env(trace_payloads):
+    """Returns the traces of all the payloads, {env: traces}"""
+    traces_by_env = {}
+    for trace_payload in trace_payloads:
+        traces_by_env.setdefault(trace_payload["env"], []).extend(
+            trace_payload["traces"]
+        )
+    return traces_by_env
+
+
+def encode_trace_payload(env, traces):
+    """Encode a pb.TracePayload, the hostname being always empty"""
+    trace_payload = TracePayload(env=env)
+    for trace in traces:
+        api_trace = trace_payload.traces.add(
+            traceID=trace["trace_id"],
+            startTime=trace["start_time"],
+            endTime=trace["end_time"],
+        )
+        for span in trace["spans"]:
+            api_trace.spans.add(
+                service=span["service"],
+                name=span["name"],
+                resource=span["resource"],
+                traceID=span["trace_id"],
+                spanID=span["span_id"],
+                parentID=span["parent_id"],
+                start=span["start"],
+                duration=span["duration"],
+                error=span["error"],
+                meta=span["meta"],
+                metrics=span["metrics"],
+                type=span["type"],
+            )
+    return trace_payload.SerializeToString()
+
+
+def decode_apm_id(apm_id):
+    """Returns the integer of a hex span or trace id, keeping its last 64 bits"""
+    try:
+        return int(str(apm_id)[-16:], 16)
+    except ValueError:
+        return 0
+
+
+def _convert_span(raw_span):
+    return {
+        "service": raw_span.get("service") or "",
+        "name": raw_span.get("name") or "",
+        "resource": raw_span.get("resource") or "",
+        "trace_id": decode_apm_id(raw_span.get("trace_id", "")),
+        "span_id": decode_apm_id(raw_span.get("span_id", "")),
+        "parent_id": decode_apm_id(raw_span.get("parent_id", "")),
+        "start": int(raw_span.get("start") or 0),
+        "duration": int(raw_span.get("duration") or 0),
+        "error": int(raw_span.get("error") or 0),
+        "meta": {
+            key: str(value) for key, value in (raw_span.get("meta") or {}).items()
+        },
+        "metrics": {
+            key: float(value) for key, value in (raw_span.get("metrics") or {}).items()
+        },
+        "type": raw_span.get("type") or "",
+    }
+
+
+def _add_to_api_trace(api_trace, span):
+    api_trace["spans"].append(span)
+    api_trace["end_time"] = max(api_trace["end_time"], span["start"] + span["duration"])
+    if api_trace["start_time"] == 0 or api_trace["start_time"] > span["start"]:
+        api_trace["start_time"] = span["start"]
+
+
+def _build_service_lookup(trace_payloads, service):
+    """Returns the Lambda function services to remap to the given service"""
+    spans = [
+        span
+        for trace_payload in trace_payloads
+        for trace in trace_payload["traces"]
+        for span in trace["spans"]
+    ]
+    remapped_services = {}
+    for span in spans:
+        if span["name"] == "aws.lambda" or span["service"] == "aws.lambda":
+            remapped_services[span["service"]] = service
+    for span in spans:
+        for remapped in list(remapped_services):
+            if span["service"].startswith(remapped) and span["service"] != remapped:
+                remapped_services[span["service"]] = span["service"].replace(
+                    remapped, service, 1
+                )
+    return remapped_services
+
+
+def _compute_top_level(spans):
+    """Mark the root spans, and the spans whose parent is in another service"""
+    services = {span["span_id"]: span["service"] for span in spans}
+    for span in spans:
+        parent_service = services.get(span["parent_id"])
+        if span["parent_id"] == 0 or parent_service != span["service"]:
+            span["metrics"][TOP_LEVEL_KEY] = 1.0
+        else:
+            span["metrics"].pop(TOP_LEVEL_KEY, None)